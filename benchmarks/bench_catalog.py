@@ -0,0 +1,94 @@
+# benchmarks/bench_catalog.py
+#
+# Builds an offline catalog from synthetic allDatasets tables (N datasets per server),
+# then times an incremental refresh (1% of rows changed) and keyword/bbox/time searches.
+# Parsing the table is included; downloading it is not.
+#
+#   python benchmarks/bench_catalog.py --datasets 10000 50000 --servers 3
+
+import os
+import sys
+import time
+import random
+import argparse
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from erddap_nb.catalog import Catalog, ALL_DATASETS_COLUMNS, parse_listing
+
+WORDS = ['sea', 'surface', 'temperature', 'salinity', 'chlorophyll', 'wind', 'wave', 'current', 'glider',
+         'buoy', 'ctd', 'satellite', 'daily', 'monthly', 'composite', 'model', 'forecast', 'nitrate', 'oxygen']
+INSTITUTIONS = ['NOAA', 'NASA', 'IOOS', 'MBARI', 'Scripps', 'CSIRO', 'IFREMER']
+
+def make_listing(n_datasets, seed=0):
+    """An allDatasets table as Catalog.fetch_listing reads it: every column as text."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_datasets):
+        min_lon = rng.uniform(-180, 170)
+        min_lat = rng.uniform(-90, 80)
+        start = pd.Timestamp(rng.uniform(0, 1.6e9), unit='s')
+        grid = rng.random() < 0.5
+        rows.append({
+            'datasetID': f"ds{i:06d}",
+            'title': ' '.join(rng.choice(WORDS) for _ in range(5)).title(),
+            'institution': rng.choice(INSTITUTIONS),
+            'summary': ' '.join(rng.choice(WORDS) for _ in range(40)),
+            'griddap': f"http://server/erddap/griddap/ds{i:06d}" if grid else '',
+            'tabledap': '' if grid else f"http://server/erddap/tabledap/ds{i:06d}",
+            'minLongitude': f"{min_lon:.4f}", 'maxLongitude': f"{min_lon + rng.uniform(0.1, 10):.4f}",
+            'minLatitude': f"{min_lat:.4f}", 'maxLatitude': f"{min_lat + rng.uniform(0.1, 10):.4f}",
+            'minTime': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'maxTime': (start + pd.Timedelta(days=rng.uniform(1, 3000))).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        })
+    return pd.DataFrame(rows, columns=ALL_DATASETS_COLUMNS)
+
+def best_of(repeat, func, *args, **kwargs):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        runs.append(time.perf_counter() - start)
+    return min(runs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the offline dataset catalog.")
+    parser.add_argument('--datasets', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--servers', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    searches = {
+        'keyword': dict(query='sea temperature'),
+        'phrase + NOT': dict(query='"sea surface" -model'),
+        'keyword + bbox': dict(query='temperature', min_lon=-130, max_lon=-110, min_lat=20, max_lat=50),
+        'keyword + time': dict(query='glider', min_time='2010-01-01', max_time='2011-01-01'),
+    }
+    for n_datasets in args.datasets:
+        catalog = Catalog()
+        listings = {f"http://server{i}/erddap": make_listing(n_datasets, seed=i) for i in range(args.servers)}
+        start = time.perf_counter()
+        for server, listing in listings.items():
+            catalog.apply_listing(server, parse_listing(listing))
+        build = time.perf_counter() - start
+
+        # 1% of the titles change between refreshes.
+        server, listing = next(iter(listings.items()))
+        listing.loc[::100, 'title'] += ' v2'
+        start = time.perf_counter()
+        counts, _ = catalog.apply_listing(server, parse_listing(listing))
+        incremental = time.perf_counter() - start
+
+        print(f"{n_datasets} datasets x {args.servers} servers: build {build:.2f} s, "
+              f"incremental refresh {incremental * 1000:.0f} ms ({counts['updated']} updated)")
+        for label, search in searches.items():
+            one = best_of(args.repeat, catalog.search, server, page=1, items_per_page=10, **search)
+            every = best_of(args.repeat, catalog.search, None, page=1, items_per_page=10, **search)
+            total = catalog.count(None, **search)
+            print(f"    {label:<16} one server {one * 1000:7.2f} ms   all servers {every * 1000:7.2f} ms   ({total} matches)")
+        catalog.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# benchmarks/bench_import.py
+#
+# Measures how long `import erddap_nb` and creating the notebook interface take,
+# each in a fresh interpreter run with `python -X importtime`, and lists the
+# heaviest modules they load. The exit status is 1 when a step loads one of the
+# libraries that must stay lazy (pandas, xarray, netCDF4, pyarrow, erddapy, ...)
+# or, given a baseline, is slower than the tolerance.
+#
+#   python benchmarks/bench_import.py --output import.json
+#   python benchmarks/bench_import.py --baseline import.json --tolerance 0.25
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# Libraries only needed once data is fetched, parsed or plotted.
+HEAVY = ('pandas', 'numpy', 'pyarrow', 'xarray', 'netCDF4', 'erddapy', 'dask', 'zarr')
+
+# Statement timed by each case; none of them may load a HEAVY library.
+CASES = {
+    'import': "import erddap_nb",
+    'import_client': "from erddap_nb import Client",
+    'interface': (
+        # The preset server list is loaded on a background thread that imports erddapy
+        # (and with it pandas) on purpose; it is left out so the check measures what
+        # the interface itself waits for.
+        "import erddap_nb.main\n"
+        "erddap_nb.main.load_server_list = dict\n"
+        "erddap_nb.main.create_data_access_interface(cache_dir=False)"
+    ),
+}
+
+CHILD = """
+import sys, time, json, io, contextlib
+sys.stderr.write('\\n#bench-start\\n'); sys.stderr.flush()
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+{statement}
+seconds = time.perf_counter() - start
+sys.stderr.write('\\n#bench-end\\n'); sys.stderr.flush()
+print(json.dumps({{'seconds': seconds, 'modules': sorted(m for m in sys.modules if m.split('.')[0] in {heavy!r})}}))
+sys.stdout.flush()
+import os; os._exit(0) # do not wait for daemon threads
+"""
+
+IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def run_child(statement):
+    """Runs one case in a fresh interpreter; returns its result and importtime lines (name, cumulative us, depth)."""
+    indented = '\n'.join('    ' + line for line in statement.splitlines())
+    code = CHILD.format(statement=indented, heavy=set(HEAVY))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    stderr = proc.stderr.split('#bench-start', 1)[-1].split('#bench-end', 1)[0]
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match:
+            imports.append((match.group(4), int(match.group(2)), len(match.group(3)) // 2))
+    return result, imports
+
+def run_case(statement, repeat):
+    runs = []
+    for _ in range(repeat):
+        result, imports = run_child(statement)
+        runs.append(result['seconds'])
+    top = sorted((i for i in imports if i[2] == 0), key=lambda i: -i[1])[:8]
+    return {'seconds': min(runs), 'runs': runs, 'heavy_modules': sorted({m.split('.')[0] for m in result['modules']}),
+            'top_imports': [{'module': name, 'ms': us / 1000} for name, us, _ in top]}
+
+def compare(results, baseline, tolerance):
+    """Prints current vs. baseline times; returns the names of cases that regressed."""
+    regressed = []
+    print(f"\n{'case':<16} {'baseline (ms)':>14} {'now (ms)':>10} {'ratio':>7}")
+    for name, result in results['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            print(f"{name:<16} {'-':>14} {result['seconds'] * 1000:>10.1f}")
+            continue
+        ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressed.append(name)
+            flag = '  slower'
+        print(f"{name:<16} {before['seconds'] * 1000:>14.1f} {result['seconds'] * 1000:>10.1f} {ratio:>6.2f}x{flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Import and interface start-up times of erddap_nb.")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), help="Run only these cases (default: all).")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per case; the fastest run counts.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--baseline', help="Compare with the results stored in this JSON file.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown against the baseline (0.25 = 25%%).")
+    args = parser.parse_args()
+
+    results = {'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'python': platform.python_version(),
+               'platform': platform.platform(), 'results': {}}
+    failed = []
+    print(f"{'case':<16} {'best (ms)':>10}  heavy modules loaded / largest imports")
+    for name, statement in CASES.items():
+        if args.cases and name not in args.cases:
+            continue
+        result = run_case(statement, args.repeat)
+        results['results'][name] = result
+        if result['heavy_modules']:
+            failed.append(f"{name} loads {', '.join(result['heavy_modules'])}")
+        top = ', '.join(f"{i['module']} {i['ms']:.0f}ms" for i in result['top_imports'][:4])
+        print(f"{name:<16} {result['seconds'] * 1000:>10.1f}  {', '.join(result['heavy_modules']) or '-'} / {top}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"\nResults written to {args.output}")
+    regressed = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressed = compare(results, json.load(f), args.tolerance)
+        if regressed:
+            print(f"\n{len(regressed)} case(s) slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressed)}")
+    for message in failed:
+        print(f"\nEager import: {message}")
+    if failed or regressed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/bench_info_parser.py
+#
+# Compares the single-pass info.csv parser against the previous per-variable
+# boolean-mask implementation on synthetic metadata of increasing size.
+#
+#   python benchmarks/bench_info_parser.py --sizes 10 100 1000 5000
+
+import io
+import os
+import re
+import sys
+import time
+import argparse
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from erddap_nb.erddap_utils import parse_info_csv, parse_info_df
+from synthetic import make_info_csv
+
+def legacy_parse_info_df(info_df):
+    """The O(rows x variables) parser this benchmark measures against."""
+    global_attrs_df = info_df[info_df["Variable Name"] == "NC_GLOBAL"]
+    global_attrs = dict(zip(global_attrs_df["Attribute Name"], global_attrs_df["Value"]))
+    cdm_type = global_attrs.get("cdm_data_type", "").lower()
+    protocol = 'griddap' if cdm_type == 'grid' else 'tabledap'
+
+    dims_df = info_df[info_df["Row Type"] == "dimension"]
+    dimension_names = list(dims_df["Variable Name"].unique())
+    dimensions = []
+    for dim_name in dimension_names:
+        dim_attrs_df = info_df[(info_df["Variable Name"] == dim_name) & (info_df["Row Type"] == "attribute")]
+        dim_attrs = dict(zip(dim_attrs_df["Attribute Name"], dim_attrs_df["Value"]))
+        spacing = "N/A"
+        dim_row = dims_df[dims_df["Variable Name"] == dim_name].iloc[0]
+        val_str = dim_row.get("Value", "")
+        if "averageSpacing" in val_str:
+            match = re.search(r"averageSpacing=([^,]+)", val_str)
+            if match:
+                spacing = match.group(1).strip()
+        dimensions.append({
+            'name': dim_name, 'type': dim_attrs.get('type', 'string').lower(),
+            'actual_range': dim_attrs.get("actual_range", "N/A"), 'average_spacing': spacing,
+            'units': dim_attrs.get("units"), 'long_name': dim_attrs.get("long_name")
+        })
+
+    vars_df = info_df[info_df["Row Type"] == "variable"]
+    data_variables = []
+    for var_name in vars_df["Variable Name"].unique():
+        if var_name in dimension_names: continue
+        var_attrs_df = info_df[(info_df["Variable Name"] == var_name) & (info_df["Row Type"] == "attribute")]
+        var_attrs = dict(zip(var_attrs_df["Attribute Name"], var_attrs_df["Value"]))
+        data_variables.append({
+            'name': var_name, 'type': var_attrs.get('type', 'string').lower(),
+            'actual_range': var_attrs.get("actual_range", "N/A"),
+            'units': var_attrs.get("units"), 'long_name': var_attrs.get("long_name")
+        })
+
+    all_variables_map = {v['name']: v for v in data_variables + dimensions}
+    return {
+        "protocol": protocol, "data_variables": data_variables, "dimensions": dimensions,
+        "all_variables_map": all_variables_map, "global_attrs": global_attrs
+    }
+
+def legacy_view(metadata):
+    """
+    Projects parser output onto the fields the legacy parser produced. The legacy
+    parser always reported type 'string' and did not record nValues.
+    """
+    def strip(entry):
+        return {k: ('string' if k == 'type' else v) for k, v in entry.items() if k != 'n_values'}
+    data_variables = [strip(v) for v in metadata['data_variables']]
+    dimensions = [strip(d) for d in metadata['dimensions']]
+    return {
+        **metadata, "data_variables": data_variables, "dimensions": dimensions,
+        "all_variables_map": {v['name']: v for v in data_variables + dimensions}
+    }
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the info.csv parser.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500, 1000, 2500])
+    parser.add_argument('--attrs', type=int, default=10, help="extra attributes per variable")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'variables':>10} {'rows':>8} {'legacy (s)':>12} {'single-pass (s)':>16} {'read_csv (s)':>13} {'speedup':>8}")
+    for n_vars in args.sizes:
+        body = make_info_csv(n_vars=n_vars, attrs_per_var=args.attrs)
+        info_df = pd.read_csv(io.StringIO(body))
+
+        assert legacy_view(parse_info_df(info_df)) == legacy_parse_info_df(info_df), "parsers disagree"
+
+        legacy = best_of(lambda: legacy_parse_info_df(info_df), args.repeat)
+        single = best_of(lambda: parse_info_df(info_df), args.repeat)
+        full = best_of(lambda: parse_info_csv(body), args.repeat)
+        print(f"{n_vars:>10} {len(info_df):>8} {legacy:>12.4f} {single:>16.4f} {full:>13.4f} {legacy / single:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/bench_local_plot.py
+#
+# Times the local plotting engine on synthetic point data with N rows, for each
+# graph type, and on a gridded field for the surface graph. Rows arrive as they do
+# from a .csvp download: a text time column plus numeric columns.
+#
+#   python benchmarks/bench_local_plot.py --sizes 100000 1000000 5000000
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from erddap_nb import plotting
+
+def make_table(n_rows, n_times=200000):
+    times = pd.date_range('2020-01-01', periods=min(n_rows, n_times), freq='min').strftime('%Y-%m-%dT%H:%M:%SZ')
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'time (UTC)': np.resize(np.asarray(times), n_rows),
+        'sea_water_temperature (degree_C)': 15 + 5 * np.sin(np.arange(n_rows) / 1e4) + rng.normal(0, 0.5, n_rows),
+        'salinity (PSU)': rng.normal(35, 1, n_rows),
+    })
+
+def make_grid(n_lat, n_lon):
+    rng = np.random.default_rng(0)
+    return xr.Dataset(
+        {'sst': (('time', 'latitude', 'longitude'), rng.random((1, n_lat, n_lon), dtype=np.float32))},
+        coords={'time': pd.date_range('2020-01-01', periods=1), 'latitude': np.linspace(89.875, -89.875, n_lat),
+                'longitude': np.linspace(0.125, 359.875, n_lon)}
+    )
+
+def best_of(repeat, func, *args, **kwargs):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        runs.append(time.perf_counter() - start)
+    return min(runs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local graph rendering.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000, 5000000])
+    parser.add_argument('--grid', type=int, nargs=2, default=[720, 1440], metavar=('LAT', 'LON'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    kinds = ['lines', 'markers', 'linesAndMarkers']
+    print(f"{'rows':>10} " + " ".join(f"{kind + ' (s)':>20}" for kind in kinds) + f" {'markers+color (s)':>18}")
+    for n_rows in args.sizes:
+        df = make_table(n_rows)
+        timings = [best_of(args.repeat, plotting.render, df, 'time', 'sea_water_temperature', kind=kind) for kind in kinds]
+        colored = best_of(args.repeat, plotting.render, df, 'time', 'sea_water_temperature', 'salinity', kind='markers')
+        print(f"{n_rows:>10} " + " ".join(f"{t:>20.3f}" for t in timings) + f" {colored:>18.3f}")
+
+    ds = make_grid(*args.grid)
+    surface = best_of(args.repeat, plotting.render, ds, 'longitude', 'latitude', 'sst', kind='surface')
+    print(f"surface {args.grid[0]}x{args.grid[1]}: {surface:.3f} s")
+
+if __name__ == '__main__':
+    main()
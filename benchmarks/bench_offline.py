@@ -0,0 +1,197 @@
+# benchmarks/bench_offline.py
+#
+# Times the package's real request paths end to end against a local stand-in ERDDAP
+# server (see standin.py): metadata, search and counts, the griddap and tabledap
+# download handlers and both graph handlers, driven through the notebook UI. No
+# public server is contacted. Results are written as JSON and can be compared with
+# a stored baseline; the exit status is 1 when a case is slower than the tolerance.
+#
+#   python benchmarks/bench_offline.py --output results.json
+#   python benchmarks/bench_offline.py --baseline results.json --tolerance 0.25
+#   python benchmarks/bench_offline.py --latency 0.05 --cases search count
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tempfile
+import contextlib
+
+import ipywidgets as widgets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from erddap_nb import erddap_utils
+from erddap_nb.ui_builder import build_griddap_ui, build_tabledap_ui
+from standin import StandInServer, GRID_ID, TABLE_ID
+
+TIMEOUT = 300 # seconds one handler run may take before the case fails
+
+def find_button(ui, description):
+    stack = [ui]
+    while stack:
+        widget = stack.pop()
+        if isinstance(widget, widgets.Button) and widget.description == description:
+            return widget
+        stack.extend(getattr(widget, 'children', ()))
+    raise LookupError(f"No '{description}' button in the UI.")
+
+class DatasetUI:
+    """A dataset explorer built as the notebook builds it, with its handlers' widget dict."""
+
+    def __init__(self, server, dataset_id, data_dir):
+        self.metadata = erddap_utils.get_dataset_metadata(server, dataset_id)
+        self.app_state = {'dataframes': {}, 'metadata': self.metadata, 'data_dir': data_dir}
+        self.output = widgets.Output()
+        build = build_griddap_ui if self.metadata['protocol'] == 'griddap' else build_tabledap_ui
+        self.ui = build(metadata=self.metadata, server=server, dataset_id=dataset_id, output_area=self.output,
+                        app_state=self.app_state, saved_dfs_placeholder=widgets.VBox())
+        self.download_button = find_button(self.ui, 'Download Data')
+        self.graph_button = find_button(self.ui, 'Update Graph')
+        # Every handler is a partial bound to the same widget dict.
+        self.w = self.download_button._click_handlers.callbacks[0].args[0]
+
+    def output_text(self):
+        return ''.join(o.get('text', '') for o in self.output.outputs)
+
+    def select(self, names):
+        if self.metadata['protocol'] == 'griddap':
+            for name, checkbox in self.w['data_var_checkboxes'].items():
+                checkbox.value = name in names
+        else:
+            for name, controls in self.w['constraint_widgets'].items():
+                controls['select'].value = name in names
+
+    def download(self, response):
+        """Clicks Download Data and waits for the queued job to finish."""
+        self.w['filetype_dd'].value = response
+        self.w['df_name_input'].value = f"bench_{response}"
+        with contextlib.redirect_stdout(io.StringIO()) as printed: # outside a kernel, Output does not capture prints
+            self.download_button.click()
+        queue = self.app_state.get('download_queue')
+        if queue is None or not queue.jobs:
+            raise RuntimeError(printed.getvalue() or "No download was queued.")
+        job = queue.jobs[-1]
+        job.future.result(timeout=TIMEOUT)
+        if job.state != 'done':
+            raise RuntimeError(f"Download {job.state}: {job.error}")
+        queue.clear_finished()
+        return job.bytes_received
+
+    def graph(self, x, y, color=None):
+        """Clicks Update Graph and waits for the image to be shown."""
+        self.w['x_axis'].value, self.w['y_axis'].value, self.w['color_var'].value = x, y, color
+        self.w['graph_display'].value = b''
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.graph_button.click()
+        end = time.monotonic() + TIMEOUT
+        while not self.w['graph_display'].value:
+            if 'Failed' in self.output_text() or time.monotonic() > end:
+                raise RuntimeError(self.output_text() or "The graph was not rendered.")
+            time.sleep(0.001)
+        return len(self.w['graph_display'].value)
+
+def make_cases(server, data_dir):
+    """Benchmark name -> callable running one measured operation."""
+    url = server.url
+    grid = DatasetUI(url, GRID_ID, data_dir)
+    grid.select(server.data_vars[:1])
+    table = DatasetUI(url, TABLE_ID, data_dir)
+    table.select(['time', 'station'] + server.data_vars)
+    var = server.data_vars[0]
+    return {
+        'metadata': lambda: erddap_utils.get_dataset_metadata(url, 'bench_wide'),
+        'search': lambda: erddap_utils.search_datasets(url, 'stand-in', items_per_page=100),
+        'count': lambda: erddap_utils.get_total_count(url, 'stand-in'),
+        'count_filtered': lambda: erddap_utils.get_total_count(url, 'stand-in', min_lon=0),
+        'griddap_download_nc': lambda: grid.download('nc'),
+        'griddap_download_csv': lambda: grid.download('csv'),
+        'tabledap_download_csv': lambda: table.download('csv'),
+        'tabledap_download_parquet': lambda: table.download('parquet'),
+        'tabledap_download_nc': lambda: table.download('nc'),
+        'griddap_graph': lambda: grid.graph('longitude', 'latitude', var),
+        'tabledap_graph': lambda: table.graph('time', var),
+    }
+
+def run_case(func, repeat):
+    func() # warm-up: the stand-in builds and caches its response bodies
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {'seconds': min(runs), 'median': statistics.median(runs), 'runs': runs}
+
+def compare(results, baseline, tolerance):
+    """Prints current vs. baseline times; returns the names of cases that regressed."""
+    regressed = []
+    print(f"\n{'case':<28} {'baseline (ms)':>14} {'now (ms)':>10} {'ratio':>7}")
+    for name, result in results['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            print(f"{name:<28} {'-':>14} {result['seconds'] * 1000:>10.1f}")
+            continue
+        ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressed.append(name)
+            flag = '  slower'
+        print(f"{name:<28} {before['seconds'] * 1000:>14.1f} {result['seconds'] * 1000:>10.1f} {ratio:>6.2f}x{flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks against a local stand-in ERDDAP server.")
+    parser.add_argument('--cases', nargs='+', help="Run only these cases (default: all).")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds the stand-in waits before every response.")
+    parser.add_argument('--grid', type=int, nargs=3, default=[10, 180, 360], metavar=('TIME', 'LAT', 'LON'))
+    parser.add_argument('--table-rows', type=int, default=100000)
+    parser.add_argument('--vars', type=int, default=3, help="Data variables of the grid and table datasets.")
+    parser.add_argument('--info-vars', type=int, default=500, help="Variables of the dataset timed by 'metadata'.")
+    parser.add_argument('--search-results', type=int, default=500)
+    parser.add_argument('--image', type=int, nargs=2, default=[800, 600], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--baseline', help="Compare with the results stored in this JSON file.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown against the baseline (0.25 = 25%%).")
+    args = parser.parse_args()
+
+    # The download and graph handlers write to widgets.Output, which needs an IPython shell.
+    from IPython.core.interactiveshell import InteractiveShell
+    InteractiveShell.instance()
+
+    config = {key: value for key, value in vars(args).items() if key not in ('cases', 'output', 'baseline', 'tolerance')}
+    results = {'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'python': platform.python_version(),
+               'platform': platform.platform(), 'config': config, 'results': {}}
+    server = StandInServer(grid_shape=args.grid, table_rows=args.table_rows, n_vars=args.vars, info_vars=args.info_vars,
+                           search_results=args.search_results, image_size=args.image, latency=args.latency)
+    with server, tempfile.TemporaryDirectory(prefix='erddap_nb_bench_') as data_dir:
+        cases = make_cases(server, data_dir)
+        unknown = set(args.cases or ()) - set(cases)
+        if unknown:
+            parser.error(f"unknown cases: {', '.join(sorted(unknown))} (choose from {', '.join(cases)})")
+        print(f"{'case':<28} {'best (ms)':>10} {'median (ms)':>12}")
+        for name, func in cases.items():
+            if args.cases and name not in args.cases:
+                continue
+            result = run_case(func, args.repeat)
+            results['results'][name] = result
+            print(f"{name:<28} {result['seconds'] * 1000:>10.1f} {result['median'] * 1000:>12.1f}")
+        results['server'] = dict(server.stats)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressed = compare(results, json.load(f), args.tolerance)
+        if regressed:
+            print(f"\n{len(regressed)} case(s) slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressed)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
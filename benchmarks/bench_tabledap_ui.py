@@ -0,0 +1,55 @@
+# benchmarks/bench_tabledap_ui.py
+#
+# Times build_tabledap_ui on synthetic metadata with N variables, building every
+# variable row eagerly versus the paged variable browser used for wide datasets.
+# Also reports how many widgets (i.e. comm messages to the browser) each creates.
+#
+#   python benchmarks/bench_tabledap_ui.py --sizes 10 100 300 1000
+
+import os
+import sys
+import time
+import argparse
+
+import ipywidgets as widgets
+from ipywidgets.widgets import widget as widget_module
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from erddap_nb.erddap_utils import parse_info_csv
+from erddap_nb.ui_builder import build_tabledap_ui, VARIABLE_PAGE_SIZE
+from synthetic import make_info_csv
+
+def build(metadata, page_size):
+    """Builds the UI once; returns (seconds, widgets created)."""
+    widgets.Widget.close_all()
+    before = len(widget_module._instances)
+    start = time.perf_counter()
+    build_tabledap_ui(
+        metadata, server='http://localhost/erddap', dataset_id='synthetic', output_area=widgets.Output(),
+        app_state={'dataframes': {}}, saved_dfs_placeholder=widgets.VBox(), page_size=page_size
+    )
+    elapsed = time.perf_counter() - start
+    return elapsed, len(widget_module._instances) - before
+
+def best_of(metadata, page_size, repeat):
+    runs = [build(metadata, page_size) for _ in range(repeat)]
+    return min(seconds for seconds, _ in runs), runs[0][1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark building the tabledap explorer UI.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 100, 300, 1000])
+    parser.add_argument('--page-size', type=int, default=VARIABLE_PAGE_SIZE)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'variables':>10} {'eager (s)':>10} {'widgets':>8} {'paged (s)':>10} {'widgets':>8} {'speedup':>8}")
+    for n_vars in args.sizes:
+        metadata = parse_info_csv(make_info_csv(n_vars=n_vars, attrs_per_var=2))
+        n_total = len(metadata['all_variables_map'])
+        eager, eager_widgets = best_of(metadata, n_total, args.repeat)
+        paged, paged_widgets = best_of(metadata, args.page_size, args.repeat)
+        print(f"{n_total:>10} {eager:>10.3f} {eager_widgets:>8} {paged:>10.3f} {paged_widgets:>8} {eager / paged:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
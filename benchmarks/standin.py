@@ -0,0 +1,345 @@
+# benchmarks/standin.py
+#
+# A local stand-in for an ERDDAP server, so benchmarks can time the package's real
+# request paths without touching public servers. It serves synthetic info.csv,
+# search (advanced.csv and OpenSearch), griddap/tabledap data (csv, csvp, parquet,
+# nc/ncCF) and .png graph responses, of configurable sizes, after a configurable
+# latency. Bodies are built on first request and then served from memory, so after
+# a warm-up run the timings measure the client, not the stand-in.
+
+import io
+import re
+import os
+import csv
+import json
+import time
+import zlib
+import struct
+import tempfile
+import threading
+import http.server
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs, unquote
+
+import numpy as np
+import pandas as pd
+
+from synthetic import INFO_COLUMNS, make_info_csv
+
+GRID_ID = 'bench_grid'
+TABLE_ID = 'bench_table'
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+START = pd.Timestamp('2020-01-01', tz='UTC')
+NOT_FOUND = b'Error {\n    code=404;\n    message="Not Found: Your query produced no matching results.";\n}\n'
+
+def _csv_text(rows):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
+
+def make_png(width, height):
+    """A valid grayscale PNG of the given size (noise, so it does not compress away)."""
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (height, width), dtype=np.uint8)
+    raw = b''.join(b'\x00' + row.tobytes() for row in pixels)
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b'')
+
+class StandInServer:
+    """
+    Serves synthetic ERDDAP responses on 127.0.0.1 (port 0 picks a free one).
+
+    Datasets: `bench_grid` (griddap, `grid_shape` time x latitude x longitude, one day
+    apart from 2020-01-01, with `n_vars` float variables), `bench_table` (tabledap,
+    `table_rows` rows ten minutes apart) and any other ID, answered with the info.csv
+    of a wide tabledap dataset with `info_vars` variables. Searches match
+    `search_results` datasets. Every response is delayed by `latency` seconds.
+    """
+
+    def __init__(self, grid_shape=(30, 180, 360), table_rows=100000, n_vars=3, info_vars=500,
+                 search_results=500, image_size=(800, 600), latency=0.0, port=0, max_cached=16):
+        self.grid_shape = tuple(grid_shape)
+        self.table_rows = table_rows
+        self.n_vars = n_vars
+        self.info_vars = info_vars
+        self.search_results = search_results
+        self.image_size = tuple(image_size)
+        self.latency = latency
+        self.port = port
+        self.max_cached = max_cached
+        self.stats = {'requests': 0, 'bytes_sent': 0, 'built': 0}
+        self._bodies = OrderedDict() # request path -> (status, body)
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._table = None
+        self.data_vars = [f"var_{i}" for i in range(n_vars)]
+        n_time, n_lat, n_lon = self.grid_shape
+        self.axes = {
+            'time': (START + pd.to_timedelta(np.arange(n_time), unit='D')).tz_localize(None).values,
+            'latitude': np.linspace(-90 + 90 / n_lat, 90 - 90 / n_lat, n_lat),
+            'longitude': np.linspace(180 / n_lon, 360 - 180 / n_lon, n_lon),
+        }
+
+    # --- Lifecycle ---
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/erddap"
+
+    def start(self):
+        server = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True # headers and body go out in separate writes
+            def log_message(self, *args):
+                pass
+            def do_GET(self):
+                server._handle(self)
+        self._httpd = http.server.ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name='standin_erddap', daemon=True).start()
+        return self
+
+    def close(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Request handling ---
+    def _handle(self, handler):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            cached = self._bodies.get(handler.path)
+            if cached is not None:
+                self._bodies.move_to_end(handler.path)
+        if cached is None:
+            try:
+                cached = self._build(handler.path)
+            except Exception as err:
+                cached = (500, f"Error {{\n    code=500;\n    message=\"{err}\";\n}}\n".encode())
+            with self._lock:
+                self.stats['built'] += 1
+                self._bodies[handler.path] = cached
+                while len(self._bodies) > self.max_cached:
+                    self._bodies.popitem(last=False)
+        status, body = cached
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_sent'] += len(body)
+        handler.send_response(status)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _build(self, path):
+        url = urlparse(path)
+        parts = url.path.split('/')
+        if url.path.endswith('/index.csv') and '/info/' in url.path:
+            return 200, self.info_csv(parts[-2]).encode()
+        if url.path.endswith('/search/advanced.csv'):
+            return self.search_page(parse_qs(url.query))
+        if url.path.endswith('/opensearch1.1/search'):
+            return 200, (f'<?xml version="1.0"?><rss xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"><channel>'
+                         f'<opensearch:totalResults>{self.search_results}</opensearch:totalResults></channel></rss>').encode()
+        match = re.search(r'/(griddap|tabledap)/(\w+)\.(\w+)$', url.path)
+        if match:
+            protocol, dataset_id, extension = match.groups()
+            query = unquote(url.query)
+            if extension == 'png':
+                return 200, make_png(*self.image_size)
+            if protocol == 'griddap' and dataset_id == GRID_ID:
+                return self.griddap(query, extension)
+            if protocol == 'tabledap' and dataset_id == TABLE_ID:
+                return self.tabledap(query, extension)
+        return 404, b'Error {\n    code=404;\n    message="Not Found";\n}\n'
+
+    # --- Metadata and search ---
+    def info_csv(self, dataset_id):
+        global_rows = [["attribute", "NC_GLOBAL", "title", "String", f"Stand-in {dataset_id}"]]
+        if dataset_id == GRID_ID:
+            times = self.axes['time']
+            global_rows += [
+                ["attribute", "NC_GLOBAL", "cdm_data_type", "String", "Grid"],
+                ["attribute", "NC_GLOBAL", "time_coverage_start", "String", pd.Timestamp(times[0]).strftime(TIME_FORMAT)],
+                ["attribute", "NC_GLOBAL", "time_coverage_end", "String", pd.Timestamp(times[-1]).strftime(TIME_FORMAT)],
+            ]
+            rows = []
+            for name, values in self.axes.items():
+                if name == 'time':
+                    spacing, value_range, units = "1 day", f"{pd.Timestamp(values[0]).timestamp()}, {pd.Timestamp(values[-1]).timestamp()}", "seconds since 1970-01-01T00:00:00Z"
+                else:
+                    spacing, value_range, units = f"{values[1] - values[0]}", f"{values[0]}, {values[-1]}", f"degrees_{'north' if name == 'latitude' else 'east'}"
+                rows.append(["dimension", name, "", "double", f"nValues={len(values)}, evenlySpaced=true, averageSpacing={spacing}"])
+                rows.append(["attribute", name, "actual_range", "double", value_range])
+                rows.append(["attribute", name, "units", "String", units])
+            for name in self.data_vars:
+                rows.append(["variable", name, "", "float", "time, latitude, longitude"])
+                rows.append(["attribute", name, "actual_range", "float", "-3.0, 3.0"])
+                rows.append(["attribute", name, "units", "String", "degree_C"])
+            return _csv_text([INFO_COLUMNS] + global_rows + rows)
+        if dataset_id == TABLE_ID:
+            table = self.table()
+            global_rows += [
+                ["attribute", "NC_GLOBAL", "cdm_data_type", "String", "TimeSeries"],
+                ["attribute", "NC_GLOBAL", "time_coverage_start", "String", table['time'].iloc[0]],
+                ["attribute", "NC_GLOBAL", "time_coverage_end", "String", table['time'].iloc[-1]],
+            ]
+            first, last = (pd.Timestamp(table['time'].iloc[i]).timestamp() for i in (0, -1))
+            rows = [["variable", "time", "", "double", ""], ["attribute", "time", "actual_range", "double", f"{first}, {last}"],
+                    ["attribute", "time", "units", "String", "seconds since 1970-01-01T00:00:00Z"],
+                    ["variable", "station", "", "String", ""]]
+            for name in self.data_vars:
+                rows.append(["variable", name, "", "float", ""])
+                rows.append(["attribute", name, "actual_range", "float", "-3.0, 3.0"])
+                rows.append(["attribute", name, "units", "String", "degree_C"])
+            return _csv_text([INFO_COLUMNS] + global_rows + rows)
+        return make_info_csv(n_vars=self.info_vars, attrs_per_var=8)
+
+    def search_page(self, params):
+        page = int(params.get('page', ['1'])[0])
+        items_per_page = int(params.get('itemsPerPage', ['1000'])[0])
+        first = (page - 1) * items_per_page
+        ids = range(first, min(first + items_per_page, self.search_results))
+        if not ids:
+            return 404, NOT_FOUND
+        columns = ["griddap", "Subset", "tabledap", "Make A Graph", "wms", "files", "Title", "Summary", "FGDC",
+                   "ISO 19115", "Info", "Background Info", "RSS", "Email", "Institution", "Dataset ID"]
+        rows = [[f"http://stand-in/erddap/griddap/ds{i}", "", "", "", "", "", f"Stand-in dataset {i}", "Synthetic.",
+                 "", "", "", "", "", "", "Stand-in", f"ds{i}"] for i in ids]
+        return 200, _csv_text([columns] + rows).encode()
+
+    # --- Data ---
+    def _select(self, name, start, stride, stop):
+        values = self.axes[name]
+        if name == 'time':
+            def parse(text):
+                try:
+                    return np.datetime64(pd.Timestamp(float(text), unit='s'))
+                except ValueError:
+                    return np.datetime64(pd.Timestamp(text).tz_localize(None))
+            low, high = parse(start), parse(stop)
+        else:
+            low, high = float(start), float(stop)
+            tolerance = 1e-6 * max(1.0, abs(low), abs(high))
+            low, high = low - tolerance, high + tolerance
+        return np.flatnonzero((values >= low) & (values <= high))[::stride]
+
+    def griddap(self, query, extension):
+        selections = {}
+        variables = []
+        for name, brackets in re.findall(r'(\w+)((?:\[[^\]]*\])+)', query.split('&')[0]):
+            variables.append(name)
+            for axis, bracket in zip(self.axes, re.findall(r'\[([^\]]*)\]', brackets)):
+                start, stride, stop = re.match(r'^(\([^)]*\)|[^:]*)(?::(\d+)(?=:))?(?::(\([^)]*\)|[^:]*))?$', bracket).groups()
+                start = start.strip('()')
+                selections.setdefault(axis, self._select(axis, start, int(stride or 1), start if stop is None else stop.strip('()')))
+        if len(variables) == 1 and variables[0] in self.axes:
+            # An axis query, e.g. time[(start):1:(stop)].
+            name = variables[0]
+            values = self.axes[name][selections[name]]
+            if name == 'time':
+                values = pd.DatetimeIndex(values).strftime(TIME_FORMAT)
+            return 200, _csv_text([[name], ['UTC' if name == 'time' else 'degrees']] + [[v] for v in values]).encode()
+        import xarray as xr
+        coords = {axis: self.axes[axis][selections[axis]] for axis in self.axes}
+        if any(not len(values) for values in coords.values()):
+            return 404, NOT_FOUND
+        t_index, lat, lon = np.ix_(selections['time'], np.radians(coords['latitude']), np.radians(coords['longitude']))
+        data = {name: (tuple(self.axes), (np.sin(lat + 0.1 * i) * np.cos(lon) + 0.01 * t_index).astype('float32'))
+                for i, name in enumerate(self.data_vars) if name in variables}
+        ds = xr.Dataset(data, coords=coords)
+        if extension == 'nc':
+            return 200, self._netcdf(ds)
+        df = ds.to_dataframe().reset_index()
+        df['time'] = pd.DatetimeIndex(df['time']).strftime(TIME_FORMAT)
+        return 200, self._table_body(df, extension)
+
+    def table(self):
+        if self._table is None:
+            n_rows = self.table_rows
+            times = START + pd.to_timedelta(np.arange(n_rows) * 10, unit='min')
+            columns = {'time': times.strftime(TIME_FORMAT), 'station': np.resize(np.array(['A', 'B', 'C', 'D']), n_rows)}
+            for i, name in enumerate(self.data_vars):
+                columns[name] = np.sin(np.arange(n_rows) / (100.0 * (i + 1))).astype('float32')
+            self._table = pd.DataFrame(columns)
+        return self._table
+
+    def tabledap(self, query, extension):
+        parts = query.split('&')
+        table = self.table()
+        columns = [c for c in parts[0].split(',') if c] or list(table.columns)
+        mask = np.ones(len(table), dtype=bool)
+        times = None
+        for part in parts[1:]:
+            match = re.match(r'(\w+)(>=|<=|!=|>|<|=)(.*)', part)
+            if not match or match.group(1) not in table:
+                continue
+            name, op, text = match.groups()
+            text = text.strip('"')
+            if name == 'time':
+                if times is None:
+                    times = pd.to_datetime(table['time'], utc=True, format=TIME_FORMAT)
+                column = times
+                try:
+                    value = pd.Timestamp(float(text), unit='s', tz='UTC')
+                except ValueError:
+                    value = pd.Timestamp(text)
+                    value = value.tz_localize('UTC') if value.tzinfo is None else value
+            elif name == 'station':
+                column, value = table[name], text
+            else:
+                column, value = table[name], float(text)
+            mask &= {'>=': column >= value, '<=': column <= value, '>': column > value,
+                     '<': column < value, '=': column == value, '!=': column != value}[op].to_numpy()
+        df = table.loc[mask, columns]
+        if any(part.startswith('orderByCount') for part in parts[1:]):
+            return 200, _csv_text([columns, [''] * len(columns), [len(df)] * len(columns)]).encode()
+        if df.empty:
+            return 404, NOT_FOUND
+        if extension == 'ncCF':
+            import xarray as xr
+            df = df.reset_index(drop=True)
+            if 'time' in df:
+                df['time'] = pd.to_datetime(df['time'], format=TIME_FORMAT)
+            return 200, self._netcdf(xr.Dataset.from_dataframe(df.rename_axis('row')))
+        return 200, self._table_body(df, extension)
+
+    def _table_body(self, df, extension):
+        units = {'time': 'UTC', 'latitude': 'degrees_north', 'longitude': 'degrees_east', 'station': ''}
+        if extension == 'parquet':
+            buf = io.BytesIO()
+            df.to_parquet(buf, index=False)
+            return buf.getvalue()
+        if extension == 'csvp':
+            named = df.rename(columns=lambda c: f"{c} ({units.get(c, 'degree_C')})" if units.get(c, 'degree_C') else c)
+            return named.to_csv(index=False).encode()
+        if extension == 'csv':
+            header = ','.join(df.columns) + '\n' + ','.join(units.get(c, 'degree_C') for c in df.columns) + '\n'
+            return (header + df.to_csv(index=False, header=False)).encode()
+        if extension == 'json':
+            table = {'columnNames': list(df.columns), 'columnUnits': [units.get(c, 'degree_C') for c in df.columns],
+                     'rows': df.values.tolist()}
+            return json.dumps({'table': table}).encode()
+        return df.to_csv(index=False).encode()
+
+    def _netcdf(self, ds):
+        # The netCDF/HDF5 C libraries are not thread-safe, and the client decodes
+        # responses in this same process: share the package's lock.
+        from erddap_nb.erddap_utils import _NETCDF_LOCK
+        fd, path = tempfile.mkstemp(suffix='.nc')
+        os.close(fd)
+        try:
+            with _NETCDF_LOCK:
+                ds.to_netcdf(path, engine='netcdf4')
+            with open(path, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(path)
@@ -0,0 +1,53 @@
+# benchmarks/synthetic.py
+
+import io
+import csv
+
+INFO_COLUMNS = ["Row Type", "Variable Name", "Attribute Name", "Data Type", "Value"]
+
+def make_info_rows(n_vars=10, attrs_per_var=8, grid=False):
+    """
+    Builds the rows of a synthetic ERDDAP info.csv with `n_vars` data variables,
+    each carrying `attrs_per_var` attributes (plus actual_range/units/long_name).
+    """
+    rows = [
+        ["attribute", "NC_GLOBAL", "cdm_data_type", "String", "Grid" if grid else "TrajectoryProfile"],
+        ["attribute", "NC_GLOBAL", "title", "String", f"Synthetic dataset with {n_vars} variables"],
+        ["attribute", "NC_GLOBAL", "summary", "String", "Generated for benchmarking."],
+        ["attribute", "NC_GLOBAL", "time_coverage_start", "String", "2020-01-01T00:00:00Z"],
+        ["attribute", "NC_GLOBAL", "time_coverage_end", "String", "2020-12-31T00:00:00Z"],
+    ]
+    dims = [
+        ("time", "1.5778368E9, 1.6093728E9", "1 day", 366, "seconds since 1970-01-01T00:00:00Z"),
+        ("latitude", "-89.875, 89.875", "0.25", 720, "degrees_north"),
+        ("longitude", "0.125, 359.875", "0.25", 1440, "degrees_east"),
+    ]
+    if grid:
+        for name, actual_range, spacing, n_values, units in dims:
+            rows.append(["dimension", name, "", "double", f"nValues={n_values}, evenlySpaced=true, averageSpacing={spacing}"])
+            rows.append(["attribute", name, "actual_range", "double", actual_range])
+            rows.append(["attribute", name, "units", "String", units])
+            rows.append(["attribute", name, "long_name", "String", name.capitalize()])
+    else:
+        for name, actual_range, _, _, units in dims:
+            rows.append(["variable", name, "", "double", ""])
+            rows.append(["attribute", name, "actual_range", "double", actual_range])
+            rows.append(["attribute", name, "units", "String", units])
+
+    for i in range(n_vars):
+        name = f"var_{i:05d}"
+        rows.append(["variable", name, "", "float", "time, latitude, longitude" if grid else ""])
+        rows.append(["attribute", name, "actual_range", "float", f"{-i}.0, {i + 1}.0"])
+        rows.append(["attribute", name, "units", "String", "degree_C"])
+        rows.append(["attribute", name, "long_name", "String", f"Variable {i}"])
+        for j in range(attrs_per_var):
+            rows.append(["attribute", name, f"attr_{j}", "String", f"value {i}-{j}"])
+    return rows
+
+def make_info_csv(n_vars=10, attrs_per_var=8, grid=False):
+    """Returns the text of a synthetic info.csv response."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(INFO_COLUMNS)
+    writer.writerows(make_info_rows(n_vars, attrs_per_var, grid))
+    return buf.getvalue()
@@ -1,3 +1,22 @@
 # erddap_nb/__init__.py
 
-from . main import create_data_access_interface
+# The exports are imported on first access, so `import erddap_nb` stays cheap and
+# the widget stack is only loaded when the interface is created.
+_EXPORTS = {
+    'create_data_access_interface': 'main',
+    'Client': 'client', 'Query': 'client', 'BatchResult': 'client', 'DownloadRefused': 'client',
+    'griddap_constraints': 'client', 'tabledap_constraints': 'client',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,476 @@
+# erddap_nb/cache.py
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+def default_cache_dir(*parts):
+    """
+    Returns the base on-disk cache directory (or a sub-directory of it).
+    Honours the ERDDAP_NB_CACHE_DIR environment variable when set.
+    """
+    base = os.environ.get('ERDDAP_NB_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'erddap_nb')
+    return os.path.join(base, *parts)
+
+# '&' separators of a decoded query; an '&' inside a quoted string value is data.
+_QUERY_PARTS = re.compile(r'(?:[^&"]|"[^"]*")+')
+
+# Constraints resolved by the server at request time: a time value of now (time>=now-1day,
+# [(now-7days)]), a griddap index of last ([last], [(last-2)], [0:last]) and min()/max().
+# Quoted string values are left alone, so station="now" is cacheable.
+_RELATIVE_CONSTRAINT = re.compile(
+    r'(?:[<>=]|\(\s*)now\b'
+    r'|[\[:]\s*\(?\s*last\s*(?:[-+]\s*\d+(?:\.\d+)?\s*)?\)?\s*[\]:]'
+    r'|\b(?:min|max)\('
+)
+
+def normalize_url(url):
+    """
+    Canonical form of an ERDDAP request URL for cache keys: percent-decoded, with the
+    constraints sorted. The variable list keeps its order since it sets column order.
+
+    The query is split on '&' before decoding, so an encoded '&' in a value (A%26B)
+    stays part of it. Queries encoded as a whole (erddapy encodes the separators
+    too) are split again after decoding, outside quoted strings.
+    """
+    from urllib.parse import unquote
+    url = url.strip()
+    if '?' not in url:
+        return unquote(url)
+    base, query = url.split('?', 1)
+    parts = []
+    for raw in query.split('&'):
+        # unquote, not unquote_plus: '+' is data in ERDDAP constraints
+        parts.extend(_QUERY_PARTS.findall(unquote(raw)))
+    if not parts:
+        return unquote(base)
+    variables, constraints = parts[0], sorted(parts[1:])
+    return f"{unquote(base)}?{'&'.join([variables] + constraints)}"
+
+def _atomic_write(path, data, mode='w'):
+    """Writes a file via a temporary sibling and an atomic rename."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class MetadataCache:
+    """
+    Two-tier cache for dataset metadata keyed by (server, dataset_id).
+
+    The memory tier is a small LRU of parsed metadata dictionaries; the disk tier
+    keeps the raw info.csv body together with its ETag/Last-Modified headers so
+    stale entries can be revalidated with a conditional request.
+    """
+
+    def __init__(self, ttl=86400, max_entries=64, cache_dir=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = default_cache_dir('metadata') if cache_dir is None else cache_dir
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'refreshes': 0, 'disk_loads': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(server, dataset_id):
+        return (server.rstrip('/'), dataset_id)
+
+    def _path(self, key):
+        digest = hashlib.sha1('|'.join(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def record(self, counter):
+        """Increments one of the hit/miss counters."""
+        with self._lock:
+            self.stats[counter] = self.stats.get(counter, 0) + 1
+
+    def is_fresh(self, entry):
+        return (time.time() - entry['fetched_at']) < self.ttl
+
+    def get(self, server, dataset_id, parse=None):
+        """
+        Returns the cached entry (fresh or stale) or None. Entries found only on disk
+        are parsed with `parse(body)` and promoted to the memory tier.
+        """
+        key = self._key(server, dataset_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if not self.cache_dir or parse is None:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+            entry['metadata'] = parse(entry['body'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+        self.record('disk_loads')
+        self._remember(key, entry)
+        return entry
+
+    def put(self, server, dataset_id, body, metadata, etag=None, last_modified=None):
+        key = self._key(server, dataset_id)
+        entry = {
+            'server': key[0], 'dataset_id': dataset_id, 'body': body,
+            'etag': etag, 'last_modified': last_modified, 'fetched_at': time.time()
+        }
+        if self.cache_dir:
+            try:
+                _atomic_write(self._path(key), json.dumps(entry))
+            except OSError:
+                pass
+        entry['metadata'] = metadata
+        self._remember(key, entry)
+        return entry
+
+    def touch(self, server, dataset_id):
+        """Marks an entry as fresh again after a successful revalidation (HTTP 304)."""
+        key = self._key(server, dataset_id)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry['fetched_at'] = time.time()
+        if self.cache_dir:
+            try:
+                on_disk = {k: v for k, v in entry.items() if k != 'metadata'}
+                _atomic_write(self._path(key), json.dumps(on_disk))
+            except OSError:
+                pass
+
+    def invalidate(self, server, dataset_id):
+        key = self._key(server, dataset_id)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.cache_dir:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Empties both tiers and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            for counter in self.stats:
+                self.stats[counter] = 0
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        pass
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SearchCache:
+    """
+    Bounded LRU of search result pages keyed by (server, query, page, items_per_page).
+
+    `fetch(server, query, page, items_per_page)` is called for misses; `prefetch`
+    loads the neighbouring pages on a background worker so Next/Prev is instant.
+    """
+
+    def __init__(self, fetch, max_pages=50, max_workers=2):
+        self.fetch = fetch
+        self.max_pages = max_pages
+        self.max_workers = max_workers
+        self.stats = {'hits': 0, 'misses': 0, 'prefetched': 0, 'evictions': 0}
+        self._pages = OrderedDict()
+        self._pending = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(server, query, page, items_per_page):
+        return (server.rstrip('/'), query.strip(), page, items_per_page)
+
+    def get(self, server, query, page, items_per_page):
+        """Returns one page of results, waiting on an in-flight prefetch if there is one."""
+        key = self._key(server, query, page, items_per_page)
+        with self._lock:
+            if key in self._pages:
+                self._pages.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._pages[key]
+            future = self._pending.get(key)
+
+        if future is not None:
+            try:
+                results = future.result()
+                with self._lock:
+                    self.stats['hits'] += 1
+                return results
+            except Exception:
+                pass
+
+        with self._lock:
+            self.stats['misses'] += 1
+        results = self.fetch(server, query, page, items_per_page)
+        self._store(key, results)
+        return results
+
+    def prefetch(self, server, query, page, items_per_page, last_page=None):
+        """Schedules background fetches of pages page-1 and page+1."""
+        for neighbour in (page + 1, page - 1):
+            if neighbour < 1 or (last_page is not None and neighbour > last_page):
+                continue
+            key = self._key(server, query, neighbour, items_per_page)
+            with self._lock:
+                if key in self._pages or key in self._pending:
+                    continue
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='erddap_nb_search')
+                self._pending[key] = self._executor.submit(self._prefetch_one, key, server, query, neighbour, items_per_page)
+
+    def _prefetch_one(self, key, server, query, page, items_per_page):
+        try:
+            results = self.fetch(server, query, page, items_per_page)
+            if self._store(key, results):
+                with self._lock:
+                    self.stats['prefetched'] += 1
+            return results
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _store(self, key, results):
+        # Empty pages are not cached: search_datasets also returns [] on errors.
+        if not results:
+            return False
+        with self._lock:
+            self._pages[key] = results
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+                self.stats['evictions'] += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of raw response bodies keyed by the normalized
+    request URL. The total size is kept under `max_bytes` by evicting the least
+    recently used bodies; with compression='zstd' bodies are stored zstd-compressed.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024 ** 3, compression=None):
+        if compression not in (None, 'zstd'):
+            raise ValueError(f"Unsupported compression: {compression}")
+        if compression == 'zstd':
+            import zstandard # raises ImportError early if the optional dependency is missing
+        self.cache_dir = default_cache_dir('responses') if cache_dir is None else cache_dir
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'bytes_served': 0}
+        self._index = None # digest -> [path, size on disk, last access]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_cacheable(url):
+        """Relative constraints (now, last, min()/max()) change over time and are never cached."""
+        normalized = normalize_url(url)
+        return not _RELATIVE_CONSTRAINT.search(normalized.split('?', 1)[-1])
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        if not os.path.isdir(self.cache_dir):
+            return
+        for sub in os.listdir(self.cache_dir):
+            sub_dir = os.path.join(self.cache_dir, sub)
+            if not os.path.isdir(sub_dir):
+                continue
+            for name in os.listdir(sub_dir):
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(sub_dir, name)
+                stat = os.stat(path)
+                self._index[name.split('.')[0]] = [path, stat.st_size, stat.st_mtime]
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            self._load_index()
+            return sum(size for _, size, _ in self._index.values())
+
+    def get(self, url):
+        """Returns the cached body for `url`, or None."""
+        digest = self.key(url)
+        with self._lock:
+            self._load_index()
+            entry = self._index.get(digest)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            entry[2] = time.time()
+        path = entry[0]
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._index.pop(digest, None)
+                self.stats['misses'] += 1
+            return None
+        if path.endswith('.zst'):
+            import zstandard
+            body = zstandard.ZstdDecompressor().decompress(body)
+        with self._lock:
+            self.stats['hits'] += 1
+            self.stats['bytes_served'] += len(body)
+        return body
+
+    def put(self, url, body):
+        """Stores a response body and evicts old entries beyond the size budget."""
+        if not self.is_cacheable(url) or len(body) > self.max_bytes:
+            return
+        digest = self.key(url)
+        data, suffix = body, ''
+        if self.compression == 'zstd':
+            import zstandard
+            data, suffix = zstandard.ZstdCompressor(level=3).compress(body), '.zst'
+        path = os.path.join(self.cache_dir, digest[:2], digest + suffix)
+        try:
+            _atomic_write(path, data, mode='wb')
+        except OSError:
+            return
+        with self._lock:
+            self._load_index()
+            old = self._index.get(digest)
+            if old is not None and old[0] != path:
+                try:
+                    os.remove(old[0])
+                except OSError:
+                    pass
+            self._index[digest] = [path, len(data), time.time()]
+            self.stats['stores'] += 1
+            self._evict()
+
+    def _evict(self):
+        total = sum(size for _, size, _ in self._index.values())
+        for digest, (path, size, _) in sorted(self._index.items(), key=lambda item: item[1][2]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            del self._index[digest]
+            total -= size
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for path, _, _ in self._index.values():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._index = {}
+
+
+class GraphCache:
+    """
+    LRU of rendered graph images keyed by the normalized graph URL and bounded by
+    `max_bytes`. An optional `disk` tier (a ResponseCache) keeps images across
+    sessions and is consulted on memory misses.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 ** 2, disk=None):
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._images = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        """Bytes held by the memory tier."""
+        with self._lock:
+            return self._nbytes
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups served from memory or disk."""
+        with self._lock:
+            hits = self.stats['hits'] + self.stats['disk_hits']
+            total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+    def get(self, url):
+        """Returns the cached image for `url`, or None."""
+        if not ResponseCache.is_cacheable(url):
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+        key = normalize_url(url)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._images[key]
+        image = self.disk.get(url) if self.disk is not None else None
+        with self._lock:
+            self.stats['disk_hits' if image is not None else 'misses'] += 1
+        if image is not None:
+            self._remember(key, image)
+        return image
+
+    def put(self, url, image):
+        if not ResponseCache.is_cacheable(url) or len(image) > self.max_bytes:
+            return
+        self._remember(normalize_url(url), image)
+        with self._lock:
+            self.stats['stores'] += 1
+        if self.disk is not None:
+            self.disk.put(url, image)
+
+    def _remember(self, key, image):
+        with self._lock:
+            old = self._images.pop(key, None)
+            if old is not None:
+                self._nbytes -= len(old)
+            self._images[key] = image
+            self._nbytes += len(image)
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._nbytes -= len(evicted)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._nbytes = 0
+        if self.disk is not None:
+            self.disk.clear()
@@ -0,0 +1,312 @@
+# erddap_nb/catalog.py
+
+import re
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import http_client
+
+# Columns read from each server's allDatasets listing.
+ALL_DATASETS_COLUMNS = [
+    'datasetID', 'title', 'institution', 'summary', 'griddap', 'tabledap',
+    'minLongitude', 'maxLongitude', 'minLatitude', 'maxLatitude', 'minTime', 'maxTime'
+]
+EXTENT_COLUMNS = ['min_lon', 'max_lon', 'min_lat', 'max_lat', 'min_time', 'max_time']
+
+# bm25 weights of the full-text columns: title, dataset_id, institution, summary, variables.
+RANK_WEIGHTS = (10.0, 5.0, 2.0, 1.0, 3.0)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    server TEXT NOT NULL, dataset_id TEXT NOT NULL, title TEXT, institution TEXT, summary TEXT,
+    variables TEXT, protocol TEXT, min_lon REAL, max_lon REAL, min_lat REAL, max_lat REAL,
+    min_time REAL, max_time REAL, row_hash TEXT, PRIMARY KEY (server, dataset_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS datasets_fts USING fts5(title, dataset_id, institution, summary, variables);
+CREATE TABLE IF NOT EXISTS servers (server TEXT PRIMARY KEY, refreshed_at REAL, n_datasets INTEGER);
+"""
+
+def _server_key(server):
+    return server.rstrip('/')
+
+def _epoch_seconds(value):
+    if value is None or value == '':
+        return None
+    import pandas as pd
+
+    stamp = pd.to_datetime(value, utc=True, errors='coerce')
+    return None if pd.isna(stamp) else stamp.timestamp()
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if number != number else number # NaN -> None
+
+def fts_query(query):
+    """
+    Translates an ERDDAP-style keyword search into an FTS5 expression: every word
+    must match, "quoted phrases" match as phrases and -word excludes. Underscored
+    names such as sea_water_temperature match as a phrase of their parts.
+    """
+    positive, negative = [], []
+    for negated, phrase, negated_word, word in re.findall(r'(-?)"([^"]+)"|(-?)(\S+)', query):
+        parts = re.findall(r'[^\W_]+', phrase or word)
+        if not parts:
+            continue
+        term = '"' + ' '.join(parts) + '"'
+        (negative if (negated or negated_word) else positive).append(term)
+    if not positive:
+        return None
+    return ' AND '.join(positive) + ''.join(f' NOT {term}' for term in negative)
+
+def parse_listing(df):
+    """
+    Turns an allDatasets table read as text into {dataset_id: row dict}. Each row
+    carries a hash of its source columns, so a refresh can skip unchanged datasets
+    without comparing their fields.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = df.reindex(columns=ALL_DATASETS_COLUMNS, fill_value='').fillna('')
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    epoch = pd.Timestamp(0, tz='UTC')
+    rows = pd.DataFrame({
+        'dataset_id': df['datasetID'].str.strip(),
+        'title': df['title'], 'institution': df['institution'], 'summary': df['summary'],
+        'protocol': np.where(df['griddap'].str.strip() != '', 'griddap', 'tabledap'),
+        'min_lon': pd.to_numeric(df['minLongitude'], errors='coerce'), 'max_lon': pd.to_numeric(df['maxLongitude'], errors='coerce'),
+        'min_lat': pd.to_numeric(df['minLatitude'], errors='coerce'), 'max_lat': pd.to_numeric(df['maxLatitude'], errors='coerce'),
+        'min_time': (pd.to_datetime(df['minTime'], utc=True, errors='coerce', format='ISO8601') - epoch) / pd.Timedelta(seconds=1),
+        'max_time': (pd.to_datetime(df['maxTime'], utc=True, errors='coerce', format='ISO8601') - epoch) / pd.Timedelta(seconds=1),
+        'row_hash': [format(h, '016x') for h in hashes],
+    })
+    rows = rows[(rows['dataset_id'] != '') & (rows['dataset_id'] != 'allDatasets')]
+    rows = rows.astype(object).where(rows.notna(), None)
+    return {row['dataset_id']: row for row in rows.to_dict(orient='records')}
+
+def variables_from_metadata(metadata):
+    """Variable names (dimensions included) from a parsed info.csv."""
+    return list(metadata.get('all_variables_map', {}).keys())
+
+class Catalog:
+    """
+    Local, searchable index of the datasets on ERDDAP servers, kept in SQLite with
+    an FTS5 full-text table.
+
+    `refresh(server)` reads the server's allDatasets listing in one request and
+    applies only the differences (new, changed and removed datasets); `search`/`count`
+    then answer search_datasets-style queries, including bbox/time filters, locally.
+    Variable names are not part of allDatasets; they are added from dataset metadata
+    (`refresh(..., variables=True)` or `set_variables`) and become searchable too.
+    """
+
+    def __init__(self, path=':memory:', ttl=86400):
+        self.path = path
+        self.ttl = ttl
+        self.stats = {'searches': 0, 'refreshes': 0, 'refresh_errors': 0}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    # --- Index maintenance ---
+    def refreshed_at(self, server):
+        with self._lock:
+            row = self._conn.execute("SELECT refreshed_at FROM servers WHERE server = ?", (_server_key(server),)).fetchone()
+        return row['refreshed_at'] if row else None
+
+    def is_fresh(self, server):
+        refreshed = self.refreshed_at(server)
+        return refreshed is not None and time.time() - refreshed < self.ttl
+
+    def ensure(self, server):
+        """
+        Refreshes the server's index when it is missing or older than `ttl`. If the
+        server cannot be reached, an existing (stale) index is kept and used offline.
+        Returns True when the server has an index to search.
+        """
+        if self.is_fresh(server):
+            return True
+        try:
+            self.refresh(server)
+        except Exception:
+            with self._lock:
+                self.stats['refresh_errors'] += 1
+            return self.refreshed_at(server) is not None
+        return True
+
+    @staticmethod
+    def listing_url(server):
+        return f"{_server_key(server)}/tabledap/allDatasets.csv?{','.join(ALL_DATASETS_COLUMNS)}"
+
+    def fetch_listing(self, server, timeout=None):
+        """Downloads the server's allDatasets table as {dataset_id: row dict}."""
+        df = http_client.read_csv(self.listing_url(server), timeout=timeout, skiprows=[1], dtype=str, keep_default_na=False)
+        return parse_listing(df)
+
+    def refresh(self, server, variables=False, metadata_cache=None, max_workers=4, timeout=None):
+        """
+        Re-reads the server's dataset list and updates the index incrementally.
+        With `variables=True` the info.csv of every new or changed dataset is fetched
+        (through `metadata_cache` when given) so its variable names are searchable.
+        Returns counts of added/updated/removed/unchanged datasets.
+        """
+        listing = self.fetch_listing(server, timeout=timeout)
+        counts, changed = self.apply_listing(server, listing)
+        if variables and changed:
+            self.index_variables(server, changed, metadata_cache, max_workers)
+        return counts
+
+    def apply_listing(self, server, listing):
+        """
+        Brings the server's index in line with `listing` ({dataset_id: row}, as from
+        parse_listing), writing only rows whose hash changed. Returns the counts
+        and the IDs of new or changed datasets.
+        """
+        key = _server_key(server)
+        with self._lock:
+            known = {row['dataset_id']: (row['rowid'], row['row_hash']) for row in self._conn.execute(
+                "SELECT rowid, dataset_id, row_hash FROM datasets WHERE server = ?", (key,))}
+
+        added, updated = [], []
+        for dataset_id, row in listing.items():
+            if dataset_id not in known:
+                added.append(row)
+            elif known[dataset_id][1] != row['row_hash']:
+                updated.append(row)
+        removed = [dataset_id for dataset_id in known if dataset_id not in listing]
+
+        with self._lock, self._conn:
+            for dataset_id in removed:
+                rowid = known[dataset_id][0]
+                self._conn.execute("DELETE FROM datasets_fts WHERE rowid = ?", (rowid,))
+                self._conn.execute("DELETE FROM datasets WHERE rowid = ?", (rowid,))
+            for row in updated:
+                rowid = known[row['dataset_id']][0]
+                self._conn.execute(
+                    "UPDATE datasets SET title = ?, institution = ?, summary = ?, protocol = ?, min_lon = ?, max_lon = ?, "
+                    "min_lat = ?, max_lat = ?, min_time = ?, max_time = ?, row_hash = ? WHERE rowid = ?",
+                    [row[c] for c in ('title', 'institution', 'summary', 'protocol', *EXTENT_COLUMNS, 'row_hash')] + [rowid])
+                self._index_text(rowid)
+            if added:
+                # New rows get the highest rowids, so their text is indexed in one statement.
+                last_rowid = self._conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM datasets").fetchone()[0]
+                self._conn.executemany(
+                    "INSERT INTO datasets (server, dataset_id, title, institution, summary, variables, protocol, "
+                    "min_lon, max_lon, min_lat, max_lat, min_time, max_time, row_hash) VALUES (?, ?, ?, ?, ?, '', ?, ?, ?, ?, ?, ?, ?, ?)",
+                    ([key] + [row[c] for c in ('dataset_id', 'title', 'institution', 'summary', 'protocol', *EXTENT_COLUMNS, 'row_hash')]
+                     for row in added))
+                self._conn.execute(
+                    "INSERT INTO datasets_fts (rowid, title, dataset_id, institution, summary, variables) "
+                    "SELECT rowid, title, dataset_id, institution, summary, variables FROM datasets WHERE rowid > ?", (last_rowid,))
+            self._conn.execute("INSERT OR REPLACE INTO servers (server, refreshed_at, n_datasets) VALUES (?, ?, ?)",
+                               (key, time.time(), len(listing)))
+            self.stats['refreshes'] += 1
+
+        counts = {'added': len(added), 'updated': len(updated), 'removed': len(removed),
+                  'unchanged': len(listing) - len(added) - len(updated)}
+        return counts, [row['dataset_id'] for row in added + updated]
+
+    def _index_text(self, rowid):
+        # Caller holds the lock inside a transaction.
+        self._conn.execute("DELETE FROM datasets_fts WHERE rowid = ?", (rowid,))
+        self._conn.execute(
+            "INSERT INTO datasets_fts (rowid, title, dataset_id, institution, summary, variables) "
+            "SELECT rowid, title, dataset_id, institution, summary, variables FROM datasets WHERE rowid = ?", (rowid,))
+
+    def set_variables(self, server, dataset_id, names):
+        """Records the variable names of one dataset (e.g. from metadata the UI already fetched)."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT rowid FROM datasets WHERE server = ? AND dataset_id = ?",
+                                     (_server_key(server), dataset_id)).fetchone()
+            if row is None:
+                return False
+            self._conn.execute("UPDATE datasets SET variables = ? WHERE rowid = ?", (' '.join(names), row['rowid']))
+            self._index_text(row['rowid'])
+        return True
+
+    def index_variables(self, server, dataset_ids, metadata_cache=None, max_workers=4):
+        """Fetches info.csv for `dataset_ids` concurrently and indexes their variable names."""
+        from . import erddap_utils
+
+        def index_one(dataset_id):
+            try:
+                metadata = erddap_utils.get_dataset_metadata(server, dataset_id, cache=metadata_cache)
+            except Exception:
+                return False
+            return self.set_variables(server, dataset_id, variables_from_metadata(metadata))
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='erddap_nb_catalog') as pool:
+            return sum(pool.map(index_one, dataset_ids))
+
+    # --- Queries ---
+    def _where(self, server, query, min_lon=None, max_lon=None, min_lat=None, max_lat=None, min_time=None, max_time=None):
+        """SQL conditions and parameters for a search; extents must overlap the requested box."""
+        clauses, params = [], []
+        match = fts_query(query or '')
+        if match:
+            clauses.append("datasets_fts MATCH ?")
+            params.append(match)
+        if server:
+            clauses.append("d.server = ?")
+            params.append(_server_key(server))
+        min_lon, max_lon = _number(min_lon), _number(max_lon)
+        if min_lon is not None and max_lon is not None:
+            # Servers use both -180..180 and 0..360 longitudes, so the box is also tried shifted by 360.
+            clauses.append("(" + " OR ".join(["(d.max_lon >= ? AND d.min_lon <= ?)"] * 3) + ")")
+            params.extend([min_lon - 360, max_lon - 360, min_lon, max_lon, min_lon + 360, max_lon + 360])
+            min_lon = max_lon = None
+        for column, op, value in (('max_lon', '>=', min_lon), ('min_lon', '<=', max_lon),
+                                  ('max_lat', '>=', _number(min_lat)), ('min_lat', '<=', _number(max_lat)),
+                                  ('max_time', '>=', _epoch_seconds(min_time)), ('min_time', '<=', _epoch_seconds(max_time))):
+            if value is not None:
+                clauses.append(f"d.{column} {op} ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params, bool(match)
+
+    def search(self, server, query, page=1, items_per_page=10, **filters):
+        """
+        One page of matching datasets as records shaped like search_datasets results
+        (dataset_id, title, institution, plus server, protocol, summary and extents),
+        best matches first. `server=None` searches every indexed server.
+        """
+        import pandas as pd
+
+        where, params, ranked = self._where(server, query, **filters)
+        order = f"bm25(datasets_fts, {', '.join(map(str, RANK_WEIGHTS))})" if ranked else "d.title"
+        sql = (f"SELECT d.* FROM datasets d JOIN datasets_fts ON datasets_fts.rowid = d.rowid{where} "
+               f"ORDER BY {order} LIMIT ? OFFSET ?")
+        with self._lock:
+            rows = self._conn.execute(sql, params + [items_per_page, (page - 1) * items_per_page]).fetchall()
+            self.stats['searches'] += 1
+        records = []
+        for row in rows:
+            record = {k: row[k] for k in row.keys() if k not in ('row_hash',)}
+            for column in ('min_time', 'max_time'):
+                if record[column] is not None:
+                    record[column] = pd.Timestamp(record[column], unit='s', tz='UTC').isoformat()
+            records.append(record)
+        return records
+
+    def count(self, server, query, **filters):
+        """Total number of datasets matching a search."""
+        where, params, _ = self._where(server, query, **filters)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM datasets d JOIN datasets_fts ON datasets_fts.rowid = d.rowid{where}",
+                                      params).fetchone()[0]
+
+    def servers(self):
+        """{server: {'refreshed_at', 'n_datasets'}} for every indexed server."""
+        with self._lock:
+            return {row['server']: {'refreshed_at': row['refreshed_at'], 'n_datasets': row['n_datasets']}
+                    for row in self._conn.execute("SELECT * FROM servers")}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,420 @@
+# erddap_nb/client.py
+
+import os
+import sys
+import copy
+import time
+import uuid
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import erddap_utils
+from . import http_client
+from . import sizing
+from . import telemetry
+from .cache import MetadataCache
+from .tiling import DEFAULT_TILE_BYTES
+
+INGESTABLE_RESPONSES = ('csv', 'parquet', 'nc')
+SOURCE_FORMATS = {'csv': 'csv', 'parquet': 'parquet', 'nc': 'netcdf'}
+# File types whose ERDDAP extension differs from the UI's name, and file name extensions.
+ERDDAP_RESPONSES = {'geotiff': 'geotif'}
+FILE_EXTENSIONS = {'geotiff': 'tif'}
+# Appended to the name of griddap preview queries, so a refined download does not replace its preview.
+PREVIEW_SUFFIX = '_preview'
+
+# --- Constraint builders ---
+
+def griddap_constraints(ranges):
+    """
+    Builds erddapy constraints from {dimension: (start, stop)}; empty values leave
+    that end of the dimension open.
+    """
+    constraints = {}
+    for name, (start_val, stop_val) in ranges.items():
+        if start_val is not None and str(start_val) != '':
+            constraints[f'{name}>='] = start_val
+        if stop_val is not None and str(stop_val) != '':
+            constraints[f'{name}<='] = stop_val
+    return constraints
+
+def _is_default(value, default, is_time):
+    if default is None:
+        return False
+    if is_time:
+        return value == default
+    try:
+        return float(value) == float(default)
+    except (ValueError, TypeError):
+        return False
+
+def tabledap_constraints(filters, metadata):
+    """
+    Builds a constraint dictionary for erddapy from per-variable filter specs,
+    skipping bounds that equal the variable's full range. A spec is either a range,
+    {'op_start': '>=', 'start': v, 'op_stop': '<=', 'stop': v, 'is_time': bool}
+    (with op_start '=' the stop is ignored), or a single test {'op': '=~', 'val': v}.
+    """
+    constraints = {}
+    # This map provides the URL-encoded operators that erddapy expects in the dictionary key.
+    op_map = {'=': '=', '>=': '>=', '<=': '<=', '>': '>', '<': '<', '!=': '!=', '=~': '=~'}
+
+    all_variables_map = metadata.get('all_variables_map', {})
+    global_attrs = metadata.get('global_attrs', {})
+
+    for name, spec in filters.items():
+        # Case 1: Range-based controls with selectable operators
+        if 'op_start' in spec:
+            start_op, start_val = spec.get('op_start'), spec.get('start')
+            is_time = spec.get('is_time', False)
+
+            default_min, default_max = None, None
+            if is_time:
+                default_min = global_attrs.get('time_coverage_start')
+                default_max = global_attrs.get('time_coverage_end')
+            else:
+                actual_range_str = str(all_variables_map.get(name, {}).get('actual_range', ''))
+                range_parts = [p.strip() for p in actual_range_str.split(',')]
+                if len(range_parts) == 2:
+                    default_min, default_max = range_parts[0], range_parts[1]
+
+            if start_val is not None and str(start_val).strip() != '' and not _is_default(start_val, default_min, is_time):
+                constraints[f"{name}{op_map.get(start_op, start_op)}"] = start_val
+
+            if start_op == '=':
+                continue
+
+            stop_op, stop_val = spec.get('op_stop'), spec.get('stop')
+            if stop_val is not None and str(stop_val).strip() != '' and not _is_default(stop_val, default_max, is_time):
+                constraints[f"{name}{op_map.get(stop_op, stop_op)}"] = stop_val
+
+        # Case 2: Single value (string inputs)
+        elif 'op' in spec and spec.get('val'):
+            op, final_val = spec['op'], spec['val']
+            # Numbers typed as text are sent as numbers; whole numbers as integers.
+            try:
+                num_val = float(final_val)
+                final_val = int(num_val) if num_val.is_integer() else num_val
+            except (ValueError, TypeError):
+                pass
+            constraints[f"{name}{op_map.get(op, op)}"] = final_val
+
+    return constraints
+
+# --- Queries ---
+
+class Query:
+    """
+    One ERDDAP data request, independent of any widgets.
+
+    `constraints` use erddapy's {'name>=': value} form (see griddap_constraints and
+    tabledap_constraints). `response` is a file type such as 'csv', 'parquet' or 'nc';
+    `tiled`/`partitioned` choose a griddap tiled or tabledap time-partitioned fetch;
+    `zarr` writes a griddap NetCDF result into a local Zarr store opened lazily with dask.
+    `window` is the time span of one partition (a Timedelta, default 30 days).
+    `estimate` is a known tabledap size in bytes, used by the download-size guardrail.
+    `max_points` makes a griddap query a low-resolution preview: every dimension is
+    strided ([start:stride:stop]) so about that many grid points are fetched per
+    variable (see sizing.preview_steps); `full_resolution()` is the same query without it.
+    """
+
+    def __init__(self, server, dataset_id, variables=(), constraints=None, response='csv', name=None, protocol=None,
+                 tiled=False, tile_bytes=DEFAULT_TILE_BYTES, split_space=False,
+                 partitioned=False, window=None, estimate=None, zarr=False, max_points=None):
+        self.server = server
+        self.dataset_id = dataset_id
+        self.variables = list(variables)
+        self.constraints = dict(constraints or {})
+        self.response = response
+        # The random part keeps queries created in the same second (e.g. for run_batch) from sharing output paths.
+        self.name = name or f"{dataset_id}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.protocol = protocol
+        self.tiled = tiled
+        self.tile_bytes = tile_bytes
+        self.split_space = split_space
+        self.partitioned = partitioned
+        if window is None:
+            import pandas as pd
+            window = pd.Timedelta(days=30)
+        self.window = window
+        self.estimate = estimate
+        self.zarr = zarr
+        self.max_points = max_points
+        if max_points and not self.name.endswith(PREVIEW_SUFFIX):
+            self.name += PREVIEW_SUFFIX
+
+    def full_resolution(self):
+        """The query a preview was made from: no preview strides, and the name without its preview suffix."""
+        query = copy.copy(self)
+        query.max_points = None
+        if self.name.endswith(PREVIEW_SUFFIX):
+            query.name = self.name[:-len(PREVIEW_SUFFIX)]
+        return query
+
+    def __repr__(self):
+        return f"<Query {self.name}: {self.dataset_id} {self.variables} {self.constraints} as {self.response}>"
+
+class DownloadRefused(ValueError):
+    """Raised when a query's estimated size exceeds the client's download limit and cannot be split."""
+
+class BatchResult:
+    """Outcome of one query in a batch: `data` on success, otherwise the raised `error`."""
+
+    def __init__(self, query, data=None, error=None, elapsed=0.0):
+        self.query = query
+        self.data = data
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        outcome = "ok" if self.ok else f"failed: {self.error}"
+        return f"<BatchResult {self.query.name}: {outcome} in {self.elapsed:.2f}s>"
+
+def store_entry(data, response):
+    """Wraps fetched data the way `app['dataframes']` stores it."""
+    import pandas as pd
+    from .lazy import LazyParquet, LazyFile
+    if isinstance(data, LazyParquet):
+        return {'data': data, 'source_format': 'parquet', 'lazy': True}
+    if isinstance(data, LazyFile):
+        return {'data': data, 'source_format': data.file_format, 'lazy': True}
+    if getattr(data, 'chunks', None) and not isinstance(data, pd.DataFrame):
+        # A dask-backed Dataset read from a local Zarr store.
+        return {'data': data, 'source_format': 'netcdf', 'lazy': True}
+    return {'data': data, 'source_format': SOURCE_FORMATS.get(response, response)}
+
+class Client:
+    """
+    Headless access to ERDDAP data: metadata, size estimates, graph URLs and
+    downloads, with the same caches and download-size guardrail as the notebook UI
+    (which is built on top of it). Safe to share between threads.
+    """
+
+    def __init__(self, metadata_cache=None, response_cache=None, max_download_bytes=None, data_dir=None):
+        self.metadata_cache = MetadataCache() if metadata_cache is None else metadata_cache
+        self.response_cache = response_cache
+        self.max_download_bytes = max_download_bytes
+        self.data_dir = data_dir
+
+    def metadata(self, server, dataset_id, refresh=False):
+        return erddap_utils.get_dataset_metadata(server, dataset_id, cache=self.metadata_cache, refresh=refresh)
+
+    def protocol(self, query, metadata=None):
+        if query.protocol:
+            return query.protocol
+        return (metadata or self.metadata(query.server, query.dataset_id))['protocol']
+
+    def request(self, query, metadata=None):
+        """Returns an erddapy `ERDDAP` object holding the query's variables and constraints."""
+        if self.protocol(query, metadata) == 'griddap':
+            metadata = metadata or self.metadata(query.server, query.dataset_id)
+            e = erddap_utils.griddap_request(query.server, query.dataset_id, metadata)
+            e.variables = list(query.variables)
+            e.constraints.update(query.constraints)
+            if query.max_points:
+                e.constraints.update(sizing.preview_steps(metadata, e.constraints, query.max_points))
+        else:
+            from erddapy import ERDDAP
+            e = ERDDAP(server=query.server, protocol='tabledap')
+            e.dataset_id = query.dataset_id
+            e.variables = list(query.variables)
+            e.constraints = dict(query.constraints)
+        return e
+
+    def url(self, query, response=None, metadata=None):
+        return self.request(query, metadata).get_download_url(response=response or query.response)
+
+    def graph_url(self, query, draw, axes, palette='Default', reverse_x=False, reverse_y=False, metadata=None):
+        """
+        URL of an ERDDAP-rendered .png of the query. `axes` are the x, y and optional
+        colour variables; a griddap surface graph is drawn at its first time step.
+        """
+        e = self.request(query, metadata)
+        is_griddap = e.protocol == 'griddap'
+        if is_griddap and draw == 'surface' and 'time>=' in query.constraints:
+            e.constraints['time<='] = e.constraints['time>=']
+        graph_url = e.get_download_url(response="png") + f"&.draw={draw}"
+        if is_griddap:
+            graph_url += f"&.vars={'|'.join(a for a in axes if a)}"
+        if palette != 'Default': graph_url += f"&.colorBar={palette}"
+        if reverse_x: graph_url += '&.xRange=||false'
+        if reverse_y: graph_url += '&.yRange=||false'
+        return graph_url
+
+    def estimate(self, query, metadata=None):
+        """
+        Returns (rows, bytes) for the query; either may be None if unknown. Griddap
+        sizes are computed from the metadata; tabledap asks the server for a row count.
+        """
+        metadata = metadata or self.metadata(query.server, query.dataset_id)
+        e = self.request(query, metadata)
+        if e.protocol == 'griddap':
+            return None, sizing.estimate_griddap_bytes(metadata, e.constraints, query.variables)
+        rows = sizing.estimate_tabledap_rows(e)
+        return rows, None if rows is None else rows * sizing.bytes_per_cell(metadata, query.variables)
+
+    def plan(self, query, metadata=None):
+        """
+        Decides how to fetch a query: 'direct', 'tiled', 'zarr', 'partitioned' or 'link'
+        (for formats that are not loaded into memory). Returns (mode, note), where note
+        explains a switch forced by the size limit. Raises DownloadRefused when the
+        query is over the limit and cannot be split. Tabledap queries without a known
+        `estimate` are sized with an orderByCount probe when a limit is set.
+        """
+        metadata = metadata or self.metadata(query.server, query.dataset_id)
+        limit = self.max_download_bytes
+        if self.protocol(query, metadata) == 'griddap':
+            e = self.request(query, metadata)
+            estimate = sizing.estimate_griddap_bytes(metadata, e.constraints, query.variables)
+            if limit and estimate and estimate > limit:
+                if query.response != 'nc':
+                    raise DownloadRefused(f"Refusing download: estimated {sizing.format_bytes(estimate)} exceeds the {sizing.format_bytes(limit)} limit. "
+                                          "Narrow the subset or choose NetCDF to download it in tiles.")
+                if query.zarr:
+                    return 'zarr', f"Estimated {sizing.format_bytes(estimate)} exceeds the {sizing.format_bytes(limit)} limit; writing it to Zarr in tiles."
+                if not query.tiled:
+                    return 'tiled', f"Estimated {sizing.format_bytes(estimate)} exceeds the {sizing.format_bytes(limit)} limit; downloading in tiles."
+            if query.response not in INGESTABLE_RESPONSES:
+                return 'link', None
+            if query.response == 'nc' and query.zarr:
+                return 'zarr', None
+            return ('tiled' if query.tiled and query.response == 'nc' else 'direct'), None
+
+        estimate = query.estimate
+        has_time = 'time' in metadata.get('all_variables_map', {})
+        if limit and estimate is None and query.response in INGESTABLE_RESPONSES and not (query.partitioned and has_time):
+            # No size known from an earlier estimate: probe the server so the limit is always enforced.
+            _, estimate = self.estimate(query, metadata)
+            query.estimate = estimate
+        if limit and estimate and estimate > limit:
+            if not has_time:
+                raise DownloadRefused(f"Refusing download: estimated {sizing.format_bytes(estimate)} exceeds the {sizing.format_bytes(limit)} limit. "
+                                      "Add filters to narrow the query.")
+            if not query.partitioned:
+                return 'partitioned', f"Estimated {sizing.format_bytes(estimate)} exceeds the {sizing.format_bytes(limit)} limit; fetching in time partitions to disk."
+        if query.partitioned:
+            return 'partitioned', None
+        return ('direct' if query.response in INGESTABLE_RESPONSES else 'link'), None
+
+    def fetch(self, query, metadata=None, job=None, mode=None):
+        """
+        Downloads a query and returns a DataFrame, an xarray Dataset (dask-backed for
+        Zarr fetches) or (for partitioned fetches) a LazyParquet handle. `job` is an optional DownloadJob for progress and
+        cancellation; `mode` is a result of `plan()` (planned here if omitted).
+        """
+        with telemetry.span('download', name=query.name):
+            return self._fetch(query, metadata, job, mode)
+
+    def _fetch(self, query, metadata, job, mode):
+        from . import tiling
+        from . import partitioned
+        metadata = metadata or self.metadata(query.server, query.dataset_id)
+        if mode is None:
+            mode, _ = self.plan(query, metadata)
+        if mode == 'link':
+            raise ValueError(f"'{query.response}' responses are not loaded into memory; download {self.url(query, metadata=metadata)}")
+        e = self.request(query, metadata)
+        cache = self.response_cache
+
+        if mode == 'partitioned':
+            path = os.path.join(self.data_dir or tempfile.gettempdir(), f"{query.name}.parquet")
+            return partitioned.fetch_tabledap_partitioned(e, metadata, path, window=query.window, cache=cache, job=job)
+        if mode == 'tiled':
+            tile_bytes = min(query.tile_bytes, self.max_download_bytes) if self.max_download_bytes else query.tile_bytes
+            return tiling.fetch_griddap_tiled(e, metadata, max_tile_bytes=tile_bytes, split_space=query.split_space, cache=cache, job=job)
+        if mode == 'zarr':
+            # Untiled queries go out as one request unless they are over the size limit.
+            tile_bytes = query.tile_bytes if query.tiled else self.max_download_bytes or sys.maxsize
+            if self.max_download_bytes:
+                tile_bytes = min(tile_bytes, self.max_download_bytes)
+            return tiling.fetch_griddap_zarr(e, metadata, self.zarr_path(query), max_tile_bytes=tile_bytes, split_space=query.split_space, cache=cache, job=job)
+        if query.response == 'csv':
+            if e.protocol == 'griddap':
+                return erddap_utils.fetch_dataframe(e, cache=cache, job=job, skiprows=(1,))
+            return erddap_utils.fetch_dataframe(e, cache=cache, job=job)
+        if query.response == 'parquet':
+            return erddap_utils.fetch_parquet(e, cache=cache, job=job)
+        return erddap_utils.fetch_xarray(e, cache=cache, job=job)
+
+    def file_path(self, query):
+        """Where `download` saves a query's response by default."""
+        extension = FILE_EXTENSIONS.get(query.response, query.response)
+        return os.path.join(self.data_dir or tempfile.gettempdir(), 'files', f"{query.name}.{extension}")
+
+    def download(self, query, path=None, metadata=None, job=None):
+        """
+        Streams the raw response of a query (in `query.response` format, including
+        json, geotiff and kml) straight to `path`, by default under data_dir/files,
+        without parsing it. Returns a LazyParquet handle for parquet and a LazyFile
+        otherwise. Nothing is held in memory, so the download-size limit does not apply.
+        """
+        from .lazy import LazyParquet, LazyFile
+        path = path or self.file_path(query)
+        response = ERDDAP_RESPONSES.get(query.response, query.response)
+        url = http_client.erddap_url(self.url(query, response=response, metadata=metadata))
+        with telemetry.span('download', name=query.name, url=url):
+            http_client.download_to_file(url, path, job=job)
+        if query.response == 'parquet':
+            return LazyParquet(path)
+        return LazyFile(path, query.response)
+
+    def zarr_path(self, query):
+        """Directory of the Zarr store that a 'zarr' fetch writes a query to."""
+        return os.path.join(self.data_dir or tempfile.gettempdir(), 'zarr', f"{query.name}.zarr")
+
+    def sync_path(self, query):
+        """Directory of the Parquet store that `sync` keeps for a query (named after query.name)."""
+        return os.path.join(self.data_dir or tempfile.gettempdir(), 'sync', query.name)
+
+    def sync(self, query, metadata=None, job=None, key='time', overlap=None):
+        """
+        Incrementally mirrors a tabledap query into a Parquet store (see
+        sync.sync_tabledap): the first call downloads the full result, later calls
+        only the rows whose `key` is newer than what the store holds. Give the query
+        a stable `name`, since it names the store. Returns (LazyParquet, report).
+        """
+        from . import sync
+        with telemetry.span('download', name=query.name):
+            metadata = metadata or self.metadata(query.server, query.dataset_id)
+            path = self.sync_path(query)
+            initial = 'direct'
+            if sync.read_state(path) is None:
+                mode, _ = self.plan(query, metadata)
+                initial = 'partitioned' if mode == 'partitioned' else 'direct'
+            return sync.sync_tabledap(self.request(query, metadata), metadata, path, key=key, overlap=overlap,
+                                      initial=initial, window=query.window, job=job)
+
+    def _run(self, query):
+        start = time.monotonic()
+        try:
+            data = self.fetch(query)
+        except Exception as err:
+            return BatchResult(query, error=err, elapsed=time.monotonic() - start)
+        return BatchResult(query, data=data, elapsed=time.monotonic() - start)
+
+    def run_batch(self, queries, max_workers=4, on_result=None):
+        """
+        Runs `queries` concurrently, at most `max_workers` at a time (the HTTP client's
+        per-server limit still applies), and returns one BatchResult per query in input
+        order. A failing query records its error without stopping the others.
+        `on_result(result)` is called as each query finishes. Query names must be
+        unique, since they name the output files; a ValueError is raised otherwise.
+        """
+        queries = list(queries)
+        names = [query.name for query in queries]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Queries in a batch need unique names; repeated: {', '.join(duplicates)}")
+        results = [None] * len(queries)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='erddap_nb_batch') as pool:
+            futures = {pool.submit(self._run, query): index for index, query in enumerate(queries)}
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if on_result:
+                    on_result(result)
+        return results
@@ -0,0 +1,11 @@
+# erddap_nb/columns.py
+
+def resolve_column(columns, name):
+    """Finds `name` among `columns`, allowing for the ' (units)' suffix of .csvp headers."""
+    columns = list(columns)
+    if name in columns:
+        return name
+    for column in columns:
+        if str(column).startswith(f"{name} ("):
+            return column
+    raise ValueError(f"'{name}' is not in the saved data.")
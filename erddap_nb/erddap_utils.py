@@ -1,61 +1,141 @@
 # erddap_nb/erddap_utils.py
 
-import pandas as pd
+import io
 import re
-from erddapy import ERDDAP
+import requests
 import urllib
+from . import http_client
+from . import telemetry
+import threading
 
-def get_dataset_metadata(server_url: str, dataset_id: str) -> dict:
+_NETCDF_LOCK = threading.Lock()
+
+def get_dataset_metadata(server_url: str, dataset_id: str, cache=None, refresh: bool = False) -> dict:
     """
     Fetches and parses the full dataset metadata from the info.csv endpoint.
+
+    When a `MetadataCache` is given, fresh entries are served without any network
+    access, stale entries are revalidated with If-None-Match/If-Modified-Since, and
+    `refresh=True` bypasses the cache and re-downloads unconditionally.
     """
+    from erddapy import ERDDAP
+
     e = ERDDAP(server=server_url)
     e.dataset_id = dataset_id
     info_url = e.get_info_url(response="csv")
-    info_df = pd.read_csv(info_url)
+    with telemetry.span('metadata', name=dataset_id, url=info_url):
+        return _get_dataset_metadata(server_url, dataset_id, info_url, cache, refresh)
+
+def _get_dataset_metadata(server_url, dataset_id, info_url, cache, refresh):
+    if cache is None:
+        info_df = http_client.read_csv(info_url)
+        with telemetry.phase('parse'):
+            return parse_info_df(info_df)
+
+    entry = None
+    if refresh:
+        cache.record('refreshes')
+    else:
+        entry = cache.get(server_url, dataset_id, parse=parse_info_csv)
+        if entry is not None and cache.is_fresh(entry):
+            cache.record('hits')
+            return entry['metadata']
+
+    headers = {}
+    if entry is not None:
+        if entry.get('etag'): headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'): headers['If-Modified-Since'] = entry['last_modified']
+
+    response = http_client.get(info_url, headers=headers, timeout=60)
+    if response.status_code == 304 and entry is not None:
+        cache.record('revalidated')
+        cache.touch(server_url, dataset_id)
+        return entry['metadata']
+    response.raise_for_status()
+
+    if not refresh:
+        cache.record('misses')
+    with telemetry.phase('parse'):
+        metadata = parse_info_csv(response.text)
+    cache.put(server_url, dataset_id, response.text, metadata,
+              etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+    return metadata
 
-    global_attrs_df = info_df[info_df["Variable Name"] == "NC_GLOBAL"]
-    global_attrs = dict(zip(global_attrs_df["Attribute Name"], global_attrs_df["Value"]))
+def parse_info_csv(body: str) -> dict:
+    """Parses the text of an info.csv response."""
+    import pandas as pd
+
+    return parse_info_df(pd.read_csv(io.StringIO(body)))
+
+def _variable_type(attrs, row_data_type):
+    """Data type of a variable: an explicit 'type' attribute, else the row's Data Type column."""
+    type_str = attrs.get('type', row_data_type)
+    return type_str.lower() if isinstance(type_str, str) and type_str else 'string'
+
+def parse_info_df(info_df: 'pandas.DataFrame') -> dict:
+    """
+    Turns an info.csv DataFrame into the metadata structure used by the UI builders.
+    """
+    row_types = info_df["Row Type"].tolist()
+    var_names = info_df["Variable Name"].tolist()
+    attr_names = info_df["Attribute Name"].tolist()
+    data_types = info_df["Data Type"].tolist() if "Data Type" in info_df else [None] * len(info_df)
+    values = info_df["Value"].tolist()
+
+    # Single pass over the rows: group attributes by variable and record the
+    # dimension/variable rows in the order they appear.
+    attrs_by_var = {}
+    dim_values = {}
+    variable_names = []
+    row_data_types = {}
+    for row_type, var_name, attr_name, data_type, value in zip(row_types, var_names, attr_names, data_types, values):
+        if row_type == "attribute" or var_name == "NC_GLOBAL":
+            attrs_by_var.setdefault(var_name, {})[attr_name] = value
+        elif row_type == "dimension":
+            dim_values.setdefault(var_name, value)
+            row_data_types.setdefault(var_name, data_type)
+        elif row_type == "variable":
+            variable_names.append(var_name)
+            row_data_types.setdefault(var_name, data_type)
+
+    global_attrs = attrs_by_var.get("NC_GLOBAL", {})
     cdm_type = global_attrs.get("cdm_data_type", "").lower()
     protocol = 'griddap' if cdm_type == 'grid' else 'tabledap'
 
     # Get dimension info first
-    dims_df = info_df[info_df["Row Type"] == "dimension"]
-    dimension_names = list(dims_df["Variable Name"].unique())
     dimensions = []
-    for dim_name in dimension_names:
-        dim_attrs_df = info_df[(info_df["Variable Name"] == dim_name) & (info_df["Row Type"] == "attribute")]
-        dim_attrs = dict(zip(dim_attrs_df["Attribute Name"], dim_attrs_df["Value"]))
-        
-        spacing = "N/A"
-        dim_row = dims_df[dims_df["Variable Name"] == dim_name].iloc[0]
-        val_str = dim_row.get("Value", "")
-        if "averageSpacing" in val_str:
+    for dim_name, val_str in dim_values.items():
+        dim_attrs = attrs_by_var.get(dim_name, {})
+
+        spacing, n_values = "N/A", None
+        if isinstance(val_str, str) and "averageSpacing" in val_str:
             match = re.search(r"averageSpacing=([^,]+)", val_str)
             if match:
                 spacing = match.group(1).strip()
-        
+        if isinstance(val_str, str) and "nValues" in val_str:
+            match = re.search(r"nValues=(\d+)", val_str)
+            if match:
+                n_values = int(match.group(1))
+
         dimensions.append({
             'name': dim_name,
-            'type': dim_attrs.get('type', 'string').lower(),
+            'type': _variable_type(dim_attrs, row_data_types.get(dim_name)),
             'actual_range': dim_attrs.get("actual_range", "N/A"),
             'average_spacing': spacing,
+            'n_values': n_values,
             'units': dim_attrs.get("units"),
             'long_name': dim_attrs.get("long_name")
         })
-        
+
     # Get data variable info (excluding dimensions)
-    vars_df = info_df[info_df["Row Type"] == "variable"]
     data_variables = []
-    for var_name in vars_df["Variable Name"].unique():
-        if var_name in dimension_names: continue
-        
-        var_attrs_df = info_df[(info_df["Variable Name"] == var_name) & (info_df["Row Type"] == "attribute")]
-        var_attrs = dict(zip(var_attrs_df["Attribute Name"], var_attrs_df["Value"]))
-        
+    for var_name in dict.fromkeys(variable_names):
+        if var_name in dim_values: continue
+
+        var_attrs = attrs_by_var.get(var_name, {})
         data_variables.append({
             'name': var_name,
-            'type': var_attrs.get('type', 'string').lower(),
+            'type': _variable_type(var_attrs, row_data_types.get(var_name)),
             'actual_range': var_attrs.get("actual_range", "N/A"),
             'units': var_attrs.get("units"),
             'long_name': var_attrs.get("long_name")
@@ -72,6 +152,108 @@ def get_dataset_metadata(server_url: str, dataset_id: str) -> dict:
         "global_attrs": global_attrs
     }
 
+def fetch_axis_values(server, dataset_id, dim_name, start, stop):
+    """
+    Fetches the actual values of one griddap axis between start and stop (inclusive)
+    as strings, exactly as ERDDAP reports them.
+    """
+    import pandas as pd
+
+    url = f"{server.rstrip('/')}/griddap/{dataset_id}.csv?{dim_name}[({start}):1:({stop})]"
+    response = http_client.get(http_client.erddap_url(url), timeout=60)
+    response.raise_for_status()
+    df = pd.read_csv(io.StringIO(response.text), skiprows=[1], dtype=str)
+    return df[dim_name].tolist()
+
+def griddap_initialize(e, metadata, step=1):
+    """
+    Equivalent of `ERDDAP.griddap_initialize()` that takes the default constraints
+    from already-fetched metadata instead of downloading the dataset's .ncml.
+    """
+    constraints = {}
+    for dim in metadata.get('dimensions', []):
+        range_parts = [p.strip() for p in str(dim.get('actual_range', '')).split(',')]
+        if len(range_parts) != 2:
+            e.griddap_initialize(step=step)
+            return
+        range_min, range_max = range_parts
+        if dim['name'] == 'time':
+            range_min = range_max
+        constraints[f"{dim['name']}>="] = range_min
+        constraints[f"{dim['name']}<="] = range_max
+        constraints[f"{dim['name']}_step"] = str(step)
+
+    e.constraints = constraints
+    e.dim_names = [d['name'] for d in metadata['dimensions']]
+    e.variables = [v['name'] for v in metadata['data_variables']]
+    e._constraints_original = constraints.copy()
+    e._variables_original = list(e.variables)
+
+def griddap_request(server, dataset_id, metadata):
+    """
+    Creates a griddap `ERDDAP` object initialized from metadata. The protocol is set
+    after the dataset_id so erddapy does not fetch the .ncml on assignment.
+    """
+    from erddapy import ERDDAP
+
+    e = ERDDAP(server=server)
+    e.dataset_id = dataset_id
+    e.protocol = 'griddap'
+    griddap_initialize(e, metadata)
+    return e
+
+def fetch_data_bytes(url, cache=None, job=None):
+    """
+    Returns the body of an ERDDAP data request, served from `cache` (a ResponseCache)
+    when possible and stored in it after a network fetch. Progress is reported to
+    `job` (a jobs.DownloadJob) when one is given.
+    """
+    url = http_client.erddap_url(url)
+    if cache is not None:
+        body = cache.get(url)
+        if body is not None:
+            if job is not None:
+                job.advance(len(body))
+            return body
+    body = http_client.fetch_bytes(url, job=job)
+    if cache is not None:
+        cache.put(url, body)
+    return body
+
+def fetch_dataframe(e, response='csvp', cache=None, job=None, **pandas_kwargs):
+    """Downloads the request held by an `ERDDAP` object into a DataFrame."""
+    import pandas as pd
+
+    body = fetch_data_bytes(e.get_download_url(response=response), cache, job)
+    with telemetry.phase('parse'):
+        return pd.read_csv(io.BytesIO(body), **pandas_kwargs)
+
+def fetch_parquet(e, cache=None, job=None):
+    """Downloads the request held by an `ERDDAP` object as Parquet into a DataFrame."""
+    import pandas as pd
+
+    body = fetch_data_bytes(e.get_download_url(response='parquet'), cache, job)
+    with telemetry.phase('parse'):
+        return pd.read_parquet(io.BytesIO(body))
+
+def fetch_xarray(e, cache=None, job=None):
+    """Downloads the request held by an `ERDDAP` object as NetCDF (ncCF for tabledap)."""
+    response = 'nc' if e.protocol == 'griddap' else 'ncCF'
+    return open_netcdf_bytes(fetch_data_bytes(e.get_download_url(response=response), cache, job))
+
+def open_netcdf_bytes(content):
+    """Loads a NetCDF response body into an in-memory xarray.Dataset."""
+    import xarray as xr
+    from netCDF4 import Dataset
+
+    # The netCDF/HDF5 C libraries are not thread-safe; parallel downloads decode one at a time.
+    with _NETCDF_LOCK, telemetry.phase('parse'):
+        nc = Dataset('response.nc', memory=content)
+        try:
+            return xr.open_dataset(xr.backends.NetCDF4DataStore(nc)).load()
+        finally:
+            nc.close()
+
 def build_search_url(server, query, page=1, items_per_page=10, 
                      min_lon=None, max_lon=None, min_lat=None, max_lat=None,
                      min_time=None, max_time=None):
@@ -93,13 +275,47 @@ def build_search_url(server, query, page=1, items_per_page=10,
     return f"{base_url}?{query_string}"
 
 
-def search_datasets(server, query, page=1, items_per_page=10):
+def build_opensearch_url(server, query, page=1, items_per_page=1):
+    """
+    Build an ERDDAP OpenSearch 1.1 (RSS) URL. Its response reports the total number
+    of matches in <opensearch:totalResults>, so a one-item page is enough to count.
+    """
+    base_url = f"{server.rstrip('/')}/opensearch1.1/search"
+    params = [
+        f"searchTerms={urllib.parse.quote_plus(query)}",
+        f"page={page}",
+        f"itemsPerPage={items_per_page}",
+        "format=rss"
+    ]
+    return f"{base_url}?{'&'.join(params)}"
+
+
+def search_datasets(server, query, page=1, items_per_page=10, timeout=None, **filters):
     """
     Fetch one page of search results as records. Returns a list of dictionaries.
+    `timeout` overrides the HTTP client's request timeout (seconds).
+    Extra keyword arguments are the bbox/time filters accepted by build_search_url.
     """
-    url = build_search_url(server, query, page, items_per_page)
     try:
-        df = pd.read_csv(url)
+        return fetch_search_records(server, query, page, items_per_page, timeout=timeout, **filters)
+    except Exception:
+        return [] # already recorded on the 'search' span
+
+def fetch_search_records(server, query, page=1, items_per_page=10, timeout=None, client=None, **filters):
+    """
+    Like search_datasets, but a failed request (timeout, connection or HTTP error)
+    raises instead of looking like an empty page. A search without matches still
+    returns []. `client` replaces the shared http_client.HttpClient.
+    """
+    url = build_search_url(server, query, page, items_per_page, **filters)
+    with telemetry.span('search', name=query, url=url):
+        try:
+            df = http_client.read_csv(url, timeout=timeout, client=client)
+        except requests.HTTPError as err:
+            # ERDDAP answers a search without matches with a 404
+            if err.response is not None and err.response.status_code == 404 and 'no matching results' in err.response.text.lower():
+                return []
+            raise
         # Standardize column names
         df.columns = [col.strip() for col in df.columns]
         rename_map = {
@@ -109,16 +325,49 @@ def search_datasets(server, query, page=1, items_per_page=10):
         }
         df = df.rename(columns=rename_map)
         return df.to_dict(orient="records")
-    except Exception:
-        return []
 
-def get_total_count(server, query):
+def count_cache_key(server, query, **filters):
+    """Key identifying one (server, query, bbox/time filter) combination."""
+    return (server.rstrip('/'), query.strip(), tuple(sorted((k, v) for k, v in filters.items() if v not in (None, ''))))
+
+def _count_from_opensearch(server, query):
+    """Reads totalResults from a one-item OpenSearch page. Returns None if unavailable."""
+    try:
+        response = http_client.get(build_opensearch_url(server, query), timeout=30)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    match = re.search(r"totalResults>\s*(\d+)\s*<", response.text)
+    return int(match.group(1)) if match else None
+
+def get_total_count(server, query, cache=None, **filters):
     """
-    Get total count by fetching a large page.
+    Get the total number of matches for a search.
+
+    Unfiltered searches read the total from a minimal OpenSearch response; bbox/time
+    filtered searches (which OpenSearch cannot express) and servers without OpenSearch
+    fall back to counting the rows of one large advanced.csv page. Results are stored
+    in `cache` (a dict) so repeated counts of the same search are free.
     """
-    url = build_search_url(server, query, page=1, items_per_page=100000)
-    try:
-        df = pd.read_csv(url, comment='#')
-        return len(df)
-    except Exception:
-        return 0
\ No newline at end of file
+    key = count_cache_key(server, query, **filters)
+    if cache is not None and key in cache:
+        return cache[key]
+    with telemetry.span('count', name=query):
+        return _get_total_count(server, query, key, cache, **filters)
+
+def _get_total_count(server, query, key, cache, **filters):
+    total = None
+    if not key[2]:
+        total = _count_from_opensearch(server, query)
+    if total is None:
+        url = build_search_url(server, query, page=1, items_per_page=100000, **filters)
+        try:
+            df = http_client.read_csv(url, comment='#')
+            total = len(df)
+        except Exception as err:
+            telemetry.note_error(err)
+            return 0
+
+    if cache is not None:
+        cache[key] = total
+    return total
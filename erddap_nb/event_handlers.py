@@ -1,12 +1,11 @@
 # erddap_nb/event_handlers.py
 
-import pandas as pd
-import requests
+import os
 from IPython.display import display, clear_output
-from erddapy import ERDDAP
 from functools import partial
 import ipywidgets as widgets
-import xarray as xr
+
+from . import telemetry
 
 # --- Helper Functions to Read UI State ---
 
@@ -16,255 +15,390 @@ def get_griddap_selected_vars(widgets):
 
 def get_griddap_constraints(widgets):
     """Reads constraints from the griddap UI widgets."""
-    constraints = {}
-    for name, widget_tuple in widgets['constraint_widgets'].items():
-        start_val, stop_val = widget_tuple[0].value, widget_tuple[1].value
-        if start_val is not None and str(start_val) != '':
-            constraints[f'{name}>='] = start_val
-        if stop_val is not None and str(stop_val) != '':
-            constraints[f'{name}<='] = stop_val
-    return constraints
+    from .client import griddap_constraints
+    return griddap_constraints({name: (pair[0].value, pair[1].value) for name, pair in widgets['constraint_widgets'].items()})
 
 def get_tabledap_selected_vars(widgets):
     """Helper to get selected data variables from the tabledap UI."""
     return [name for name, c in widgets['constraint_widgets'].items() if c.get('select') and c['select'].value]
 
+def get_tabledap_filters(widgets):
+    """Reads the filter controls of every selected tabledap variable into plain specs (see client.tabledap_constraints)."""
+    filters = {}
+    for name, c_widget_map in widgets['constraint_widgets'].items():
+        if c_widget_map.get('select') and c_widget_map['select'].value:
+            filters[name] = {key: getattr(control, 'value', control) for key, control in c_widget_map.items() if key not in ('select', 'slider')}
+    return filters
+
 def get_tabledap_constraints(widgets, metadata):
     """
     Builds a constraint dictionary for erddapy, using pre-encoded operators
     in the dictionary keys and skipping constraints for default values.
     """
-    constraints = {}
-    # This map provides the URL-encoded operators that erddapy expects in the dictionary key.
-    op_map = {'=': '=', '>=': '>=', '<=': '<=', '>': '>', '<': '<', '!=': '!=', '=~': '=~'}
-    
-    all_variables_map = metadata.get('all_variables_map', {})
-    global_attrs = metadata.get('global_attrs', {})
-
-    for name, c_widget_map in widgets['constraint_widgets'].items():
-        if not (c_widget_map.get('select') and c_widget_map['select'].value):
-            continue
-
-        # Case 1: Range-based controls with selectable operators
-        if 'op_start' in c_widget_map:
-            start_op = c_widget_map.get('op_start').value
-            start_val = c_widget_map.get('start').value
-            is_time = c_widget_map.get('is_time', False)
-            
-            default_min, default_max = None, None
-            if is_time:
-                default_min = global_attrs.get('time_coverage_start')
-                default_max = global_attrs.get('time_coverage_end')
-            else:
-                var_info = all_variables_map.get(name, {})
-                actual_range_str = str(var_info.get('actual_range', ''))
-                range_parts = [p.strip() for p in actual_range_str.split(',')]
-                if len(range_parts) == 2:
-                    default_min, default_max = range_parts[0], range_parts[1]
-
-            if start_val is not None and str(start_val).strip() != '':
-                is_default_start = False
-                if default_min is not None:
-                    if not is_time:
-                        try:
-                            if float(start_val) == float(default_min): is_default_start = True
-                        except (ValueError, TypeError): pass
-                    elif start_val == default_min:
-                        is_default_start = True
-                
-                if not is_default_start:
-                    key = f"{name}{op_map.get(start_op, start_op)}"
-                    constraints[key] = start_val
-            
-            if start_op == '=':
-                continue
-                
-            stop_op = c_widget_map.get('op_stop').value
-            stop_val = c_widget_map.get('stop').value
-
-            if stop_val is not None and str(stop_val).strip() != '':
-                is_default_stop = False
-                if default_max is not None:
-                    if not is_time:
-                        try:
-                            if float(stop_val) == float(default_max): is_default_stop = True
-                        except (ValueError, TypeError): pass
-                    elif stop_val == default_max:
-                        is_default_stop = True
-                
-                if not is_default_stop:
-                    key = f"{name}{op_map.get(stop_op, stop_op)}"
-                    constraints[key] = stop_val
-        
-        # Case 2: Single value (string inputs)
-        elif 'op' in c_widget_map and 'val' in c_widget_map and c_widget_map['val'].value:
-            op = c_widget_map['op'].value
-            raw_val = c_widget_map['val'].value
-            final_val = raw_val
-
-            # This correctly handles all number formats from the text box.
-            try:
-                num_val = float(raw_val)
-                # If it's a whole number, store it as an integer.
-                if num_val.is_integer():
-                    final_val = int(num_val)
-                else:
-                    final_val = num_val
-            except ValueError:
-                # If conversion fails, it's a true string, so we pass it as-is.
-                pass
-
-            key = f"{name}{op_map.get(op, op)}"
-            constraints[key] = final_val
-            
-    return constraints
+    from .client import tabledap_constraints
+    return tabledap_constraints(get_tabledap_filters(widgets), metadata)
+
+def get_client(app_state):
+    """Returns the session's headless Client, creating one from the app's caches if needed."""
+    from .client import Client
+    if app_state.get('client') is None:
+        app_state['client'] = Client(
+            metadata_cache=app_state.get('metadata_cache'), response_cache=app_state.get('response_cache'),
+            max_download_bytes=app_state.get('max_download_bytes'), data_dir=app_state.get('data_dir')
+        )
+    return app_state['client']
+
+def build_griddap_query(widgets, server, dataset_id, variables=None):
+    """Describes the griddap UI's current selection as a client.Query."""
+    from .client import Query
+    return Query(
+        server, dataset_id, get_griddap_selected_vars(widgets) if variables is None else variables,
+        get_griddap_constraints(widgets), response=widgets['filetype_dd'].value, name=widgets['df_name_input'].value or None,
+        protocol='griddap', tiled=widgets['tiled_cb'].value, tile_bytes=widgets['tile_mb'].value * 1024 * 1024,
+        split_space=widgets['split_space_cb'].value, zarr=widgets['zarr_cb'].value,
+        max_points=widgets['preview_points'].value if widgets['preview_cb'].value else None
+    )
+
+def build_tabledap_query(widgets, server, dataset_id, metadata, variables=None):
+    """Describes the tabledap UI's current selection as a client.Query."""
+    import pandas as pd
+    from .client import Query
+    return Query(
+        server, dataset_id, get_tabledap_selected_vars(widgets) if variables is None else variables,
+        get_tabledap_constraints(widgets, metadata), response=widgets['filetype_dd'].value, name=widgets['df_name_input'].value or None,
+        protocol='tabledap', partitioned=widgets['partitioned_cb'].value, window=pd.Timedelta(days=widgets['window_days'].value)
+    )
+
+# --- Download Size Estimates ---
+
+def on_griddap_selection_changed(widgets, metadata, app_state, change=None):
+    """Refreshes the estimated size shown next to the griddap Download button."""
+    from . import sizing
+    selected_vars = get_griddap_selected_vars(widgets)
+    if not selected_vars:
+        widgets['size_label'].value = "<i>Select variables to estimate the download size</i>"
+        return
+    constraints = get_griddap_constraints(widgets)
+    detail = ""
+    if widgets['preview_cb'].value:
+        steps = sizing.preview_steps(metadata, constraints, widgets['preview_points'].value)
+        constraints.update(steps)
+        detail = f" (preview, {describe_steps(steps)})"
+    estimate = sizing.estimate_griddap_bytes(metadata, constraints, selected_vars)
+    widgets['size_label'].value = sizing.describe_estimate(estimate, app_state.get('max_download_bytes'), detail)
+
+def describe_steps(steps):
+    """'latitude every 8, longitude every 15' for the strided dimensions of {'<name>_step': stride}."""
+    strided = [f"{key[:-len('_step')]} every {int(step)}" for key, step in steps.items() if int(step) > 1]
+    return ', '.join(strided) or "full resolution"
+
+def estimate_tabledap_download(widgets, server, dataset_id, app_state):
+    """
+    Probes the server for the row count of the current tabledap selection.
+    Returns (rows, bytes); the result is remembered for the download guardrail.
+    """
+    query = build_tabledap_query(widgets, server, dataset_id, app_state['metadata'])
+    rows, n_bytes = get_client(app_state).estimate(query, app_state['metadata'])
+    widgets['_size_estimate'] = ((tuple(query.variables), tuple(sorted(query.constraints.items()))), rows, n_bytes)
+    return rows, n_bytes
+
+def on_tabledap_estimate_clicked(widgets, server, dataset_id, output_area, app_state, b):
+    from . import sizing
+    if not get_tabledap_selected_vars(widgets):
+        widgets['size_label'].value = "<i>Select variables to estimate the download size</i>"
+        return
+    widgets['size_label'].value = "<i>Estimating...</i>"
+    try:
+        rows, n_bytes = estimate_tabledap_download(widgets, server, dataset_id, app_state)
+    except Exception as err:
+        widgets['size_label'].value = "<i>Size unknown</i>"
+        with output_area:
+            print(f"Failed to estimate the download size: {err}")
+        return
+    detail = "" if rows is None else f" ({rows:,} rows)"
+    widgets['size_label'].value = sizing.describe_estimate(n_bytes, app_state.get('max_download_bytes'), detail)
 
 # --- Graph and Download Button Handlers ---
 
-def on_griddap_graph_clicked(widgets, server, dataset_id, output_area, b):
+def get_graph_renderer(widgets, output_area, app_state):
+    """Returns the background GraphRenderer of a dataset UI, creating it on first use."""
+    from .rendering import GraphRenderer
+    if widgets.get('_graph_renderer') is None:
+        def show(image, cached):
+            widgets['graph_display'].value = image
+            output_area.append_stdout("Graph updated (cached).\n" if cached else "Graph updated.\n")
+        def fail(ex):
+            output_area.append_stdout(f"Failed to generate graph: {ex}\n")
+        widgets['_graph_renderer'] = GraphRenderer(show, fail, graph_cache=app_state.get('graph_cache'))
+    return widgets['_graph_renderer']
+
+def on_graph_cancel_clicked(widgets, output_area, app_state, b):
+    get_graph_renderer(widgets, output_area, app_state).cancel()
+    with output_area:
+        clear_output(); print("Graph rendering cancelled.")
+
+def on_graph_live_changed(graph_handler, widgets, change=None):
+    """Observer for graph and constraint widgets: re-renders (debounced) while live mode is on."""
+    from .rendering import LIVE_UPDATE_DELAY
+    if widgets['live_graph_cb'].value:
+        graph_handler(None, delay=LIVE_UPDATE_DELAY)
+
+def render_local_graph(widgets, output_area, app_state, delay=0):
+    """Draws the graph from the saved entry chosen in 'Plot from' instead of asking ERDDAP for a .png."""
+    from . import plotting
+    renderer = get_graph_renderer(widgets, output_area, app_state)
+    name = widgets['plot_source'].value
+    with output_area:
+        clear_output(); print(f"Plotting '{name}' locally...")
+        entry = app_state['dataframes'].get(name)
+        if entry is None:
+            print(f"'{name}' is no longer saved."); return
+        settings = {
+            'x': widgets['x_axis'].value, 'y': widgets['y_axis'].value, 'color': widgets['color_var'].value,
+            'kind': widgets['graph_type'].value, 'palette': widgets['palette'].value,
+            'reverse_x': widgets['reverse_x'].value, 'reverse_y': widgets['reverse_y'].value
+        }
+        # Take the data now: the store may spill the entry (dropping 'data') before the renderer thread runs.
+        data = entry['data']
+        def draw():
+            image, info = plotting.render(data, **settings)
+            output_area.append_stdout(f"{plotting.describe_plot(info)}\n")
+            return image
+        renderer.submit(draw, delay=delay)
+
+def on_griddap_graph_clicked(widgets, server, dataset_id, output_area, metadata, app_state, b, delay=0):
+    renderer = get_graph_renderer(widgets, output_area, app_state)
+    renderer.cancel()
+    if widgets['plot_source'].value:
+        return render_local_graph(widgets, output_area, app_state, delay)
     with output_area:
         clear_output(); print("Generating griddap graph...")
         try:
-            e = ERDDAP(server=server, protocol='griddap')
-            e.dataset_id = dataset_id
-            constraints = get_griddap_constraints(widgets)
-            if widgets['graph_type'].value == 'surface' and 'time>=' in constraints:
-                constraints['time<='] = constraints['time>=']
-            e.griddap_initialize(); e.constraints.update(constraints)
             primary_var = widgets['color_var'].value if widgets['color_var'].value else widgets['y_axis'].value
             if not primary_var:
                 print("Please select a Y-Axis or Color variable to plot."); return
-            e.variables = [primary_var]
-            graph_url = e.get_download_url(response="png")
-            graph_url += f"&.draw={widgets['graph_type'].value}"
-            vars_list = [widgets['x_axis'].value, widgets['y_axis'].value]
-            if widgets['color_var'].value: vars_list.append(widgets['color_var'].value)
-            graph_url += f"&.vars={'|'.join(vars_list)}"
-            if widgets['palette'].value != 'Default': graph_url += f"&.colorBar={widgets['palette'].value}"
-            if widgets['reverse_x'].value: graph_url += '&.xRange=||false'
-            if widgets['reverse_y'].value: graph_url += '&.yRange=||false'
-            response = requests.get(graph_url); response.raise_for_status()
-            widgets['graph_display'].value = response.content; print("Graph updated.")
+            query = build_griddap_query(widgets, server, dataset_id, variables=[primary_var])
+            graph_url = get_client(app_state).graph_url(
+                query, widgets['graph_type'].value, [widgets['x_axis'].value, widgets['y_axis'].value, widgets['color_var'].value],
+                palette=widgets['palette'].value, reverse_x=widgets['reverse_x'].value, reverse_y=widgets['reverse_y'].value, metadata=metadata
+            )
+            renderer.submit(graph_url, delay=delay)
         except Exception as ex:
             print(f"Failed to generate graph: {ex}")
 
-def on_tabledap_graph_clicked(widgets, server, dataset_id, output_area, metadata, b):
+def on_tabledap_graph_clicked(widgets, server, dataset_id, output_area, metadata, app_state, b, delay=0):
+    renderer = get_graph_renderer(widgets, output_area, app_state)
+    renderer.cancel()
+    if widgets['plot_source'].value:
+        return render_local_graph(widgets, output_area, app_state, delay)
     with output_area:
         clear_output(); print("Generating tabledap graph...")
         try:
-            e = ERDDAP(server=server, protocol='tabledap')
-            e.dataset_id = dataset_id
             plot_vars = [v for v in [widgets['x_axis'].value, widgets['y_axis'].value, widgets['color_var'].value] if v]
             if not plot_vars:
                 print("Please select at least an X-Axis variable."); return
-            e.variables = plot_vars
-            e.constraints = get_tabledap_constraints(widgets, metadata)
-            
-            graph_url = e.get_download_url(response="png")
-            graph_url += f"&.draw={widgets['graph_type'].value}"
-            if widgets['palette'].value != 'Default': graph_url += f"&.colorBar={widgets['palette'].value}"
-            if widgets['reverse_x'].value: graph_url += '&.xRange=||false'
-            if widgets['reverse_y'].value: graph_url += '&.yRange=||false'
-            
-            response = requests.get(graph_url); response.raise_for_status()
-            widgets['graph_display'].value = response.content; print("Graph updated.")
+            query = build_tabledap_query(widgets, server, dataset_id, metadata, variables=plot_vars)
+            graph_url = get_client(app_state).graph_url(
+                query, widgets['graph_type'].value, plot_vars,
+                palette=widgets['palette'].value, reverse_x=widgets['reverse_x'].value, reverse_y=widgets['reverse_y'].value, metadata=metadata
+            )
+            renderer.submit(graph_url, delay=delay)
         except Exception as ex:
             print(f"Failed to generate graph: {ex}")
 
-def on_griddap_download_clicked(widgets, server, dataset_id, output_area, app_state, saved_dfs_placeholder, b):
-    from . import ui_builder
-    with output_area:
-        clear_output(); print("Building query and fetching griddap data...")
-        try:
-            e = ERDDAP(server=server, protocol='griddap')
-            e.dataset_id = dataset_id
-            selected_vars = get_griddap_selected_vars(widgets)
-            if not selected_vars:
-                print("Please select at least one data variable to download."); return
-
-            e.griddap_initialize()
-            e.variables = selected_vars
-            e.constraints.update(get_griddap_constraints(widgets))
+def get_download_queue(app_state):
+    """Returns the session's DownloadQueue, creating one if the app did not."""
+    from .jobs import DownloadQueue
+    if app_state.get('download_queue') is None:
+        app_state['download_queue'] = DownloadQueue()
+    return app_state['download_queue']
 
-            filetype = widgets.get('filetype_dd').value
-            df_name = widgets['df_name_input'].value
-            if not df_name:
-                df_name = f"{dataset_id}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}"
-
-            if filetype == 'csv' or filetype == 'parquet':
-                if filetype == 'csv':
-                    df = e.to_pandas(skiprows=(1,))
+def submit_download(name, work, output_area, app_state, saved_dfs_placeholder):
+    """
+    Queues `work(job)` as a background download and shows its progress row in the
+    output area. `work` returns a list of messages/objects that replace the output
+    once the job finishes.
+    """
+    from . import ui_builder
+    def finished(job):
+        if job.state == 'done':
+            output_area.outputs = ()
+            for item in job.result:
+                if isinstance(item, str):
+                    output_area.append_stdout(item + "\n")
                 else:
-                    url = e.get_download_url(response='parquet')
-                    df = pd.read_parquet(url)
+                    output_area.append_display_data(item)
+            ui_builder.update_saved_dfs_display(app_state, saved_dfs_placeholder, output_area)
+        elif job.state == 'failed':
+            output_area.append_stdout(f"Failed to fetch data: {job.error}\n")
+        else:
+            output_area.append_stdout(f"Download '{name}' cancelled.\n")
 
-                app_state['dataframes'][df_name] = {'data': df, 'source_format': filetype}
-                clear_output()
-                print(f"Success! DataFrame from {filetype.upper()} saved as '{df_name}'.")
-                display(df.head())
-                print("--- Summary Statistics ---")
-                display(df.describe())
-
-            elif filetype == 'nc':
-                ds = e.to_xarray()
-                app_state['dataframes'][df_name] = {'data': ds, 'source_format': 'netcdf'}
-                clear_output()
-                print(f"Success! Xarray Dataset saved as '{df_name}'.")
-                display(ds)
+    def run(job):
+        with telemetry.span('download', name=name):
+            return work(job)
 
-            else: # json, geotiff, etc.
-                url = e.get_download_url(response=filetype)
-                clear_output()
-                print(f"Success! Non-ingestable format requested. Download data directly from this link:\n{url}")
-                return
+    job = get_download_queue(app_state).submit(name, run, on_done=finished)
+    print(f"Queued download '{name}'.")
+    display(ui_builder.build_job_row(job))
+    return job
 
-            ui_builder.update_saved_dfs_display(app_state, saved_dfs_placeholder, output_area)
+def on_griddap_download_clicked(widgets, server, dataset_id, output_area, app_state, saved_dfs_placeholder, b):
+    with output_area:
+        clear_output(); print("Building query and fetching griddap data...")
+        try:
+            query = build_griddap_query(widgets, server, dataset_id)
+            if not query.variables:
+                print("Please select at least one data variable to download."); return
+            submit_griddap_download(widgets, query, output_area, app_state, saved_dfs_placeholder)
+        except Exception as err:
+            print(f"Failed to fetch data: {err}")
 
+def on_griddap_refine_clicked(widgets, output_area, app_state, saved_dfs_placeholder, b):
+    """Downloads the last griddap preview again at full resolution."""
+    preview = widgets.get('_preview_query')
+    with output_area:
+        clear_output()
+        if preview is None:
+            print("Download a preview first."); return
+        query = preview.full_resolution()
+        print(f"Fetching '{query.name}' at full resolution...")
+        try:
+            submit_griddap_download(widgets, query, output_area, app_state, saved_dfs_placeholder)
         except Exception as err:
             print(f"Failed to fetch data: {err}")
 
+def submit_griddap_download(widgets, query, output_area, app_state, saved_dfs_placeholder):
+    """Plans a griddap query against the size limit and queues it; a finished preview enables Refine."""
+    from .client import DownloadRefused, store_entry
+    metadata = app_state['metadata']
+    if widgets['to_file_cb'].value:
+        submit_file_download(query, metadata, output_area, app_state, saved_dfs_placeholder)
+        return
+    client = get_client(app_state)
+    try:
+        mode, note = client.plan(query, metadata)
+    except DownloadRefused as refused:
+        print(refused); return
+    if note:
+        print(note)
+    if mode == 'link':
+        url = client.url(query, metadata=metadata)
+        clear_output()
+        print(f"Success! Non-ingestable format requested. Download data directly from this link:\n{url}")
+        return
+
+    def work(job):
+        data = client.fetch(query, metadata, job=job, mode=mode)
+        app_state['dataframes'][query.name] = store_entry(data, query.response)
+        messages = []
+        if query.max_points:
+            steps = {k: v for k, v in client.request(query, metadata).constraints.items() if k.endswith('_step')}
+            widgets['_preview_query'] = query
+            widgets['refine_button'].disabled = False
+            messages.append(f"Preview ({describe_steps(steps)}). Click 'Refine' to fetch it at full resolution "
+                            f"as '{query.full_resolution().name}'.")
+        if mode == 'zarr':
+            return [f"Success! Data written to '{client.zarr_path(query)}' and opened lazily as '{query.name}' "
+                    "(dask-backed; slice or reduce it, then .compute()/.load()).", *messages, data]
+        if query.response == 'nc':
+            return [f"Success! Xarray Dataset saved as '{query.name}'.", *messages, data]
+        with telemetry.phase('summarize'):
+            summary = data.describe()
+        return [f"Success! DataFrame from {query.response.upper()} saved as '{query.name}'.", *messages, data.head(),
+                "--- Summary Statistics ---", summary]
+
+    submit_download(query.name, work, output_area, app_state, saved_dfs_placeholder)
+
+def submit_file_download(query, metadata, output_area, app_state, saved_dfs_placeholder):
+    """
+    Queues a download that streams the raw response to a file in the data directory
+    and registers a lazy handle to the file instead of the loaded data.
+    """
+    from .client import store_entry
+    from .lazy import LazyFile
+    from .sizing import format_bytes
+    client = get_client(app_state)
+
+    def work(job):
+        data = client.download(query, metadata=metadata, job=job)
+        app_state['dataframes'][query.name] = store_entry(data, query.response)
+        messages = [f"Success! {format_bytes(data.nbytes)} written to '{data.path}' and registered as '{query.name}' "
+                    "(not loaded; call .load() to read it)."]
+        if not isinstance(data, LazyFile) or data.file_format in LazyFile.TABULAR:
+            messages.append(data.head())
+        return messages
+
+    submit_download(query.name, work, output_area, app_state, saved_dfs_placeholder)
+
+def submit_tabledap_sync(widgets, query, metadata, output_area, app_state, saved_dfs_placeholder):
+    """
+    Queues an incremental sync of the tabledap selection: the first run downloads it,
+    later runs under the same name append only rows newer than those already held.
+    """
+    from .client import store_entry
+    client = get_client(app_state)
+    if not widgets['df_name_input'].value:
+        query.name = f"{query.dataset_id}_sync"
+
+    def work(job):
+        data, report = client.sync(query, metadata, job=job)
+        entry = store_entry(data, 'parquet')
+        entry['sync'] = report
+        app_state['dataframes'][query.name] = entry
+        return [f"Synced '{query.name}': {report['new_rows']} new rows ({report['fetched_rows']} fetched, "
+                f"{report['duplicates']} already held) in {report['seconds']:.1f}s.",
+                f"Store holds {report['rows']} rows in {report['parts']} parts up to {report['max']} at '{data.path}'.",
+                data.head()]
+
+    submit_download(query.name, work, output_area, app_state, saved_dfs_placeholder)
+
 def on_tabledap_download_clicked(widgets, server, dataset_id, output_area, app_state, saved_dfs_placeholder, b):
-    from . import ui_builder
+    from .client import DownloadRefused, store_entry
     with output_area:
         clear_output(); print("Building query and fetching tabledap data...")
         try:
-            e = ERDDAP(server=server, protocol='tabledap')
-            e.dataset_id = dataset_id
-            selected_vars = get_tabledap_selected_vars(widgets)
-            if not selected_vars:
+            metadata = app_state['metadata']
+            query = build_tabledap_query(widgets, server, dataset_id, metadata)
+            if not query.variables:
                 print("Please select at least one variable to download."); return
-            e.variables = selected_vars
-            e.constraints = get_tabledap_constraints(widgets, app_state['metadata'])
-
-            filetype = widgets.get('filetype_dd').value
-            df_name = widgets['df_name_input'].value
-            if not df_name:
-                df_name = f"{dataset_id}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}"
-
-            if filetype == 'csv':
-                df = e.to_pandas()
-                app_state['dataframes'][df_name] = {'data': df, 'source_format': 'csv'}
-            elif filetype == 'parquet':
-                url = e.get_download_url(response='parquet')
-                df = pd.read_parquet(url)
-                app_state['dataframes'][df_name] = {'data': df, 'source_format': 'parquet'}
-            elif filetype == 'nc':
-                ds = e.to_xarray()
-                app_state['dataframes'][df_name] = {'data': ds, 'source_format': 'netcdf'}
-            else:
-                url = e.get_download_url(response=filetype)
+
+            # A size from "Estimate Size" for this exact selection saves plan() its own probe.
+            estimate_key, _, estimate = widgets.get('_size_estimate', (None, None, None))
+            if estimate_key == (tuple(query.variables), tuple(sorted(query.constraints.items()))):
+                query.estimate = estimate
+            if widgets.get('sync_cb') is not None and widgets['sync_cb'].value:
+                submit_tabledap_sync(widgets, query, metadata, output_area, app_state, saved_dfs_placeholder)
+                return
+            if widgets['to_file_cb'].value:
+                submit_file_download(query, metadata, output_area, app_state, saved_dfs_placeholder)
+                return
+            client = get_client(app_state)
+            try:
+                mode, note = client.plan(query, metadata)
+            except DownloadRefused as refused:
+                print(refused); return
+            if note:
+                print(note)
+            if mode == 'link':
+                url = client.url(query, metadata=metadata)
                 clear_output()
                 print(f"Success! Non-ingestable format requested. Download data directly from this link:\n{url}")
                 return
 
-            clear_output()
-            print(f"Success! Data saved to memory as '{df_name}'.")
-            if 'data' in app_state['dataframes'][df_name]:
-                 display(app_state['dataframes'][df_name]['data'].head() if filetype != 'nc' else app_state['dataframes'][df_name]['data'])
-                 print("--- Summary Statistics ---")
-                 display(app_state['dataframes'][df_name]['data'].describe() if filetype != 'nc' else app_state['dataframes'][df_name]['data'])
+            def work(job):
+                data = client.fetch(query, metadata, job=job, mode=mode)
+                app_state['dataframes'][query.name] = store_entry(data, query.response)
+                if query.response == 'nc' and mode != 'partitioned':
+                    return [f"Success! Data saved to memory as '{query.name}'.", data, "--- Summary Statistics ---", data]
+                with telemetry.phase('summarize'):
+                    summary = data.describe()
+                if mode == 'partitioned':
+                    return [f"Success! Data written to '{data.path}' and registered as '{query.name}'.", data.head(),
+                            "--- Summary Statistics ---", summary]
+                return [f"Success! Data saved to memory as '{query.name}'.", data.head(), "--- Summary Statistics ---", summary]
 
-            ui_builder.update_saved_dfs_display(app_state, saved_dfs_placeholder, output_area)
+            submit_download(query.name, work, output_area, app_state, saved_dfs_placeholder)
 
         except Exception as err:
             print(f"Failed to fetch data: {err}")
@@ -278,11 +412,16 @@ def on_confirm_save_clicked(b, df_name, app_state, filename_input, output_area):
         return
 
     try:
+        from .lazy import LazyFile
         data_to_save = app_state['dataframes'][df_name]['data']
         source_format = app_state['dataframes'][df_name]['source_format']
-        if source_format == 'csv': data_to_save.to_csv(filename, index=False)
-        elif source_format == 'parquet': data_to_save.to_parquet(filename)
-        elif source_format == 'netcdf': data_to_save.to_netcdf(filename)
+        with telemetry.span('save', name=df_name, url=filename) as current, telemetry.phase('write'):
+            if isinstance(data_to_save, LazyFile): data_to_save.save(filename) # already in its file format
+            elif source_format == 'csv': data_to_save.to_csv(filename, index=False)
+            elif source_format == 'parquet': data_to_save.to_parquet(filename)
+            elif source_format == 'netcdf': data_to_save.to_netcdf(filename)
+            if current is not None and os.path.isfile(filename):
+                current.bytes = os.path.getsize(filename)
         
         b.description = "Saved!"; b.button_style = ''; b.disabled = True
         filename_input.disabled = True
@@ -292,8 +431,12 @@ def on_confirm_save_clicked(b, df_name, app_state, filename_input, output_area):
 
 def on_save_requested(b, df_name, app_state, save_options_placeholder, output_area):
     save_options_placeholder.children = []
-    source_format = app_state['dataframes'].get(df_name, {}).get('source_format', 'bin')
+    from .lazy import LazyFile
+    entry = app_state['dataframes'].get(df_name, {})
+    source_format = entry.get('source_format', 'bin')
     default_filename = f"{df_name}.{source_format if source_format != 'bin' else 'nc'}"
+    if isinstance(entry.get('data'), LazyFile):
+        default_filename = f"{df_name}.{entry['data'].extension}"
     filename_input = widgets.Text(value=default_filename, description="Filename:", layout=widgets.Layout(width='auto'))
     confirm_button = widgets.Button(description="Confirm Save", button_style='primary')
     confirm_button.on_click(partial(on_confirm_save_clicked, df_name=df_name, app_state=app_state, filename_input=filename_input, output_area=output_area))
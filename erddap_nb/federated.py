@@ -0,0 +1,188 @@
+# erddap_nb/federated.py
+
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import erddap_utils, http_client
+
+SERVER_TIMEOUT = 15 # seconds one server may take to answer a search request
+SEARCH_DEADLINE = 60 # seconds after which servers that have not answered are given up on
+
+def _terms(query):
+    return [term for term in re.split(r'\W+', query.lower()) if term]
+
+def score_result(record, terms, position):
+    """
+    Relevance of one search record: query terms found in the title count most, then
+    in the dataset ID and institution. `position` (the server's own ranking) breaks
+    ties, and datasets mirrored on several servers get a small bonus.
+    """
+    title = str(record.get('title', '')).lower()
+    dataset_id = str(record.get('dataset_id', '')).lower()
+    institution = str(record.get('institution', '')).lower()
+    score = sum(3 * (term in title) + 2 * (term in dataset_id) + (term in institution) for term in terms)
+    return score + 1.0 / (1 + position) + 0.25 * len(record.get('mirrors', ()))
+
+class FederatedSearch:
+    """
+    Runs one keyword search against many ERDDAP servers at once.
+
+    Every server is queried on a worker thread, without retries, and must answer
+    within `timeout` seconds; servers whose request fails or answers late are
+    listed in `failed` instead of counting as empty answers. Results
+    are merged as they arrive, de-duplicated by dataset ID (copies on other servers
+    are kept in the record's 'mirrors') and ranked with score_result. `on_update(search)`
+    is called from a worker thread as servers answer, at most every `min_interval`
+    seconds, and once more when the search finishes or passes its deadline.
+    """
+
+    def __init__(self, servers, query, items_per_page=20, timeout=SERVER_TIMEOUT, deadline=SEARCH_DEADLINE,
+                 max_workers=16, on_update=None, min_interval=0.5):
+        self.servers = dict(servers) # name -> URL
+        self.query = query
+        self.items_per_page = items_per_page
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_workers = max_workers
+        self.on_update = on_update
+        self.min_interval = min_interval
+        self.answered = {} # name -> number of results
+        self.failed = {} # name -> error message
+        self.started = None
+        self.done = False
+        self.cancelled = False
+        self._records = {} # dataset_id -> merged record
+        self._terms = _terms(query)
+        self._executor = None
+        self._client = None
+        self._timers = []
+        self._last_notify = 0.0
+        self._flush_pending = False
+        self._lock = threading.Lock()
+        self._notify_lock = threading.Lock()
+
+    # --- Control ---
+    def start(self):
+        self.started = time.monotonic()
+        # A client of its own: the shared one retries with backoff, which would stretch the per-server timeout.
+        self._client = http_client.HttpClient(max_retries=0, pool_maxsize=self.max_workers, timeout=self.timeout)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='erddap_nb_federated')
+        for name, url in self.servers.items():
+            self._executor.submit(self._search_one, name, url)
+        self._executor.shutdown(wait=False)
+        self._schedule(self.deadline, self._finish)
+        return self
+
+    def cancel(self):
+        """Stops reporting: pending servers are skipped and late answers are ignored."""
+        with self._lock:
+            self.cancelled = True
+        for timer in self._timers:
+            timer.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._client is not None:
+            self._client.close()
+
+    def wait(self, timeout=None):
+        """Blocks until every server has answered or the deadline has passed."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while not (self.done or self.cancelled):
+            if end is not None and time.monotonic() >= end:
+                return False
+            time.sleep(0.05)
+        return True
+
+    # --- Results ---
+    @property
+    def pending(self):
+        """Names of servers that have neither answered nor failed yet."""
+        return [name for name in self.servers if name not in self.answered and name not in self.failed]
+
+    @property
+    def results(self):
+        """Merged, de-duplicated records, best first."""
+        with self._lock:
+            records = list(self._records.values())
+        return sorted(records, key=lambda r: score_result(r, self._terms, r['_position']), reverse=True)
+
+    @property
+    def elapsed(self):
+        return 0.0 if self.started is None else time.monotonic() - self.started
+
+    # --- Workers ---
+    def _search_one(self, name, url):
+        if self.cancelled or self.done:
+            return
+        start = time.monotonic()
+        try:
+            records = erddap_utils.fetch_search_records(url, self.query, page=1, items_per_page=self.items_per_page,
+                                                        timeout=self.timeout, client=self._client)
+            error = None
+        except Exception as err:
+            records, error = [], f"{type(err).__name__}: {err}"
+        # The request timeout applies per read; a server that trickles its answer must still finish in time.
+        if error is None and time.monotonic() - start > self.timeout:
+            records, error = [], f"no complete answer within {self.timeout}s"
+        with self._lock:
+            if self.cancelled or self.done:
+                return
+            if error is not None:
+                self.failed[name] = error
+            else:
+                self.answered[name] = len(records)
+            for position, record in enumerate(records):
+                dataset_id = record.get('dataset_id')
+                if not dataset_id:
+                    continue
+                existing = self._records.get(dataset_id)
+                if existing is None:
+                    self._records[dataset_id] = dict(record, server=url, server_name=name, mirrors=[], _position=position)
+                else:
+                    existing['mirrors'].append(name)
+                    existing['_position'] = min(existing['_position'], position)
+            finished = len(self.answered) + len(self.failed) == len(self.servers)
+        if finished:
+            self._finish()
+        else:
+            self._notify()
+
+    def _finish(self):
+        with self._lock:
+            if self.done or self.cancelled:
+                return
+            self.done = True
+        for timer in self._timers:
+            timer.cancel()
+        self._client.close()
+        self._notify(force=True)
+
+    def _schedule(self, delay, callback):
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+        self._timers.append(timer)
+
+    def _notify(self, force=False):
+        if self.on_update is None:
+            return
+        with self._notify_lock:
+            if self.cancelled:
+                return
+            wait = self.min_interval - (time.monotonic() - self._last_notify)
+            if not force and wait > 0:
+                # Throttled: make sure a trailing update still shows these results.
+                if not self._flush_pending:
+                    self._flush_pending = True
+                    self._schedule(wait, self._flush)
+                return
+            self._last_notify = time.monotonic()
+            self.on_update(self)
+
+    def _flush(self):
+        with self._notify_lock:
+            self._flush_pending = False
+        if not self.done:
+            self._notify(force=True)
@@ -0,0 +1,179 @@
+# erddap_nb/http_client.py
+
+import io
+import os
+import re
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import telemetry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 256 * 1024
+
+class HttpClient:
+    """
+    Shared HTTP layer for every request the package makes: one pooled keep-alive
+    session, exponential-backoff retries on 429/5xx, and a per-host semaphore that
+    caps how many requests run against one server at the same time.
+    """
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, pool_maxsize=16, max_per_host=4, timeout=120):
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        retry = Retry(
+            total=max_retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'HEAD']), respect_retry_after_header=True, raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _host_limit(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+    def get(self, url, **kwargs):
+        """GET with pooling, retries and the per-host concurrency limit."""
+        kwargs.setdefault('timeout', self.timeout)
+        with self._host_limit(url):
+            start = time.perf_counter()
+            response = self.session.get(url, **kwargs)
+            ttfb = response.elapsed.total_seconds()
+            telemetry.record_request(url, response.status_code, len(response.content), ttfb, time.perf_counter() - start - ttfb)
+            return response
+
+    @contextmanager
+    def stream(self, url, **kwargs):
+        """
+        Streaming GET. The per-host slot is held until the body has been consumed,
+        and the connection is returned to the pool when the block exits.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        with self._host_limit(url):
+            response = self.session.get(url, stream=True, **kwargs)
+            headers_at = time.perf_counter()
+            try:
+                yield response
+            finally:
+                n_bytes = response.raw.tell() if hasattr(response.raw, 'tell') else 0
+                response.close()
+                telemetry.record_request(url, response.status_code, n_bytes, response.elapsed.total_seconds(), time.perf_counter() - headers_at)
+
+    def close(self):
+        self.session.close()
+
+
+_client = HttpClient()
+_client_lock = threading.Lock()
+
+def configure(**options):
+    """
+    Replaces the shared client, e.g. configure(max_retries=5, max_per_host=2).
+    Accepts the HttpClient keyword arguments.
+    """
+    global _client
+    with _client_lock:
+        old, _client = _client, HttpClient(**options)
+    old.close()
+    return _client
+
+def get_client():
+    return _client
+
+# A '%XX' escape marks a URL that is already encoded; a literal '+' (e.g. a +00:00 offset) does not.
+_PERCENT_ESCAPE = re.compile(r'%[0-9A-Fa-f]{2}')
+
+def erddap_url(url):
+    """
+    Percent-encodes the query of an ERDDAP data URL the way erddapy does for
+    modern servers; URLs that are already encoded are left alone.
+    """
+    from erddapy.core.url import quote_url
+    if _PERCENT_ESCAPE.search(url):
+        return url
+    return quote_url(url)
+
+def get(url, **kwargs):
+    return _client.get(url, **kwargs)
+
+def stream(url, **kwargs):
+    return _client.stream(url, **kwargs)
+
+def fetch_bytes(url, job=None, client=None, **kwargs):
+    """
+    GETs a URL and returns the body, raising for HTTP errors. With a `job`
+    (a jobs.DownloadJob) the body is streamed in chunks that are reported to the job,
+    and the transfer stops as soon as the job is cancelled. `client` replaces the
+    shared HttpClient.
+    """
+    client = client or _client
+    if job is None:
+        response = client.get(url, **kwargs)
+        response.raise_for_status()
+        return response.content
+    job.check()
+    with client.stream(url, **kwargs) as response:
+        response.raise_for_status()
+        return read_body(response, job)
+
+def read_body(response, job=None):
+    """Reads the body of a streamed response, reporting each chunk to `job` if given."""
+    if job is None:
+        return response.content
+    if response.headers.get('Content-Length', '').isdigit():
+        job.expect(int(response.headers['Content-Length']))
+    chunks = []
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        job.advance(len(chunk))
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+def download_to_file(url, path, job=None, chunk_size=CHUNK_SIZE, **kwargs):
+    """
+    Streams the body of a GET to `path` in `chunk_size` pieces, so memory use stays at
+    one chunk whatever the size. The body is written to a '.partial' file that is
+    renamed into place once complete and removed on errors or when `job` (a
+    jobs.DownloadJob receiving the progress) is cancelled. Returns the bytes written.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.partial"
+    written = 0
+    try:
+        if job is not None:
+            job.check()
+        with _client.stream(url, **kwargs) as response:
+            response.raise_for_status()
+            if job is not None and response.headers.get('Content-Length', '').isdigit():
+                job.expect(int(response.headers['Content-Length']))
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+                    if job is not None:
+                        job.advance(len(chunk))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return written
+
+def read_csv(url, timeout=None, client=None, **pandas_kwargs):
+    import pandas as pd
+    kwargs = {'timeout': timeout} if timeout else {}
+    body = fetch_bytes(url, client=client, **kwargs)
+    with telemetry.phase('parse'):
+        return pd.read_csv(io.BytesIO(body), **pandas_kwargs)
@@ -0,0 +1,182 @@
+# erddap_nb/jobs.py
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class DownloadCancelled(Exception):
+    """Raised inside a download when its job has been cancelled."""
+
+class DownloadJob:
+    """
+    Progress and cancellation state of one background download.
+
+    Fetch helpers report streamed bytes with `expect()`/`advance()`; `advance()` raises
+    DownloadCancelled once `cancel()` has been called, which aborts the transfer at
+    the next chunk. Multi-part downloads (tiles, time windows) set `parts_total` and
+    call `part_done()` so progress can be reported without a Content-Length.
+    """
+
+    def __init__(self, name, work, on_done=None):
+        self.name = name
+        self.work = work
+        self.on_done = on_done
+        self.state = 'queued'
+        self.result = None
+        self.error = None
+        self.bytes_received = 0
+        self.total_bytes = None
+        self.parts_total = 0
+        self.parts_done = 0
+        self.started = None
+        self.finished = None
+        self.future = None
+        self._listeners = []
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._last_notify = 0.0
+
+    # --- Progress reporting (called from worker threads) ---
+    def expect(self, n_bytes):
+        """Adds the Content-Length of a response to the expected total."""
+        with self._lock:
+            self.total_bytes = (self.total_bytes or 0) + n_bytes
+        self._notify()
+
+    def advance(self, n_bytes):
+        self.check()
+        with self._lock:
+            self.bytes_received += n_bytes
+        self._notify(throttle=0.25)
+
+    def part_done(self):
+        with self._lock:
+            self.parts_done += 1
+        self._notify()
+
+    def check(self):
+        """Raises DownloadCancelled if the job has been cancelled."""
+        if self._cancelled.is_set():
+            raise DownloadCancelled(f"Download '{self.name}' was cancelled.")
+
+    # --- Control ---
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None and self.future.cancel():
+            self._finish('cancelled')
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    # --- Derived figures ---
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self):
+        """Bytes per second since the job started."""
+        return self.bytes_received / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def fraction(self):
+        """Completed fraction in [0, 1], or None when the size is unknown."""
+        if self.state == 'done':
+            return 1.0
+        if self.parts_total > 1:
+            return self.parts_done / self.parts_total
+        if self.total_bytes:
+            return min(1.0, self.bytes_received / self.total_bytes)
+        return None
+
+    @property
+    def eta(self):
+        """Estimated seconds remaining, or None."""
+        fraction = self.fraction
+        if not fraction or self.state != 'running':
+            return None
+        return self.elapsed * (1 - fraction) / fraction
+
+    # --- Listeners ---
+    def add_listener(self, callback):
+        """`callback(job)` is called on progress and state changes, possibly from a worker thread."""
+        self._listeners.append(callback)
+
+    def _notify(self, throttle=0.0):
+        now = time.monotonic()
+        if throttle and now - self._last_notify < throttle:
+            return
+        self._last_notify = now
+        for callback in list(self._listeners):
+            callback(self)
+
+    # --- Execution ---
+    def _run(self):
+        if self.cancelled:
+            self._finish('cancelled')
+            return
+        self.state, self.started = 'running', time.monotonic()
+        self._notify()
+        try:
+            self.result = self.work(self)
+        except DownloadCancelled:
+            self._finish('cancelled')
+        except Exception as err:
+            self.error = err
+            self._finish('failed')
+        else:
+            self._finish('done')
+
+    def _finish(self, state):
+        with self._lock:
+            if self.state in ('done', 'failed', 'cancelled'):
+                return
+            self.state, self.finished = state, time.monotonic()
+        self._notify()
+        if self.on_done:
+            self.on_done(self)
+
+class DownloadQueue:
+    """
+    Runs DownloadJobs on a small thread pool; jobs beyond `max_workers` wait their turn.
+    `on_change(queue)` callbacks fire when jobs are added or removed.
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self.jobs = []
+        self._listeners = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='erddap_nb_download')
+        self._lock = threading.Lock()
+
+    def submit(self, name, work, on_done=None):
+        """Queues `work(job)` and returns its DownloadJob. The return value of `work` becomes `job.result`."""
+        job = DownloadJob(name, work, on_done=on_done)
+        with self._lock:
+            self.jobs.append(job)
+            job.future = self._executor.submit(job._run)
+        self._changed()
+        return job
+
+    def clear_finished(self):
+        with self._lock:
+            self.jobs = [job for job in self.jobs if job.active]
+        self._changed()
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            job.cancel()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _changed(self):
+        for callback in list(self._listeners):
+            callback(self)
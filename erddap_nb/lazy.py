@@ -0,0 +1,181 @@
+# erddap_nb/lazy.py
+
+import os
+import shutil
+import pandas as pd
+
+class LazyParquet:
+    """
+    Handle to a Parquet file on disk that is only read when asked to.
+
+    It mimics the bits of the DataFrame API the UI relies on (head, describe,
+    to_csv, to_parquet); call `load()` to get the full pandas DataFrame.
+    `path` may also be a directory of part files (as written by an incremental
+    sync), which are read in name order as one table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def part_paths(self):
+        """The Parquet files behind the handle; files starting with '_' or '.' are skipped."""
+        if not os.path.isdir(self.path):
+            return [self.path]
+        return [os.path.join(self.path, name) for name in sorted(os.listdir(self.path))
+                if name.endswith('.parquet') and not name.startswith(('_', '.'))]
+
+    def _files(self):
+        import pyarrow.parquet as pq
+        return [pq.ParquetFile(path) for path in self.part_paths()]
+
+    def _file(self):
+        return self._files()[0]
+
+    @property
+    def num_rows(self):
+        return sum(f.metadata.num_rows for f in self._files())
+
+    @property
+    def num_row_groups(self):
+        return sum(f.metadata.num_row_groups for f in self._files())
+
+    @property
+    def columns(self):
+        return list(self._file().schema_arrow.names)
+
+    @property
+    def nbytes(self):
+        """Size of the file(s) on disk."""
+        return sum(os.path.getsize(path) for path in self.part_paths())
+
+    def load(self, columns=None, filters=None):
+        """Reads the file (or a column/row subset of it) into a DataFrame."""
+        return pd.read_parquet(self.path, columns=columns, filters=filters)
+
+    to_pandas = load
+
+    def iter_batches(self, batch_size=65536, columns=None):
+        """Yields the data as a sequence of DataFrames without loading it all."""
+        for f in self._files():
+            for batch in f.iter_batches(batch_size=batch_size, columns=columns):
+                yield batch.to_pandas()
+
+    def head(self, n=5):
+        for batch in self.iter_batches(batch_size=n):
+            return batch.head(n)
+        return pd.DataFrame(columns=self.columns)
+
+    def describe(self):
+        """Per-column count/nulls/min/max taken from the row-group statistics."""
+        metas = [f.metadata for f in self._files()]
+        summary = {}
+        for col_idx in range(metas[0].num_columns):
+            name = metas[0].schema.column(col_idx).name
+            count, nulls, mins, maxs = 0, 0, [], []
+            row_groups = [meta.row_group(rg_idx) for meta in metas for rg_idx in range(meta.num_row_groups)]
+            for row_group in row_groups:
+                column = row_group.column(col_idx)
+                count += column.num_values
+                stats = column.statistics
+                if stats is None:
+                    continue
+                if stats.null_count is not None:
+                    nulls += stats.null_count
+                if stats.has_min_max:
+                    mins.append(stats.min)
+                    maxs.append(stats.max)
+            summary[name] = {
+                'count': count - nulls, 'nulls': nulls,
+                'min': min(mins) if mins else None, 'max': max(maxs) if maxs else None
+            }
+        return pd.DataFrame(summary)
+
+    def to_parquet(self, filename, **kwargs):
+        if not os.path.isdir(self.path):
+            shutil.copyfile(self.path, filename)
+            return
+        import pyarrow.parquet as pq
+        files = self._files()
+        with pq.ParquetWriter(filename, files[0].schema_arrow) as writer:
+            for f in files:
+                for rg_idx in range(f.metadata.num_row_groups):
+                    writer.write_table(f.read_row_group(rg_idx))
+
+    def to_csv(self, filename, index=False, **kwargs):
+        header = True
+        with open(filename, 'w', newline='') as f:
+            for batch in self.iter_batches():
+                batch.to_csv(f, index=index, header=header, **kwargs)
+                header = False
+
+    def __repr__(self):
+        return f"<LazyParquet {self.path}: {self.num_rows} rows x {len(self.columns)} columns, {self.num_row_groups} row groups>"
+
+class LazyFile:
+    """
+    Handle to a raw response saved to disk as the server sent it (see
+    Client.download). Nothing is read until `load()`, which parses the formats
+    pandas/xarray understand (csv/tsv, csvp/tsvp, json, nc); other formats such as
+    geotiff or kml stay files to open with a suitable tool. `save()` copies the file.
+
+    `head()` and `columns` read csv/tsv files only as far as needed. ERDDAP's .json
+    is one table object, not JSON lines, so it is always parsed in full; only the
+    requested rows are turned into a DataFrame.
+    """
+
+    TABULAR = ('csv', 'csvp', 'tsv', 'tsvp', 'json')
+
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+
+    @property
+    def nbytes(self):
+        """Size of the file on disk."""
+        return os.path.getsize(self.path)
+
+    @property
+    def extension(self):
+        return os.path.splitext(self.path)[1].lstrip('.')
+
+    def _read_table(self, nrows=None):
+        fmt = self.file_format
+        if fmt == 'json':
+            import json
+            with open(self.path) as f:
+                table = json.load(f)['table']
+            rows = table['rows'] if nrows is None else table['rows'][:nrows]
+            return pd.DataFrame(rows, columns=table['columnNames'])
+        # .csv/.tsv carry a units row under the header; the 'p' variants put units in the header.
+        skiprows = [1] if fmt in ('csv', 'tsv') else None
+        return pd.read_csv(self.path, sep='\t' if fmt.startswith('tsv') else ',', skiprows=skiprows, nrows=nrows)
+
+    def load(self):
+        """Parses the file into a DataFrame or an xarray Dataset."""
+        if self.file_format in self.TABULAR:
+            return self._read_table()
+        if self.file_format in ('nc', 'ncCF'):
+            import xarray as xr
+            from .erddap_utils import _NETCDF_LOCK
+            with _NETCDF_LOCK:
+                with xr.open_dataset(self.path) as ds:
+                    return ds.load()
+        raise ValueError(f"'{self.file_format}' files are not loaded into Python; open {self.path} with a suitable tool.")
+
+    to_pandas = load
+
+    @property
+    def columns(self):
+        if self.file_format not in self.TABULAR:
+            raise ValueError(f"'{self.file_format}' files have no columns.")
+        return list(self._read_table(nrows=0).columns)
+
+    def head(self, n=5):
+        """The first rows of a tabular file; csv/tsv are read without loading the rest (json is parsed in full)."""
+        return self._read_table(nrows=n)
+
+    def save(self, filename):
+        shutil.copyfile(self.path, filename)
+
+    def __repr__(self):
+        return f"<LazyFile {self.path}: {self.file_format}, {self.nbytes} bytes>"
@@ -3,34 +3,98 @@
 import ipywidgets as widgets
 from IPython.display import display, clear_output
 from functools import partial
-from erddapy import servers 
+import os
+import tempfile
+import threading
+from . import http_client
+from . import telemetry
+from .cache import MetadataCache, SearchCache, ResponseCache, GraphCache, default_cache_dir
+from .store import DataStore
+from .jobs import DownloadQueue
+from .client import Client
+from .catalog import Catalog, variables_from_metadata
 
-def create_data_access_interface():
+PRESET_PROMPT = '--- Select a preset server ---'
+
+def load_server_list():
+    """
+    Preset server names -> URLs from erddapy's list of public servers. Older erddapy
+    builds that dict at import; newer versions download it in a function, falling
+    back here to the copy shipped with erddapy when the download fails.
+    """
+    from erddapy import servers
+    servers = getattr(servers, 'servers', servers) # erddapy 2+: a subpackage holding the function
+    if callable(servers):
+        try:
+            servers = servers()
+        except Exception:
+            return _bundled_server_list()
+    return {name: server.url for name, server in servers.items()}
+
+def _bundled_server_list():
+    import json
+    import erddapy.servers
+
+    with open(os.path.join(os.path.dirname(erddapy.servers.__file__), 'erddaps.json')) as f:
+        entries = json.load(f)
+    return {e['short_name'].lower(): e['url'] for e in entries if e.get('public') and e.get('short_name')}
+
+def create_data_access_interface(metadata_ttl=86400, cache_dir=None, max_download_mb=500, http_options=None,
+                                 response_cache_mb=2048, response_cache_compression=None, memory_budget_mb=4096,
+                                 graph_cache_mb=64, graph_disk_cache_mb=256, max_parallel_downloads=2,
+                                 server_search_timeout=15, catalog_ttl=86400, telemetry_records=500, telemetry_export=None,
+                                 show_telemetry=False):
     """
     Creates a master interface that allows searching for datasets and then
     loading a full data exploration UI.
+
+    metadata_ttl: seconds a cached info.csv is trusted before it is revalidated.
+    cache_dir: base directory for on-disk caches and partitioned downloads (defaults
+               to ~/.cache/erddap_nb), or False to keep caches in memory only.
+    max_download_mb: estimated size above which downloads are tiled/partitioned or refused
+                     (None disables the guardrail).
+    http_options: settings for the shared HTTP session, e.g. {'max_retries': 5, 'max_per_host': 2,
+                  'timeout': 300}; see http_client.HttpClient.
+    response_cache_mb: disk budget for cached download responses (0 disables the cache).
+    response_cache_compression: None, or 'zstd' to compress cached responses (needs `zstandard`).
+    memory_budget_mb: total size of loaded datasets kept in memory; beyond it the least recently
+                      used ones are spilled to disk and reloaded on access (None disables spilling).
+    graph_cache_mb: memory budget for rendered graph images, keyed by graph URL (0 disables it).
+    graph_disk_cache_mb: disk budget for graph images kept across sessions (0 keeps them in memory only).
+    max_parallel_downloads: downloads that run at the same time; further ones wait in the queue.
+    server_search_timeout: seconds each server gets to answer an "All Servers" search.
+    catalog_ttl: seconds a server's offline catalog index is used before its dataset list is re-read.
+    telemetry_records: how many per-request timing records `app['telemetry']` keeps (oldest dropped first).
+    telemetry_export: a callable receiving every record, or a path to append them to as JSON lines.
+    show_telemetry: adds the request stats panel (timings, bytes and phase breakdown) to the UI.
     """
+    cache_root = default_cache_dir() if cache_dir is None else cache_dir
+    if http_options:
+        http_client.configure(**http_options)
     # --- WIDGETS ---
-    server_list = {k: v.url for k, v in servers.items()}
-    preset_options = ['--- Select a preset server ---'] + sorted(list(server_list.keys()))
+    # Filled by a background thread (see load_presets) so the interface does not wait on the download.
+    server_list = {}
+    servers_ready = threading.Event()
 
     server_input = widgets.Text(
         placeholder='Select a preset or paste a custom URL',
         layout=widgets.Layout(width='400px')
     )
     server_presets_dd = widgets.Dropdown(
-        options=preset_options,
+        options=['--- Loading preset servers... ---'],
         description="Search:",
         layout=widgets.Layout(width='auto')
     )
     
     search_mode_dd = widgets.Dropdown(
-        options=['Keyword Search', 'Dataset ID'],
+        options=['Keyword Search', 'All Servers', 'Dataset ID'],
         value='Keyword Search',
         layout=widgets.Layout(width='150px')
     )
     search_query_input = widgets.Text(placeholder='e.g., temperature', layout=widgets.Layout(width='300px'))
     primary_button = widgets.Button(description="Search Datasets", button_style='primary')
+    refresh_metadata_cb = widgets.Checkbox(value=False, description='Refresh metadata', indent=False, layout=widgets.Layout(width='140px'))
+    offline_catalog_cb = widgets.Checkbox(value=False, description='Offline catalog', indent=False, layout=widgets.Layout(width='130px'))
     
     # Placeholders for dynamic content
     results_placeholder = widgets.VBox()
@@ -46,21 +110,76 @@ def create_data_access_interface():
     pagination_controls.layout.display = 'none'
 
     # --- STATE MANAGEMENT ---
-    app_state = {'search_page': 1, 'total_results': 0, 'dataframes': {}}
+    def fetch_search_page(server, query, page, items_per_page):
+        from . import erddap_utils
+        return erddap_utils.search_datasets(server, query, page=page, items_per_page=items_per_page)
+
+    data_dir = os.path.join(cache_root, 'data') if cache_root else tempfile.mkdtemp(prefix='erddap_nb_')
+    os.makedirs(data_dir, exist_ok=True)
+    app_state = {
+        'search_page': 1, 'total_results': 0, 'count_cache': {},
+        'dataframes': DataStore(
+            memory_budget=memory_budget_mb * 1024 * 1024 if memory_budget_mb else None,
+            spill_dir=tempfile.mkdtemp(prefix='spill_', dir=data_dir)
+        ),
+        'metadata_cache': MetadataCache(ttl=metadata_ttl, cache_dir=os.path.join(cache_root, 'metadata') if cache_root else False),
+        'search_cache': SearchCache(fetch_search_page),
+        'data_dir': data_dir,
+        'max_download_bytes': max_download_mb * 1024 * 1024 if max_download_mb else None,
+        'http_client': http_client.get_client(),
+        'response_cache': ResponseCache(
+            cache_dir=os.path.join(cache_root, 'responses'), max_bytes=response_cache_mb * 1024 * 1024,
+            compression=response_cache_compression
+        ) if cache_root and response_cache_mb else None,
+        'graph_cache': GraphCache(
+            max_bytes=graph_cache_mb * 1024 * 1024,
+            disk=ResponseCache(cache_dir=os.path.join(cache_root, 'graphs'), max_bytes=graph_disk_cache_mb * 1024 * 1024)
+            if cache_root and graph_disk_cache_mb else None
+        ) if graph_cache_mb else None,
+        'download_queue': DownloadQueue(max_workers=max_parallel_downloads),
+        'catalog': Catalog(os.path.join(cache_root, 'catalog.sqlite') if cache_root else ':memory:', ttl=catalog_ttl),
+        'telemetry': telemetry.Telemetry(max_records=telemetry_records)
+    }
+    if telemetry_export is not None:
+        app_state['telemetry'].add_exporter(telemetry_export if callable(telemetry_export) else telemetry.JsonLinesExporter(telemetry_export))
+    telemetry.install(app_state['telemetry'])
+    app_state['client'] = Client(
+        metadata_cache=app_state['metadata_cache'], response_cache=app_state['response_cache'],
+        max_download_bytes=app_state['max_download_bytes'], data_dir=data_dir
+    )
     ITEMS_PER_PAGE = 10
     
     # --- EVENT HANDLERS ---
+    def load_presets():
+        try:
+            server_list.update(load_server_list())
+            server_presets_dd.options = [PRESET_PROMPT] + sorted(server_list)
+        except Exception as err:
+            server_presets_dd.options = [f'--- Preset servers unavailable ({type(err).__name__}) ---']
+        finally:
+            servers_ready.set()
+
     def on_server_select(change):
         """Populates the server URL text input when a preset is chosen."""
         server_name = change.get('new')
         if server_name in server_list:
             server_input.value = server_list[server_name]
             
-    def load_dataset_explorer(dataset_id, button_obj=None):
-        """Contains the logic to fetch metadata for one dataset and build the explorer UI."""
+    def cancel_federated_search():
+        if app_state.get('federated_search') is not None:
+            app_state['federated_search'].cancel()
+            app_state['federated_search'] = None
+
+    def load_dataset_explorer(dataset_id, button_obj=None, server=None):
+        """
+        Contains the logic to fetch metadata for one dataset and build the explorer UI.
+        `server` is given for "All Servers" results, which may come from any server.
+        """
         from . import ui_builder
-        from . import erddap_utils
 
+        cancel_federated_search()
+        if server:
+            server_input.value = server
         server = server_input.value
         with output_area:
             clear_output()
@@ -68,8 +187,13 @@ def create_data_access_interface():
             pagination_controls.layout.display = 'none'
             print(f"Fetching metadata for {dataset_id}...")
             try:
-                metadata = erddap_utils.get_dataset_metadata(server, dataset_id) #
+                metadata = app_state['client'].metadata(server, dataset_id, refresh=refresh_metadata_cb.value)
                 app_state['metadata'] = metadata
+                try:
+                    app_state['catalog'].set_variables(server, dataset_id, variables_from_metadata(metadata))
+                except Exception as err:
+                    # The offline catalog is only an index; the explorer works without it.
+                    print(f"Could not add the variables of {dataset_id} to the offline catalog: {err}")
                 protocol = metadata['protocol'] #
                 
                 # Display the determined protocol above the main explorer UI
@@ -109,12 +233,22 @@ def create_data_access_interface():
             explorer_placeholder.children = []
             print(f"Searching for '{query}' on {server}...")
 
-            if app_state['search_page'] == 1:
-                total = erddap_utils.get_total_count(server, query) #
+            if offline_catalog_cb.value:
+                # Answered from the local index; the server's dataset list is only re-read when stale.
+                catalog = app_state['catalog']
+                if not catalog.ensure(server):
+                    print(f"Could not read the dataset list of {server}; the offline catalog has no index for it.")
+                    return
+                total = catalog.count(server, query)
                 app_state['total_results'] = total
-            
-            total = app_state['total_results']
-            results = erddap_utils.search_datasets(server, query, page=app_state['search_page'], items_per_page=ITEMS_PER_PAGE) #
+                results = catalog.search(server, query, page=app_state['search_page'], items_per_page=ITEMS_PER_PAGE)
+            else:
+                if app_state['search_page'] == 1:
+                    total = erddap_utils.get_total_count(server, query, cache=app_state['count_cache'])
+                    app_state['total_results'] = total
+
+                total = app_state['total_results']
+                results = app_state['search_cache'].get(server, query, app_state['search_page'], ITEMS_PER_PAGE)
             
             results_placeholder.children = [ui_builder.build_search_results(results, load_dataset_explorer)] #
             
@@ -124,6 +258,65 @@ def create_data_access_interface():
             next_button.disabled = (app_state['search_page'] >= total_pages)
             pagination_controls.layout.display = 'flex' if total > 0 else 'none'
             print(f"Found {total} total datasets.")
+            if not offline_catalog_cb.value:
+                app_state['search_cache'].prefetch(server, query, app_state['search_page'], ITEMS_PER_PAGE, last_page=total_pages)
+
+    def run_catalog_search(max_results=50):
+        """Searches the offline catalog of every server indexed so far, without any network access."""
+        from . import ui_builder
+
+        query = search_query_input.value
+        cancel_federated_search()
+        with output_area:
+            clear_output()
+            if not query:
+                print("Please provide a Search Query.")
+                return
+            explorer_placeholder.children = []
+            pagination_controls.layout.display = 'none'
+            names = {url.rstrip('/'): name for name, url in server_list.items()}
+            merged = {}
+            for record in app_state['catalog'].search(None, query, items_per_page=max_results * 2):
+                name = names.get(record['server'], record['server'])
+                if record['dataset_id'] in merged:
+                    merged[record['dataset_id']]['mirrors'].append(name)
+                else:
+                    merged[record['dataset_id']] = dict(record, server_name=name, mirrors=[])
+            results = list(merged.values())[:max_results]
+            results_placeholder.children = [ui_builder.build_search_results(results, load_dataset_explorer)]
+            print(f"Found {len(results)} datasets in the offline catalog of {len(app_state['catalog'].servers())} servers.")
+
+    def run_federated_search():
+        """Searches every preset server at once, showing merged results as servers answer."""
+        from . import ui_builder
+        from .federated import FederatedSearch
+
+        query = search_query_input.value
+        cancel_federated_search()
+        with output_area:
+            clear_output()
+            if not query:
+                print("Please provide a Search Query.")
+                return
+            explorer_placeholder.children = []
+            pagination_controls.layout.display = 'none'
+            if not servers_ready.is_set():
+                print("Waiting for the preset server list...")
+                if not servers_ready.wait(timeout=server_search_timeout):
+                    print("The server list is still loading; using the copy shipped with erddapy.")
+                    server_list.update(_bundled_server_list())
+            print(f"Searching for '{query}' on {len(server_list)} servers...")
+
+        def show(search):
+            old = results_placeholder.children
+            results_placeholder.children = [ui_builder.build_federated_results(search, load_dataset_explorer)]
+            for widget in old:
+                ui_builder.close_widgets(widget)
+
+        search = FederatedSearch(server_list, query, timeout=server_search_timeout, on_update=show)
+        app_state['federated_search'] = search
+        show(search)
+        search.start()
 
     def on_prev_clicked(b):
         if app_state['search_page'] > 1:
@@ -140,6 +333,11 @@ def create_data_access_interface():
         if mode == 'Keyword Search':
             app_state['search_page'] = 1
             run_keyword_search()
+        elif mode == 'All Servers':
+            if offline_catalog_cb.value:
+                run_catalog_search()
+            else:
+                run_federated_search()
         elif mode == 'Dataset ID':
             dataset_id = search_query_input.value
             if not server_input.value or not dataset_id:
@@ -152,9 +350,13 @@ def create_data_access_interface():
     def on_mode_change(change):
         """Updates the UI when the search mode changes."""
         new_mode = change.get('new')
+        cancel_federated_search()
         if new_mode == 'Keyword Search':
             primary_button.description = "Search Datasets"
             search_query_input.placeholder = 'e.g., temperature'
+        elif new_mode == 'All Servers':
+            primary_button.description = "Search All Servers"
+            search_query_input.placeholder = 'e.g., sea_water_temperature'
         elif new_mode == 'Dataset ID':
             primary_button.description = "Fetch Dataset"
             search_query_input.placeholder = 'Enter exact Dataset ID'
@@ -171,9 +373,15 @@ def create_data_access_interface():
     search_mode_dd.observe(on_mode_change, names='value')
 
     search_bar = widgets.VBox([
-        widgets.HBox([server_presets_dd, server_input, search_mode_dd, search_query_input, primary_button])
+        widgets.HBox([server_presets_dd, server_input, search_mode_dd, search_query_input, primary_button, refresh_metadata_cb, offline_catalog_cb])
     ])
     
+    from . import ui_builder
+    downloads_panel = ui_builder.build_download_queue_panel(app_state['download_queue'])
+    stats_panel = widgets.VBox()
+    if show_telemetry:
+        stats_panel = ui_builder.build_telemetry_panel(app_state['telemetry'], os.path.join(data_dir, 'telemetry.jsonl'))
+
     display(widgets.VBox([
         search_bar,
         widgets.HTML("<hr>"),
@@ -181,7 +389,11 @@ def create_data_access_interface():
         pagination_controls,
         explorer_placeholder,
         saved_dfs_placeholder,
+        downloads_panel,
+        stats_panel,
         output_area
     ]))
+    # Started after the interface is shown; importing erddapy here also loads pandas ahead of the first download.
+    threading.Thread(target=load_presets, name='erddap_nb_servers', daemon=True).start()
     
     return app_state
\ No newline at end of file
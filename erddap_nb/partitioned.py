@@ -0,0 +1,209 @@
+# erddap_nb/partitioned.py
+
+import io
+import os
+import re
+import time
+import pandas as pd
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from . import http_client
+from . import telemetry
+from .lazy import LazyParquet
+from .jobs import DownloadCancelled
+
+TIME_RANGE_OPS = ('>=', '>', '<=', '<')
+
+# pandas dtypes used to read .csvp values of each ERDDAP data type (nullable integers,
+# since any value may be missing). Strings, chars and times (ISO text in .csvp) stay text.
+READ_DTYPES = {
+    'byte': 'Int8', 'ubyte': 'UInt8', 'short': 'Int16', 'ushort': 'UInt16', 'int': 'Int32', 'uint': 'UInt32',
+    'long': 'Int64', 'ulong': 'UInt64', 'float': 'float32', 'double': 'float64'
+}
+
+# ERDDAP's relative time constraints: now, now-7days, now+1hour, ...
+_RELATIVE_TIME = re.compile(r"^now(?:([-+])(\d+)(millisecond|second|minute|hour|day|month|year)s?)?$", re.IGNORECASE)
+
+def utc(value):
+    """
+    A time constraint value as a UTC Timestamp. Relative values ('now-7days') are
+    resolved against the current time; other forms ERDDAP accepts, such as
+    'max(time)-1day', cannot be split into windows and raise a ValueError.
+    """
+    if isinstance(value, str):
+        match = _RELATIVE_TIME.match(value.replace(' ', ''))
+        if match:
+            sign, amount, unit = match.groups()
+            now = pd.Timestamp.now(tz='UTC')
+            if sign is None:
+                return now
+            amount = int(amount) if sign == '+' else -int(amount)
+            if unit.lower() in ('month', 'year'):
+                return now + pd.DateOffset(**{f'{unit.lower()}s': amount})
+            return now + pd.Timedelta(amount, unit='ms' if unit.lower() == 'millisecond' else unit.lower())
+    try:
+        ts = pd.Timestamp(value)
+    except (TypeError, ValueError) as err:
+        raise ValueError(f"Cannot use time constraint '{value}' here: give an ISO 8601 time or 'now-<n><units>' (e.g. now-7days).") from err
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+def _time_bounds(constraints, metadata):
+    """Returns (start, stop, start_op, stop_op) for the time range of a tabledap query."""
+    global_attrs = metadata.get('global_attrs', {})
+    start_op = next((op for op in ('>=', '>') if f'time{op}' in constraints), '>=')
+    stop_op = next((op for op in ('<=', '<') if f'time{op}' in constraints), '<=')
+    start = constraints.get(f'time{start_op}', global_attrs.get('time_coverage_start'))
+    stop = constraints.get(f'time{stop_op}', global_attrs.get('time_coverage_end')) or pd.Timestamp.now(tz='UTC')
+    if start is None:
+        raise ValueError("Partitioned fetch needs a start time (a time>= constraint or time_coverage_start).")
+    return utc(start), utc(stop), start_op, stop_op
+
+def tabledap_time_windows(constraints, metadata, window=pd.Timedelta(days=30)):
+    """
+    Splits the time range of a tabledap constraint dict into consecutive windows.
+    Returns a list of constraint dicts; neighbouring windows share a boundary that
+    only one of them includes (time>= on the left, time< on the right).
+    """
+    start, stop, start_op, stop_op = _time_bounds(constraints, metadata)
+    base = {k: v for k, v in constraints.items() if not (k.startswith('time') and k[4:] in TIME_RANGE_OPS)}
+    fmt = '%Y-%m-%dT%H:%M:%SZ'
+
+    windows = []
+    lo = start
+    while True:
+        hi = lo + window
+        last = hi >= stop
+        c = dict(base)
+        c[f'time{start_op if lo == start else ">="}'] = lo.strftime(fmt)
+        c[f'time{stop_op if last else "<"}'] = (stop if last else hi).strftime(fmt)
+        windows.append(c)
+        if last:
+            return windows
+        lo = hi
+
+def column_dtypes(columns, metadata):
+    """read_csv dtypes for .csvp columns ('name (units)'), from the variables' ERDDAP data types."""
+    variables = (metadata or {}).get('all_variables_map', {})
+    dtypes = {}
+    for column in columns:
+        var = variables.get(str(column).split(' (', 1)[0])
+        if var is None:
+            continue
+        is_time = ' since ' in str(var.get('units') or '')
+        dtypes[column] = str if is_time else READ_DTYPES.get(var.get('type'), str)
+    return dtypes
+
+def _read_window(body, metadata):
+    """
+    Parses a window's .csvp body with the column types given by the metadata, so a
+    column that happens to be empty or numeric-looking in one window is read like
+    in every other.
+    """
+    columns = pd.read_csv(io.BytesIO(body), nrows=0).columns
+    return pd.read_csv(io.BytesIO(body), dtype=column_dtypes(columns, metadata))
+
+def fetch_window(e, constraints, retries, backoff, cache=None, job=None, metadata=None):
+    """Fetches one window as a DataFrame; an empty result is returned as None."""
+    url = http_client.erddap_url(e.get_download_url(response='csvp', constraints=constraints))
+    body = cache.get(url) if cache is not None else None
+    if body is not None:
+        if job is not None:
+            job.advance(len(body))
+        with telemetry.phase('parse'):
+            return _read_window(body, metadata)
+    for attempt in range(retries + 1):
+        try:
+            if job is not None:
+                job.check()
+            with http_client.stream(url, timeout=600) as response:
+                if response.status_code == 404 and 'no matching results' in response.text.lower():
+                    return None
+                response.raise_for_status()
+                body = http_client.read_body(response, job)
+            if cache is not None:
+                cache.put(url, body)
+            with telemetry.phase('parse'):
+                return _read_window(body, metadata)
+        except DownloadCancelled:
+            raise
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+def to_table(df, schema):
+    """
+    Converts a window to an Arrow table with `schema` (the first window's). Without
+    a schema, text columns that are empty in this window are typed as strings rather
+    than null, so later windows holding values still match.
+    """
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema is None:
+        schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in table.schema])
+    if table.schema.equals(schema):
+        return table
+    try:
+        return table.select(schema.names).cast(schema)
+    except (KeyError, pa.ArrowInvalid, pa.ArrowNotImplementedError) as err:
+        raise ValueError(f"Window columns do not match the first window's schema: {err}") from err
+
+def fetch_tabledap_partitioned(e, metadata, path, window=pd.Timedelta(days=30),
+                               max_workers=4, retries=2, backoff=1.0, on_progress=None, cache=None, job=None):
+    """
+    Fetches a tabledap request (variables and constraints set on an `ERDDAP` object)
+    in concurrent time windows, streaming each window into one row group of a single
+    Parquet file at `path`. Returns a LazyParquet handle to the file.
+
+    Windows are written in time order and only `max_workers` are in flight at any
+    time, so memory use is bounded by a few windows rather than the full result.
+    Window bodies are looked up in and stored to `cache` (a ResponseCache) if given.
+    Streamed bytes and finished windows are reported to `job` (a jobs.DownloadJob);
+    cancelling the job stops the fetch and removes the partial file.
+    """
+    import pyarrow.parquet as pq
+
+    windows = tabledap_time_windows(e.constraints, metadata, window=window)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.partial"
+    if job is not None:
+        job.parts_total = len(windows)
+
+    writer, schema, n_rows = None, None, 0
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='erddap_nb_window') as pool:
+            # Keep only `max_workers` windows in flight and write them back in time order.
+            remaining = iter(windows)
+            pending = deque(pool.submit(telemetry.carry(fetch_window), e, c, retries, backoff, cache, job, metadata) for c in islice(remaining, max_workers))
+            done = 0
+            while pending:
+                df = pending.popleft().result()
+                next_window = next(remaining, None)
+                if next_window is not None:
+                    pending.append(pool.submit(telemetry.carry(fetch_window), e, next_window, retries, backoff, cache, job, metadata))
+                if df is not None and len(df):
+                    table = to_table(df, schema)
+                    if writer is None:
+                        schema = table.schema
+                        writer = pq.ParquetWriter(tmp_path, schema)
+                    writer.write_table(table, row_group_size=max(1, len(df)))
+                    n_rows += len(df)
+                done += 1
+                if job is not None:
+                    job.part_done()
+                if on_progress:
+                    on_progress(done, len(windows), n_rows)
+    except Exception:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        raise
+    if writer is not None:
+        writer.close()
+
+    if writer is None:
+        raise ValueError("The query produced no matching results.")
+    os.replace(tmp_path, path)
+    return LazyParquet(path)
@@ -0,0 +1,280 @@
+# erddap_nb/plotting.py
+
+import zlib
+import struct
+import numpy as np
+import pandas as pd
+
+from .columns import resolve_column
+
+DEFAULT_SIZE = (640, 400) # width, height in pixels
+BACKGROUND = (255, 255, 255)
+LINE_COLOR = (33, 74, 156)
+
+# Colour stops of the palettes offered in the graph panel, low to high.
+PALETTES = {
+    'Default': [(68, 1, 84), (59, 82, 139), (33, 145, 140), (94, 201, 98), (253, 231, 37)],
+    'Rainbow': [(0, 0, 255), (0, 255, 255), (0, 255, 0), (255, 255, 0), (255, 0, 0)],
+}
+PALETTES['ReverseRainbow'] = PALETTES['Rainbow'][::-1]
+
+# --- Image helpers ---
+
+def colormap(palette='Default', n=256):
+    """Returns an (n, 3) uint8 lookup table interpolated between the palette's colour stops."""
+    stops = np.array(PALETTES.get(palette, PALETTES['Default']), dtype=float)
+    positions = np.linspace(0, 1, len(stops))
+    samples = np.linspace(0, 1, n)
+    return np.stack([np.interp(samples, positions, stops[:, i]) for i in range(3)], axis=1).astype(np.uint8)
+
+def encode_png(rgb):
+    """Encodes an (height, width, 3) uint8 array as PNG bytes."""
+    height, width, _ = rgb.shape
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8) # filter byte 0 ("None") per scanline
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b'')
+
+def shade(grid, palette='Default', log=False):
+    """Maps a float grid onto palette colours; NaN cells get the background colour."""
+    filled = np.isfinite(grid)
+    rgb = np.empty(grid.shape + (3,), dtype=np.uint8)
+    rgb[:] = BACKGROUND
+    if not filled.any():
+        return rgb
+    values = np.log1p(grid[filled]) if log else grid[filled]
+    lo, hi = values.min(), values.max()
+    scaled = (values - lo) / (hi - lo) if hi > lo else np.full(values.shape, 0.5)
+    rgb[filled] = colormap(palette)[(scaled * 255).astype(np.intp)]
+    return rgb
+
+def spread(grid, px=1):
+    """Grows every filled cell by `px` pixels so isolated points stay visible."""
+    padded = np.pad(grid, px, constant_values=np.nan)
+    height, width = grid.shape
+    out = grid.copy()
+    for dy in range(2 * px + 1):
+        for dx in range(2 * px + 1):
+            out = np.fmax(out, padded[dy:dy + height, dx:dx + width])
+    return out
+
+# --- Vectorized aggregation ---
+
+def as_numeric(values):
+    """
+    Converts a column to float64 for binning. Returns (array, kind) where kind is
+    'number', 'time' (nanoseconds since the epoch) or 'category' (factorized codes).
+    """
+    values = pd.Series(np.asarray(values).ravel()) if not isinstance(values, pd.Series) else values
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return _epoch_ns(values), 'time'
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype=float, na_value=np.nan), 'number'
+    # Text columns (e.g. ISO times in .csvp downloads): decide the kind from a sample,
+    # then convert each distinct value once and scatter the results back.
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques)
+    sample = uniques.head(1000)
+    if pd.to_numeric(sample, errors='coerce').notna().mean() >= 0.5:
+        converted, kind = pd.to_numeric(uniques, errors='coerce').to_numpy(dtype=float, na_value=np.nan), 'number'
+    elif pd.to_datetime(sample, utc=True, errors='coerce', format='ISO8601').notna().mean() >= 0.5:
+        converted, kind = _epoch_ns(pd.to_datetime(uniques, utc=True, errors='coerce', format='ISO8601')), 'time'
+    else:
+        converted, kind = np.arange(len(uniques), dtype=float), 'category'
+    return np.where(codes < 0, np.nan, converted[codes]), kind
+
+def _epoch_ns(times):
+    times = pd.to_datetime(times, utc=True).dt.as_unit('ns')
+    return np.where(times.isna(), np.nan, times.astype('int64').astype(float))
+
+def value_range(values):
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return (0.0, 1.0)
+    return (float(finite.min()), float(finite.max()))
+
+def pixel_index(values, value_range, n):
+    """Maps values onto pixel indices 0..n-1 across `value_range`."""
+    lo, hi = value_range
+    if hi <= lo:
+        return np.full(values.shape, n // 2, dtype=np.intp)
+    return np.clip(((values - lo) / (hi - lo) * n).astype(np.intp), 0, n - 1)
+
+def bin_points(x, y, width, height, x_range, y_range, values=None):
+    """
+    Aggregates points onto a (height, width) grid in one pass: the point count per
+    pixel, or the mean of `values` when given. Empty pixels are NaN; row 0 is the top.
+    """
+    col = pixel_index(x, x_range, width)
+    row = height - 1 - pixel_index(y, y_range, height)
+    flat = row * width + col
+    counts = np.bincount(flat, minlength=width * height).astype(float)
+    if values is None:
+        grid = counts
+    else:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grid = np.bincount(flat, weights=values, minlength=width * height) / counts
+    grid[counts == 0] = np.nan
+    return grid.reshape(height, width)
+
+def decimate_lines(x, y, width, height, x_range, y_range):
+    """
+    Min/max decimation of a line onto a (height, width) boolean mask: each pixel column
+    keeps only the extremes of the points that fall in it, columns without points are
+    interpolated, and neighbouring columns are joined so the trace stays continuous.
+    The column-wise reduction treats `x` as the independent variable, as in a time series.
+    """
+    col = pixel_index(x, x_range, width)
+    row = height - 1 - pixel_index(y, y_range, height)
+    top = np.full(width, height, dtype=np.intp)
+    bottom = np.full(width, -1, dtype=np.intp)
+    np.minimum.at(top, col, row)
+    np.maximum.at(bottom, col, row)
+
+    filled = np.flatnonzero(bottom >= 0)
+    mask = np.zeros((height, width), dtype=bool)
+    if filled.size == 0:
+        return mask
+    span = np.arange(filled[0], filled[-1] + 1)
+    middle = np.interp(span, filled, (top[filled] + bottom[filled]) / 2).round().astype(np.intp)
+    top_span = np.where(bottom[span] >= 0, top[span], middle)
+    bottom_span = np.where(bottom[span] >= 0, bottom[span], middle)
+    # Join each column to its left neighbour.
+    top_joined, bottom_joined = top_span.copy(), bottom_span.copy()
+    top_joined[1:] = np.minimum(top_span[1:], bottom_span[:-1])
+    bottom_joined[1:] = np.maximum(bottom_span[1:], top_span[:-1])
+
+    rows = np.arange(height)[:, None]
+    mask[:, span] = (rows >= top_joined) & (rows <= bottom_joined)
+    return mask
+
+# --- Rendering ---
+
+def plot_points(x, y, values=None, kind='markers', size=DEFAULT_SIZE, palette='Default', reverse_x=False, reverse_y=False):
+    """
+    Renders point data (1-D arrays) as 'lines', 'markers' or 'linesAndMarkers'.
+    Returns (png bytes, info) where info holds the point count and axis ranges.
+    """
+    width, height = size
+    keep = np.isfinite(x) & np.isfinite(y)
+    if values is not None and kind != 'lines':
+        keep &= np.isfinite(values)
+    x, y = x[keep], y[keep]
+    values = values[keep] if values is not None else None
+    x_range, y_range = value_range(x), value_range(y)
+
+    rgb = np.empty((height, width, 3), dtype=np.uint8)
+    rgb[:] = BACKGROUND
+    if kind in ('lines', 'linesAndMarkers'):
+        rgb[decimate_lines(x, y, width, height, x_range, y_range)] = LINE_COLOR
+    if kind in ('markers', 'linesAndMarkers'):
+        grid = bin_points(x, y, width, height, x_range, y_range, values)
+        if x.size < width * height // 20:
+            grid = spread(grid)
+        filled = np.isfinite(grid)
+        rgb[filled] = shade(grid, palette, log=values is None)[filled]
+    if reverse_x:
+        rgb = rgb[:, ::-1]
+    if reverse_y:
+        rgb = rgb[::-1]
+
+    info = {'points': int(x.size), 'x_range': x_range, 'y_range': y_range}
+    if values is not None:
+        info['color_range'] = value_range(values)
+    return encode_png(np.ascontiguousarray(rgb)), info
+
+def plot_surface(values, x, y, size=DEFAULT_SIZE, palette='Default', reverse_x=False, reverse_y=False):
+    """
+    Renders a 2-D field `values[y, x]` with 1-D coordinates `x` and `y`. Grids larger
+    than the image are mean-aggregated per pixel; smaller ones are drawn at native
+    resolution and scaled up (nearest neighbour).
+    """
+    width, height = size
+    grid_width, grid_height = min(width, len(x)), min(height, len(y))
+    xx, yy = np.meshgrid(x, y)
+    keep = np.isfinite(values) & np.isfinite(xx) & np.isfinite(yy)
+    x_range, y_range = value_range(x), value_range(y)
+    grid = bin_points(xx[keep], yy[keep], grid_width, grid_height, x_range, y_range, values[keep])
+    grid = grid[(np.arange(height) * grid_height // height)[:, None], np.arange(width) * grid_width // width]
+    rgb = shade(grid, palette)
+    if reverse_x:
+        rgb = rgb[:, ::-1]
+    if reverse_y:
+        rgb = rgb[::-1]
+    info = {'points': int(keep.sum()), 'x_range': x_range, 'y_range': y_range, 'color_range': value_range(values[keep])}
+    return encode_png(np.ascontiguousarray(rgb)), info
+
+def _dataset_arrays(ds, names):
+    import xarray as xr
+    missing = [name for name in names if name not in ds.variables]
+    if missing:
+        raise ValueError(f"'{missing[0]}' is not in the saved data.")
+    arrays = xr.broadcast(*[ds[name] for name in names])
+    return [array.values.ravel() for array in arrays]
+
+def render(data, x, y, color=None, kind='markers', size=DEFAULT_SIZE, palette='Default', reverse_x=False, reverse_y=False):
+    """
+    Renders saved data locally: a pandas DataFrame, a LazyParquet handle (only the
+    plotted columns are read), a LazyFile (loaded first) or an xarray Dataset. `kind` is one of the graph panel's
+    types; 'surface' needs a Dataset, x/y dimensions and a colour variable (other
+    dimensions are reduced to their first index, as the ERDDAP surface graph does).
+    Returns (png bytes, info) - see describe_plot.
+    """
+    import xarray as xr
+    from .lazy import LazyParquet, LazyFile
+    names = [name for name in (x, y, color) if name]
+    if not (x and y):
+        raise ValueError("Select both an X-Axis and a Y-Axis variable to plot locally.")
+    if isinstance(data, LazyFile):
+        data = data.load()
+    kinds = {}
+
+    if kind == 'surface':
+        if not isinstance(data, xr.Dataset):
+            raise ValueError("Surface graphs can only be drawn locally from NetCDF (xarray) data.")
+        if not color:
+            raise ValueError("Select a Color variable for a surface graph.")
+        field = data[color]
+        if x not in field.dims or y not in field.dims:
+            raise ValueError(f"'{x}' and '{y}' must both be dimensions of '{color}' for a surface graph.")
+        field = field.isel({dim: 0 for dim in field.dims if dim not in (x, y)}).transpose(y, x)
+        x_values, kinds['x'] = as_numeric(field[x].values)
+        y_values, kinds['y'] = as_numeric(field[y].values)
+        image, info = plot_surface(field.values.astype(float), x_values, y_values, size, palette, reverse_x, reverse_y)
+    else:
+        if isinstance(data, xr.Dataset):
+            columns = _dataset_arrays(data, names)
+        else:
+            source_columns = data.columns
+            resolved = [resolve_column(source_columns, name) for name in names]
+            frame = data.load(columns=list(dict.fromkeys(resolved))) if isinstance(data, LazyParquet) else data
+            columns = [frame[name] for name in resolved]
+        numeric = {}
+        for key, column in zip(('x', 'y', 'color'), columns):
+            numeric[key], kinds[key] = as_numeric(column)
+        image, info = plot_points(numeric['x'], numeric['y'], numeric.get('color'), kind, size, palette, reverse_x, reverse_y)
+
+    info.update({'x': x, 'y': y, 'color': color, 'kinds': kinds})
+    return image, info
+
+def _format_value(value, kind):
+    if kind == 'time':
+        return pd.Timestamp(int(value), tz='UTC').strftime('%Y-%m-%d %H:%M')
+    if kind == 'category':
+        return f"#{int(value)}"
+    return f"{value:.6g}"
+
+def describe_plot(info):
+    """One-line summary of a local plot: point count and the range of each axis."""
+    parts = [f"{info['points']:,} points"]
+    for axis, key in (('x', 'x_range'), ('y', 'y_range'), ('color', 'color_range')):
+        if info.get(key) is None or not info.get(axis):
+            continue
+        kind = info['kinds'].get(axis, 'number')
+        lo, hi = (_format_value(v, kind) for v in info[key])
+        parts.append(f"{axis}: {info[axis]} {lo} to {hi}")
+    return "; ".join(parts)
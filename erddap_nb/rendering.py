@@ -0,0 +1,105 @@
+# erddap_nb/rendering.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import http_client
+from . import telemetry
+
+LIVE_UPDATE_DELAY = 0.6 # seconds of quiet before a live-mode render starts
+
+def fetch_graph_image(graph_url, graph_cache=None, cancelled=None):
+    """
+    Returns (image bytes, served_from_cache) for an ERDDAP graph URL. The image is
+    streamed, and (None, False) is returned as soon as `cancelled()` turns true.
+    """
+    if graph_cache is not None:
+        image = graph_cache.get(graph_url)
+        if image is not None:
+            return image, True
+    chunks = []
+    with http_client.stream(graph_url) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            if cancelled is not None and cancelled():
+                return None, False
+            chunks.append(chunk)
+    image = b''.join(chunks)
+    if graph_cache is not None:
+        graph_cache.put(graph_url, image)
+    return image, False
+
+class GraphRenderer:
+    """
+    Fetches graph images on background threads so the kernel stays responsive.
+
+    Only the newest request counts: each `submit` supersedes the previous one, whose
+    download is abandoned at the next chunk and whose image is never shown. With a
+    `delay` the request is debounced, so a burst of widget changes renders once.
+    A request is an ERDDAP graph URL, or a callable returning image bytes (see
+    plotting.render for graphs drawn locally from saved data).
+    `on_image(image, cached)` and `on_error(exception)` are called from a worker thread.
+    """
+
+    def __init__(self, on_image, on_error=None, graph_cache=None, max_workers=3):
+        self.on_image = on_image
+        self.on_error = on_error
+        self.graph_cache = graph_cache
+        self.stats = {'submitted': 0, 'rendered': 0, 'superseded': 0}
+        self._token = 0
+        self._timer = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='erddap_nb_graph')
+        self._lock = threading.Lock()
+
+    def _supersede(self):
+        # Caller holds the lock.
+        self._token += 1
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return self._token
+
+    def submit(self, graph_url, delay=0):
+        """Renders `graph_url` (or calls it), after `delay` seconds if no newer request arrives first."""
+        with self._lock:
+            token = self._supersede()
+            self.stats['submitted'] += 1
+            if delay:
+                self._timer = threading.Timer(delay, self._start, (token, graph_url))
+                self._timer.daemon = True
+                self._timer.start()
+            else:
+                self._executor.submit(self._render, token, graph_url)
+        return token
+
+    def cancel(self):
+        """Abandons any pending or in-flight render."""
+        with self._lock:
+            self._supersede()
+
+    def is_current(self, token):
+        return token == self._token
+
+    def _start(self, token, graph_url):
+        if self.is_current(token):
+            self._executor.submit(self._render, token, graph_url)
+
+    def _render(self, token, graph_url):
+        try:
+            image = None
+            if self.is_current(token) and callable(graph_url):
+                with telemetry.span('graph', name='local'), telemetry.phase('render'):
+                    image, cached = graph_url(), False
+            elif self.is_current(token):
+                with telemetry.span('graph', url=graph_url):
+                    image, cached = fetch_graph_image(graph_url, self.graph_cache, cancelled=lambda: not self.is_current(token))
+        except Exception as ex:
+            if self.is_current(token) and self.on_error:
+                self.on_error(ex)
+            return
+        with self._lock:
+            if image is None or not self.is_current(token):
+                self.stats['superseded'] += 1
+                return
+            self.stats['rendered'] += 1
+        self.on_image(image, cached)
@@ -0,0 +1,188 @@
+# erddap_nb/sizing.py
+
+import re
+import math
+
+# Bytes per value for ERDDAP data types; strings are counted as a short fixed width.
+TYPE_SIZES = {
+    'byte': 1, 'ubyte': 1, 'char': 2, 'short': 2, 'ushort': 2, 'int': 4, 'uint': 4,
+    'long': 8, 'ulong': 8, 'float': 4, 'double': 8, 'string': 16
+}
+
+_TIME_UNITS = {'day': 86400, 'days': 86400, 'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+
+def parse_spacing(spacing):
+    """
+    Converts an ERDDAP averageSpacing string to a number. Numeric spacings are
+    returned as-is; elapsed-time spacings ("1 day", "6h 30m") are returned in seconds.
+    Returns None if the spacing is unknown.
+    """
+    if spacing is None:
+        return None
+    try:
+        value = float(spacing)
+        return abs(value) or None
+    except (TypeError, ValueError):
+        pass
+    parts = re.findall(r"(-?\d+(?:\.\d+)?)\s*(days?|ms|h|m|s)\b", str(spacing))
+    if not parts:
+        return None
+    seconds = sum(float(number) * _TIME_UNITS[unit] for number, unit in parts)
+    return abs(seconds) or None
+
+def to_axis_number(value, is_time=False):
+    """Converts a constraint value to a float (epoch seconds for time). Returns None on failure."""
+    if value is None or str(value).strip() == '':
+        return None
+    if is_time:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            pass
+        import pandas as pd
+        try:
+            return pd.Timestamp(str(value)).timestamp()
+        except (TypeError, ValueError):
+            return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _actual_range(dim):
+    parts = [p.strip() for p in str(dim.get('actual_range', '')).split(',')]
+    if len(parts) != 2:
+        return None, None
+    try:
+        return float(parts[0]), float(parts[1])
+    except ValueError:
+        return None, None
+
+def dimension_count(dim, start=None, stop=None, step=1):
+    """
+    Estimates how many values of a griddap dimension fall between start and stop
+    (inclusive), using the dimension's average spacing, or its nValues/actual_range
+    when the spacing is unknown. Returns None when nothing can be estimated.
+    """
+    is_time = 'time' in dim['name'].lower()
+    range_min, range_max = _actual_range(dim)
+    lo = to_axis_number(start, is_time)
+    hi = to_axis_number(stop, is_time)
+    lo = range_min if lo is None else lo
+    hi = range_max if hi is None else hi
+    n_values = dim.get('n_values')
+
+    spacing = parse_spacing(dim.get('average_spacing'))
+    if spacing is None and n_values and range_min is not None and range_max != range_min:
+        spacing = abs(range_max - range_min) / (n_values - 1)
+
+    if lo is None or hi is None or spacing is None:
+        count = n_values
+    else:
+        count = int(math.floor(abs(hi - lo) / spacing + 1e-6)) + 1
+        if n_values:
+            count = min(count, n_values)
+    if count is None:
+        return None
+    try:
+        step = max(1, int(step))
+    except (TypeError, ValueError):
+        step = 1
+    return max(1, math.ceil(count / step))
+
+def griddap_dimension_counts(metadata, constraints):
+    """Returns {dimension name: estimated number of values} for a griddap request."""
+    counts = {}
+    for dim in metadata.get('dimensions', []):
+        name = dim['name']
+        counts[name] = dimension_count(
+            dim, constraints.get(f'{name}>='), constraints.get(f'{name}<='), constraints.get(f'{name}_step', 1)
+        )
+    return counts
+
+def preview_steps(metadata, constraints, max_points):
+    """
+    Strides that bring a griddap request down to at most about `max_points` grid
+    points per variable, as {'<name>_step': stride} constraints. The reduction is
+    spread evenly over the dimensions (in index space, so the subset keeps its
+    shape); a dimension shorter than its share is kept whole and leaves the rest of
+    the budget to the others. Returns {} if a dimension's extent is unknown.
+    """
+    counts = {}
+    for dim in metadata.get('dimensions', []):
+        name = dim['name']
+        counts[name] = dimension_count(dim, constraints.get(f'{name}>='), constraints.get(f'{name}<='))
+    if not counts or any(count is None for count in counts.values()):
+        return {}
+    steps = {}
+    budget = max(1, max_points)
+    remaining = len(counts)
+    for name, count in sorted(counts.items(), key=lambda item: item[1]):
+        share = max(1, int(budget ** (1 / remaining) + 1e-9))
+        step = max(1, math.ceil(count / share))
+        try:
+            step = max(step, int(constraints.get(f'{name}_step', 1)))
+        except (TypeError, ValueError):
+            pass
+        steps[f'{name}_step'] = step
+        budget = max(1, budget / math.ceil(count / step))
+        remaining -= 1
+    return steps
+
+def bytes_per_cell(metadata, variables):
+    """Bytes needed for one grid cell across the given variables."""
+    all_variables_map = metadata.get('all_variables_map', {})
+    return sum(TYPE_SIZES.get(all_variables_map.get(v, {}).get('type', 'float'), 8) for v in variables) or 8
+
+def estimate_griddap_bytes(metadata, constraints, variables):
+    """
+    Estimates the uncompressed size of a griddap request in bytes, or None if a
+    dimension's extent cannot be estimated.
+    """
+    counts = griddap_dimension_counts(metadata, constraints)
+    if any(count is None for count in counts.values()):
+        return None
+    cells = math.prod(counts.values()) if counts else 0
+    return cells * bytes_per_cell(metadata, variables)
+
+def estimate_tabledap_rows(e):
+    """
+    Asks the server how many rows a tabledap request (variables and constraints set
+    on an `ERDDAP` object) would return, using a single-row orderByCount probe.
+    Returns None if the server cannot answer.
+    """
+    import io
+    import pandas as pd
+    from . import http_client
+
+    url = http_client.erddap_url(e.get_download_url(response='csv') + '&orderByCount("")')
+    try:
+        response = http_client.get(url, timeout=120)
+        if response.status_code == 404 and 'no matching results' in response.text.lower():
+            return 0
+        response.raise_for_status()
+        counts = pd.read_csv(io.StringIO(response.text), skiprows=[1])
+    except Exception:
+        return None
+    if counts.empty:
+        return 0
+    return int(pd.to_numeric(counts.iloc[0], errors='coerce').max())
+
+def format_bytes(n_bytes):
+    """Human readable size, e.g. '12.3 MB'."""
+    if n_bytes is None:
+        return "unknown"
+    size = float(n_bytes)
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def describe_estimate(n_bytes, limit=None, detail=""):
+    """HTML snippet for the size readout next to a Download button."""
+    if n_bytes is None:
+        return "<i>Estimated size: unknown</i>"
+    text = f"Estimated size: ~{format_bytes(n_bytes)}{detail}"
+    if limit and n_bytes > limit:
+        return f"<span style='color: #B22222;'><b>{text}</b> (over the {format_bytes(limit)} limit)</span>"
+    return f"<span>{text}</span>"
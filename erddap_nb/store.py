@@ -0,0 +1,151 @@
+# erddap_nb/store.py
+
+import os
+import uuid
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+def object_nbytes(obj):
+    """In-memory size of a DataFrame or xarray object; 0 for on-disk handles."""
+    import pandas as pd
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if hasattr(obj, 'variables') and type(obj).__module__.startswith('xarray'):
+        # Dask-backed variables (e.g. a Dataset opened from Zarr) stay on disk until computed.
+        return int(sum(var.nbytes for var in obj.variables.values() if var.chunks is None))
+    if hasattr(obj, 'nbytes') and type(obj).__module__.startswith('xarray'):
+        return int(obj.nbytes)
+    return 0
+
+class DataStore(MutableMapping):
+    """
+    Drop-in replacement for the `app_state['dataframes']` dict that keeps the total
+    size of in-memory objects under a budget.
+
+    Entries keep the {'data': ..., 'source_format': ...} layout. When the budget is
+    exceeded the least recently used DataFrames/Datasets are written to Parquet/NetCDF
+    in `spill_dir` and their 'data' is dropped; reading the entry again reloads it.
+    """
+
+    def __init__(self, memory_budget=None, spill_dir=None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.stats = {'spills': 0, 'reloads': 0}
+        self._entries = OrderedDict()
+        self._sizes = {} # name -> {'memory': bytes, 'spilled': bytes, 'path': spill file or None}
+        self._lock = threading.RLock()
+
+    # --- Mapping interface ---
+    def __getitem__(self, name):
+        with self._lock:
+            entry = self._entries[name]
+            if self._sizes[name]['path'] is not None:
+                self._reload(name)
+            self._entries.move_to_end(name)
+            self._enforce_budget(keep=name)
+            return entry
+
+    def __setitem__(self, name, entry):
+        with self._lock:
+            if name in self._entries:
+                self._remove_spill(name)
+            self._entries[name] = entry
+            self._entries.move_to_end(name)
+            self._sizes[name] = {'memory': object_nbytes(entry.get('data')), 'spilled': 0, 'path': None}
+            self._enforce_budget(keep=name)
+
+    def __delitem__(self, name):
+        with self._lock:
+            self._remove_spill(name)
+            del self._entries[name]
+            del self._sizes[name]
+
+    def __contains__(self, name):
+        # Mapping's default would go through __getitem__ and reload spilled entries.
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    # --- Size reporting ---
+    def sizes(self):
+        """Returns {name: {'memory': bytes, 'spilled': bytes}} without loading anything."""
+        with self._lock:
+            return {name: {'memory': s['memory'], 'spilled': s['spilled']} for name, s in self._sizes.items()}
+
+    @property
+    def memory_bytes(self):
+        with self._lock:
+            return sum(s['memory'] for s in self._sizes.values())
+
+    def is_spilled(self, name):
+        with self._lock:
+            return self._sizes[name]['path'] is not None
+
+    # --- Spilling ---
+    def spill(self, name):
+        """Writes one entry to disk and drops it from memory. Returns True on success."""
+        import pandas as pd
+        with self._lock:
+            entry, size = self._entries[name], self._sizes[name]
+            data = entry.get('data')
+            if size['path'] is not None or size['memory'] == 0 or entry.get('lazy') or not self.spill_dir:
+                return False
+            os.makedirs(self.spill_dir, exist_ok=True)
+            is_frame = isinstance(data, pd.DataFrame)
+            path = os.path.join(self.spill_dir, f"{uuid.uuid4().hex}.{'parquet' if is_frame else 'nc'}")
+            try:
+                if is_frame:
+                    data.to_parquet(path)
+                else:
+                    from .erddap_utils import _NETCDF_LOCK
+                    with _NETCDF_LOCK:
+                        data.to_netcdf(path)
+            except Exception:
+                # Objects that do not round-trip (e.g. mixed-type columns) stay in memory.
+                if os.path.exists(path):
+                    os.remove(path)
+                return False
+            entry.pop('data', None)
+            size.update({'path': path, 'spilled': os.path.getsize(path), 'memory': 0})
+            self.stats['spills'] += 1
+            return True
+
+    def _reload(self, name):
+        import pandas as pd
+        entry, size = self._entries[name], self._sizes[name]
+        path = size['path']
+        if path.endswith('.parquet'):
+            data = pd.read_parquet(path)
+        else:
+            import xarray as xr
+            from .erddap_utils import _NETCDF_LOCK
+            with _NETCDF_LOCK:
+                with xr.open_dataset(path) as ds:
+                    data = ds.load()
+        entry['data'] = data
+        self._remove_spill(name)
+        size['memory'] = object_nbytes(data)
+        self.stats['reloads'] += 1
+
+    def _remove_spill(self, name):
+        size = self._sizes.get(name)
+        if size and size['path']:
+            try:
+                os.remove(size['path'])
+            except OSError:
+                pass
+            size.update({'path': None, 'spilled': 0})
+
+    def _enforce_budget(self, keep=None):
+        if not self.memory_budget:
+            return
+        for name in list(self._entries):
+            if self.memory_bytes <= self.memory_budget:
+                return
+            if name != keep:
+                self.spill(name)
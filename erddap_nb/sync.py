@@ -0,0 +1,130 @@
+# erddap_nb/sync.py
+
+import os
+import json
+import time
+import pandas as pd
+
+from .columns import resolve_column
+from .lazy import LazyParquet
+from .partitioned import fetch_window, to_table, utc, fetch_tabledap_partitioned
+
+STATE_FILE = '_sync.json'
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+DEFAULT_OVERLAP = pd.Timedelta(hours=1)
+
+def query_signature(e, key):
+    """What identifies a synced query: everything but the lower bound on the sync key."""
+    constraints = {k: str(v) for k, v in e.constraints.items() if k not in (f'{key}>=', f'{key}>')}
+    return {'server': e.server, 'dataset_id': e.dataset_id, 'variables': list(e.variables or []),
+            'constraints': constraints, 'key': key}
+
+def read_state(path):
+    """The sync state of a store directory, or None if it has never been synced."""
+    try:
+        with open(os.path.join(path, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_state(path, state):
+    tmp_path = os.path.join(path, f"{STATE_FILE}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, os.path.join(path, STATE_FILE))
+
+def _key_values(series, is_time):
+    if is_time:
+        return pd.to_datetime(series, utc=True, errors='coerce', format='ISO8601')
+    return pd.to_numeric(series, errors='coerce')
+
+def _key_scalar(value, is_time):
+    return utc(value) if is_time else float(value)
+
+def _key_max(series, is_time):
+    value = _key_values(series, is_time).max()
+    if pd.isna(value):
+        return None
+    return value.strftime(TIME_FORMAT) if is_time else float(value)
+
+def _part_path(path, index):
+    return os.path.join(path, f"part-{index:05d}.parquet")
+
+def sync_tabledap(e, metadata, path, key='time', overlap=None, initial='direct', window=pd.Timedelta(days=30), job=None):
+    """
+    Mirrors a tabledap request (variables and constraints set on an `ERDDAP` object)
+    into a directory of Parquet part files at `path`, fetching only what is new.
+
+    The first call downloads the full result (`initial='partitioned'` fetches it in
+    time windows). Later calls read the largest `key` value held so far from the
+    store's state, request rows from `overlap` before it onwards, drop rows that the
+    store already holds and write the rest as a new part. `key` must be a monotonic
+    variable: 'time' (overlap a Timedelta, default one hour) or a numeric one
+    (overlap a number, default 0). Returns (LazyParquet, report dict).
+    """
+    import pyarrow.parquet as pq
+
+    os.makedirs(path, exist_ok=True)
+    state = read_state(path)
+    signature = query_signature(e, key)
+    if state is not None and state['query'] != signature:
+        raise ValueError(f"'{path}' holds a different query; sync this selection under another name.")
+    is_time = key == 'time'
+    if overlap is None:
+        overlap = DEFAULT_OVERLAP if is_time else 0
+    if e.variables and key not in e.variables:
+        e.variables = list(e.variables) + [key] # the key column is needed to know where to resume
+    started = time.monotonic()
+
+    if state is None:
+        part = _part_path(path, 0)
+        if initial == 'partitioned':
+            fetch_tabledap_partitioned(e, metadata, part, window=window, job=job)
+        else:
+            df = fetch_window(e, e.constraints, retries=2, backoff=1.0, job=job, metadata=metadata)
+            if df is None or not len(df):
+                raise ValueError("The query produced no matching results.")
+            pq.write_table(to_table(df, None), part)
+        column = resolve_column(pq.read_schema(part).names, key)
+        n_rows = pq.ParquetFile(part).metadata.num_rows
+        last = _key_max(pd.read_parquet(part, columns=[column])[column], is_time)
+        if last is None:
+            os.remove(part)
+            raise ValueError(f"The result has no '{key}' values to resume a sync from.")
+        state = {'query': signature, 'column': column, 'max': last, 'parts': 1, 'rows': n_rows, 'created': time.time()}
+        report = {'fetched_rows': n_rows, 'new_rows': n_rows, 'duplicates': 0}
+    else:
+        column, last = state['column'], state['max']
+        cutoff = (utc(last) - overlap).strftime(TIME_FORMAT) if is_time else last - overlap
+        constraints = dict(e.constraints)
+        lower = next((constraints.pop(f'{key}{op}') for op in ('>=', '>') if f'{key}{op}' in constraints), None)
+        if lower is not None and _key_scalar(lower, is_time) > _key_scalar(cutoff, is_time):
+            cutoff = lower
+        constraints[f'{key}>='] = cutoff
+        df = fetch_window(e, constraints, retries=2, backoff=1.0, job=job, metadata=metadata)
+        fetched = 0 if df is None else len(df)
+        new = None
+        if fetched:
+            store = LazyParquet(path)
+            schema = pq.read_schema(store.part_paths()[0])
+            df = to_table(df, schema).to_pandas().drop_duplicates()
+            # Rows of the overlap window that the store already holds are dropped.
+            held = store.load(filters=[(column, '>=', cutoff)])
+            held = held[_key_values(held[column], is_time) >= _key_scalar(cutoff, is_time)]
+            merged = df.merge(held.drop_duplicates(), how='left', indicator='_held')
+            new = merged[merged['_held'] == 'left_only'].drop(columns='_held')
+            if len(new):
+                pq.write_table(to_table(new, schema), _part_path(path, state['parts']))
+                state['parts'] += 1
+                state['rows'] += len(new)
+                newest = _key_max(new[column], is_time)
+                if newest is not None and _key_scalar(newest, is_time) > _key_scalar(last, is_time):
+                    state['max'] = newest
+        n_new = 0 if new is None else len(new)
+        report = {'fetched_rows': fetched, 'new_rows': n_new, 'duplicates': fetched - n_new}
+
+    report['seconds'] = time.monotonic() - started
+    state['synced_at'] = time.time()
+    state['last_sync'] = report
+    _write_state(path, state)
+    return LazyParquet(path), dict(report, rows=state['rows'], parts=state['parts'], max=state['max'])
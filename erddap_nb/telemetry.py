@@ -0,0 +1,215 @@
+# erddap_nb/telemetry.py
+
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+KINDS = ('metadata', 'search', 'count', 'graph', 'download', 'save', 'request')
+
+_telemetry = None # the installed Telemetry, or None when nothing is recorded
+_current = contextvars.ContextVar('erddap_nb_span', default=None)
+
+class Span:
+    """
+    Measurements of one interaction in progress: the HTTP requests it made (status,
+    bytes, time to first byte, transfer time) and the time spent in named phases
+    such as 'parse'. Requests and phases may be added from several threads.
+    """
+
+    def __init__(self, kind, name=None, url=None):
+        self.kind = kind
+        self.name = name
+        self.url = url
+        self.status = None
+        self.requests = 0
+        self.bytes = 0
+        self.ttfb = None
+        self.transfer = 0.0
+        self.phases = {}
+        self.error = None
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_request(self, url, status, n_bytes, ttfb, transfer):
+        with self._lock:
+            self.requests += 1
+            self.url = self.url or url
+            self.status = status
+            self.bytes += n_bytes
+            self.ttfb = ttfb if self.ttfb is None else self.ttfb
+            self.transfer += transfer
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def record(self):
+        """The finished span as a plain dictionary (see Telemetry)."""
+        return {
+            'kind': self.kind, 'name': self.name, 'url': self.url, 'status': self.status, 'requests': self.requests,
+            'bytes': self.bytes, 'ttfb': self.ttfb, 'transfer': self.transfer, 'parse': self.phases.get('parse', 0.0),
+            'phases': dict(self.phases), 'total': time.perf_counter() - self._start, 'started': self.started,
+            'error': self.error, 'thread': threading.current_thread().name
+        }
+
+class Telemetry:
+    """
+    Bounded ring buffer of per-interaction records (metadata, search, count, graph,
+    download, save). Each record holds the URL, last HTTP status, bytes received
+    (written, for saves), time to first byte, transfer and parse time (seconds),
+    other phases and the total. Exporters are called with every new record, from
+    the thread that made it.
+    """
+
+    def __init__(self, max_records=500, exporters=()):
+        self.max_records = max_records
+        self.exporters = list(exporters)
+        self.stats = {'recorded': 0, 'dropped': 0, 'export_errors': 0}
+        self._records = deque(maxlen=max_records)
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            if len(self._records) == self.max_records:
+                self.stats['dropped'] += 1
+            self._records.append(record)
+            self.stats['recorded'] += 1
+        for exporter in list(self.exporters):
+            try:
+                exporter(record)
+            except Exception:
+                with self._lock:
+                    self.stats['export_errors'] += 1
+        for callback in list(self._listeners):
+            callback(self)
+
+    def add_exporter(self, exporter):
+        """`exporter(record)` receives every record from now on, e.g. a JsonLinesExporter."""
+        self.exporters.append(exporter)
+
+    def add_listener(self, callback):
+        """`callback(telemetry)` is called after each new record, possibly from a worker thread."""
+        self._listeners.append(callback)
+
+    def records(self, kind=None):
+        """The buffered records, oldest first, optionally of one kind only."""
+        with self._lock:
+            records = list(self._records)
+        return [r for r in records if kind is None or r['kind'] == kind]
+
+    def summary(self):
+        """Per kind: count, errors, bytes and the median total, time to first byte, transfer and parse time."""
+        def median(values):
+            values = sorted(v for v in values if v is not None)
+            return values[len(values) // 2] if values else None
+        by_kind = {}
+        for record in self.records():
+            by_kind.setdefault(record['kind'], []).append(record)
+        return {
+            kind: {
+                'count': len(records), 'errors': sum(r['error'] is not None for r in records), 'bytes': sum(r['bytes'] for r in records),
+                'total': median(r['total'] for r in records), 'ttfb': median(r['ttfb'] for r in records),
+                'transfer': median(r['transfer'] for r in records), 'parse': median(r['parse'] for r in records)
+            }
+            for kind, records in by_kind.items()
+        }
+
+    def to_jsonl(self, path):
+        """Writes the buffered records to `path` as JSON lines; returns how many were written."""
+        records = self.records()
+        with open(path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        return len(records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+class JsonLinesExporter:
+    """Telemetry exporter that appends every record to a JSON lines file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line)
+
+def install(telemetry):
+    """Makes `telemetry` receive the records of every interaction (None stops recording). Returns the previous one."""
+    global _telemetry
+    previous, _telemetry = _telemetry, telemetry
+    return previous
+
+def get_telemetry():
+    return _telemetry
+
+@contextmanager
+def span(kind, name=None, url=None):
+    """
+    Measures one interaction. Requests and phases inside the block (on this thread,
+    or on pool threads started through `carry`) are added to it, and it is recorded
+    when the block exits. Inside another span it adds to the outer one instead, so a
+    download counts the metadata it needed. Yields the Span, or None when no
+    Telemetry is installed.
+    """
+    outer = _current.get()
+    if outer is not None or _telemetry is None:
+        yield outer
+        return
+    current = Span(kind, name, url)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as err:
+        current.error = f"{type(err).__name__}: {err}"
+        raise
+    finally:
+        _current.reset(token)
+        telemetry = _telemetry
+        if telemetry is not None:
+            telemetry.add(current.record())
+
+@contextmanager
+def phase(name):
+    """Adds the time spent in the block to the current span's `name` phase (e.g. 'parse')."""
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.add_phase(name, time.perf_counter() - start)
+
+def record_request(url, status, n_bytes, ttfb, transfer):
+    """Called by the HTTP layer for every response; requests outside any span are recorded on their own."""
+    current = _current.get()
+    if current is not None:
+        current.add_request(url, status, n_bytes, ttfb, transfer)
+    elif _telemetry is not None:
+        request = Span('request', url=url)
+        request.add_request(url, status, n_bytes, ttfb, transfer)
+        record = request.record()
+        record['total'] = (ttfb or 0.0) + transfer
+        _telemetry.add(record)
+
+def carry(func):
+    """Wraps `func` to run in a copy of the caller's context, so work it does on a pool thread counts toward the caller's span."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+def note_error(err):
+    """Marks the current span as failed when the error is handled instead of raised."""
+    current = _current.get()
+    if current is not None:
+        current.error = f"{type(err).__name__}: {err}"
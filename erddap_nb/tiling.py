@@ -0,0 +1,204 @@
+# erddap_nb/tiling.py
+
+import os
+import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import erddap_utils
+from . import sizing
+from . import telemetry
+from .jobs import DownloadCancelled
+
+DEFAULT_TILE_BYTES = 50 * 1024 * 1024
+
+def _chunks(values, size):
+    return [values[i:i + size] for i in range(0, len(values), max(1, size))]
+
+def _split_dimensions(e, metadata, split_space):
+    """The dimensions to split along: time first, then (optionally) latitude."""
+    dim_names = list(e.dim_names or [d['name'] for d in metadata.get('dimensions', [])])
+    time_dims = [d for d in dim_names if 'time' in d.lower()]
+    split = time_dims[:1] or dim_names[:1]
+    if split_space:
+        split += [d for d in dim_names if d.lower().startswith('lat') and d not in split][:1]
+    return split
+
+def plan_griddap_tiles(e, metadata, max_tile_bytes=DEFAULT_TILE_BYTES, split_space=False):
+    """
+    Splits the request held by an initialized griddap `ERDDAP` object into tiles whose
+    estimated size stays under `max_tile_bytes`. Returns a list of constraint dicts.
+
+    Tiles are cut along time (and latitude when `split_space` is set) on the axis
+    values reported by the server, so neighbouring tiles never overlap.
+    """
+    return _plan_tiles(e, metadata, max_tile_bytes, split_space)[0]
+
+def _plan_tiles(e, metadata, max_tile_bytes, split_space):
+    """plan_griddap_tiles, also returning the [(dimension, value chunks)] the tiles are cut from."""
+    constraints = dict(e.constraints)
+    split_dims = _split_dimensions(e, metadata, split_space)
+    counts = sizing.griddap_dimension_counts(metadata, constraints)
+    cell_bytes = sizing.bytes_per_cell(metadata, e.variables)
+
+    # Size of one slice along all split dimensions, i.e. the smallest possible tile.
+    slice_cells = 1
+    for name, count in counts.items():
+        if name not in split_dims:
+            slice_cells *= count or 1
+    slice_bytes = slice_cells * cell_bytes
+
+    axis_chunks = []
+    budget = max(1, max_tile_bytes // max(1, slice_bytes))
+    for name in split_dims:
+        values = erddap_utils.fetch_axis_values(
+            e.server, e.dataset_id, name, constraints[f'{name}>='], constraints[f'{name}<=']
+        )
+        step = int(constraints.get(f'{name}_step', 1) or 1)
+        values = values[::step]
+        # Spread the budget: the first split dimension takes what fits, the rest take the remainder.
+        per_tile = max(1, min(len(values), budget))
+        axis_chunks.append((name, _chunks(values, per_tile)))
+        budget = max(1, budget // per_tile)
+
+    tiles = []
+    for combo in itertools.product(*[chunks for _, chunks in axis_chunks]):
+        tile = dict(constraints)
+        for (name, _), values in zip(axis_chunks, combo):
+            tile[f'{name}>='] = values[0]
+            tile[f'{name}<='] = values[-1]
+        tiles.append(tile)
+    return tiles, axis_chunks
+
+def _fetch_tile(url, retries, backoff, cache, job=None):
+    for attempt in range(retries + 1):
+        try:
+            ds = erddap_utils.open_netcdf_bytes(erddap_utils.fetch_data_bytes(url, cache, job))
+            if job is not None:
+                job.part_done()
+            return ds
+        except DownloadCancelled:
+            raise
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+def fetch_griddap_tiled(e, metadata, max_tile_bytes=DEFAULT_TILE_BYTES, split_space=False,
+                        max_workers=4, retries=2, backoff=1.0, on_progress=None, cache=None, job=None):
+    """
+    Downloads the request held by an initialized griddap `ERDDAP` object as NetCDF
+    tiles fetched concurrently, and reassembles them into one xarray.Dataset.
+
+    Each tile is retried individually up to `retries` times. `on_progress(done, total)`
+    is called from the calling thread as tiles finish. Tiles are looked up in and
+    stored to `cache` (a ResponseCache) when one is given. Streamed bytes and finished
+    tiles are reported to `job` (a jobs.DownloadJob), and cancelling it stops all tiles.
+    """
+    import xarray as xr
+
+    tiles = plan_griddap_tiles(e, metadata, max_tile_bytes=max_tile_bytes, split_space=split_space)
+    urls = [e.get_download_url(response='nc', constraints=tile) for tile in tiles]
+    if job is not None:
+        job.parts_total = len(urls)
+
+    datasets, failed = [None] * len(urls), []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='erddap_nb_tile') as pool:
+        futures = {pool.submit(telemetry.carry(_fetch_tile), url, retries, backoff, cache, job): i for i, url in enumerate(urls)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                datasets[i] = future.result()
+            except Exception as err:
+                failed.append((urls[i], err))
+            if on_progress:
+                on_progress(done, len(urls))
+
+    if job is not None:
+        job.check()
+    if failed:
+        details = "\n".join(f"  {url}: {err}" for url, err in failed)
+        raise RuntimeError(f"{len(failed)} of {len(urls)} tiles failed after {retries} retries:\n{details}")
+    if len(datasets) == 1:
+        return datasets[0]
+    return xr.combine_by_coords(datasets, combine_attrs='override')
+
+def _zarr_template(first, sizes, chunks):
+    """
+    A dask-backed Dataset shaped like the full request, with `first` tile's variables,
+    attributes and encodings. Variables without a split dimension keep their values.
+    """
+    import dask.array as da
+    import xarray as xr
+
+    variables = {}
+    for name, var in first.variables.items():
+        if not set(var.dims) & set(chunks):
+            variables[name] = var
+            continue
+        shape = tuple(sizes.get(d, first.sizes[d]) for d in var.dims)
+        data = da.zeros(shape, dtype=var.dtype, chunks=tuple(chunks.get(d, first.sizes[d]) for d in var.dims))
+        encoding = {k: v for k, v in var.encoding.items() if k in ('units', 'calendar', 'dtype', '_FillValue', 'scale_factor', 'add_offset')}
+        variables[name] = xr.Variable(var.dims, data, attrs=var.attrs, encoding=encoding)
+    coords = [name for name in first.coords]
+    return xr.Dataset(variables, attrs=first.attrs).set_coords(coords)
+
+def fetch_griddap_zarr(e, metadata, path, max_tile_bytes=DEFAULT_TILE_BYTES, split_space=False,
+                       max_workers=4, retries=2, backoff=1.0, cache=None, job=None):
+    """
+    Downloads the request held by an initialized griddap `ERDDAP` object as NetCDF
+    tiles (see plan_griddap_tiles) and writes each one into its region of a chunked
+    Zarr store at `path`, so no more than `max_workers` tiles are ever in memory.
+    Returns the store opened lazily as a dask-backed xarray.Dataset.
+
+    The store is laid out from the first tile and the planned axis lengths; its
+    chunks follow the tiles along the split dimensions. Tiles are fetched
+    concurrently with retries and written in order. A failed or cancelled download
+    removes the partial store.
+    """
+    import shutil
+    import xarray as xr
+    from collections import deque
+
+    tiles, axis_chunks = _plan_tiles(e, metadata, max_tile_bytes, split_space)
+    urls = [e.get_download_url(response='nc', constraints=tile) for tile in tiles]
+    if job is not None:
+        job.parts_total = len(urls)
+    # Offset and length of every tile along each split dimension, in tile order.
+    regions = [
+        {name: slice(sum(len(c) for c in chunks[:index]), sum(len(c) for c in chunks[:index + 1]))
+         for (name, chunks), index in zip(axis_chunks, combo)}
+        for combo in itertools.product(*[range(len(chunks)) for _, chunks in axis_chunks])
+    ]
+    sizes = {name: sum(len(c) for c in chunks) for name, chunks in axis_chunks}
+    chunk_sizes = {name: len(chunks[0]) for name, chunks in axis_chunks}
+
+    tmp_path = f"{path}.partial"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='erddap_nb_tile') as pool:
+            remaining = iter(urls)
+            pending = deque(pool.submit(telemetry.carry(_fetch_tile), url, retries, backoff, cache, job) for url in itertools.islice(remaining, max_workers))
+            for region in regions:
+                ds = pending.popleft().result()
+                next_url = next(remaining, None)
+                if next_url is not None:
+                    pending.append(pool.submit(telemetry.carry(_fetch_tile), next_url, retries, backoff, cache, job))
+                for name, where in region.items():
+                    if ds.sizes.get(name, 1) != where.stop - where.start:
+                        raise ValueError(f"Tile has {ds.sizes.get(name)} {name} values, expected {where.stop - where.start}.")
+                if not os.path.exists(tmp_path):
+                    _zarr_template(ds, sizes, chunk_sizes).to_zarr(tmp_path, mode='w', compute=False, consolidated=False)
+                written = [name for name, var in ds.variables.items() if set(var.dims) & set(region)]
+                # Index coordinates are only written into a region once they are plain variables.
+                tile = ds[written].drop_vars([n for n in ds.coords if n not in written])
+                tile = tile.drop_indexes([n for n in tile.indexes])
+                tile.to_zarr(tmp_path, region={name: where for name, where in region.items() if name in ds.dims}, consolidated=False)
+                if job is not None:
+                    job.check()
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return xr.open_zarr(path, consolidated=False)
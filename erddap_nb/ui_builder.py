@@ -3,6 +3,7 @@
 import ipywidgets as widgets
 from functools import partial
 from . import event_handlers
+from .sizing import format_bytes
 
 def build_search_results(results, on_select_callback):
     """
@@ -18,6 +19,10 @@ def build_search_results(results, on_select_callback):
         institution = item.get("institution", "N/A")
         
         button_text = f"Title: {title} | ID: {did} | Institution: {institution}"
+        if item.get("server_name"):
+            # Federated results carry the server they were found on.
+            mirrors = item.get("mirrors", [])
+            button_text += f" | Server: {item['server_name']}" + (f" (+{len(mirrors)} mirrors)" if mirrors else "")
         
         button = widgets.Button(
             description=button_text,
@@ -26,11 +31,76 @@ def build_search_results(results, on_select_callback):
             button_style='info'
         )
         
-        button.on_click(partial(on_select_callback, did))
+        if item.get("server"):
+            button.on_click(partial(on_select_callback, did, server=item["server"]))
+        else:
+            button.on_click(partial(on_select_callback, did))
         buttons.append(button)
         
     return widgets.VBox(buttons, layout=widgets.Layout(align_items='flex-start'))
 
+def close_widgets(widget):
+    """Closes a widget and all of its descendants, freeing their front-end models."""
+    for child in getattr(widget, 'children', ()):
+        close_widgets(child)
+    widget.close()
+
+def build_federated_results(search, on_select_callback, max_results=50):
+    """
+    Shows the current state of a FederatedSearch: how many servers have answered or
+    failed (hover for the errors), then the best `max_results` merged results found so far.
+    """
+    from html import escape
+    results = search.results
+    n_servers, n_answered = len(search.servers), len(search.answered)
+    problems = []
+    if search.failed:
+        problems.append(f"{len(search.failed)} failed")
+    if search.done:
+        state = f"Searched {n_answered} of {n_servers} servers in {search.elapsed:.1f}s"
+        if search.pending:
+            problems.append(f"{len(search.pending)} did not answer in time")
+    else:
+        state = f"Searching... {n_answered} of {n_servers} servers answered"
+    if problems:
+        state += f" ({', '.join(problems)})"
+    errors = '\n'.join(f"{name}: {error}" for name, error in sorted(search.failed.items()))
+    shown = f", showing the top {max_results}" if len(results) > max_results else ""
+    status = widgets.HTML(f"<i title=\"{escape(errors)}\">{state}: {len(results)} datasets{shown}.</i>")
+    if not results and not search.done:
+        return widgets.VBox([status])
+    return widgets.VBox([status, build_search_results(results[:max_results], on_select_callback)])
+
+
+GRAPH_WIDGET_KEYS = ('plot_source', 'graph_type', 'x_axis', 'y_axis', 'color_var', 'palette', 'reverse_x', 'reverse_y')
+
+def plot_source_options(app_state):
+    """Options of the 'Plot from' dropdown: the ERDDAP server, then every saved entry."""
+    return [('ERDDAP server', None)] + [(f"Saved: {name}", name) for name in app_state.get('dataframes', {}).keys()]
+
+def refresh_plot_sources(w, app_state):
+    """Re-lists saved entries in the 'Plot from' dropdown, keeping the selection if it still exists."""
+    source = w['plot_source']
+    selected = source.value
+    options = plot_source_options(app_state)
+    source.options = options
+    source.value = selected if selected in [value for _, value in options] else None
+
+def add_graph_controls(w, graph_handler, constraint_widgets, output_area, app_state):
+    """
+    Creates the 'Plot from' selector, live-update checkbox and Cancel button of a graph
+    section and wires every graph and constraint widget to a debounced re-render while
+    live mode is on. Choosing a saved entry draws the graph locally (see plotting.py).
+    """
+    w['plot_source'] = widgets.Dropdown(description='Plot from:', options=plot_source_options(app_state))
+    app_state['on_dataframes_changed'] = partial(refresh_plot_sources, w, app_state)
+    w['live_graph_cb'] = widgets.Checkbox(value=False, description='Live update', indent=False, layout=widgets.Layout(width='110px'))
+    w['cancel_graph_button'] = widgets.Button(description="Cancel", layout=widgets.Layout(width='80px'))
+    w['cancel_graph_button'].on_click(partial(event_handlers.on_graph_cancel_clicked, w, output_area, app_state))
+    on_change = partial(event_handlers.on_graph_live_changed, graph_handler, w)
+    w['_live_graph_observer'] = on_change
+    for widget in [w[key] for key in GRAPH_WIDGET_KEYS] + list(constraint_widgets) + [w['live_graph_cb']]:
+        widget.observe(on_change, names='value')
 
 def build_griddap_ui(metadata, server, dataset_id, output_area, app_state, saved_dfs_placeholder):
     title = metadata.get('global_attrs', {}).get('title', 'No Title Provided')
@@ -142,22 +212,250 @@ def build_griddap_ui(metadata, server, dataset_id, output_area, app_state, saved
     download_button = widgets.Button(description="Download Data", button_style='primary')
     df_name_input = widgets.Text(placeholder='df_name', description='Save as:')
     w['df_name_input'] = df_name_input
-
-    update_graph_button.on_click(partial(event_handlers.on_griddap_graph_clicked, w, server, dataset_id, output_area))
+    w['tiled_cb'] = widgets.Checkbox(value=False, description='Tiled download (NetCDF)', indent=False, layout=widgets.Layout(width='190px'))
+    w['tile_mb'] = widgets.BoundedIntText(value=50, min=1, max=4096, description='Tile MB:', layout=widgets.Layout(width='150px'))
+    w['split_space_cb'] = widgets.Checkbox(value=False, description='Split latitude too', indent=False, layout=widgets.Layout(width='150px'))
+    w['zarr_cb'] = widgets.Checkbox(value=False, description='Out-of-core (Zarr + dask)', indent=False, layout=widgets.Layout(width='200px'))
+    w['to_file_cb'] = widgets.Checkbox(value=False, description='Download to file (no loading)', indent=False, layout=widgets.Layout(width='220px'))
+    w['preview_cb'] = widgets.Checkbox(value=False, description='Preview (strided)', indent=False, layout=widgets.Layout(width='140px'))
+    w['preview_points'] = widgets.BoundedIntText(value=1_000_000, min=1000, max=10**9, step=100_000, description='Max points:', layout=widgets.Layout(width='200px'))
+    w['refine_button'] = widgets.Button(description='Refine', tooltip='Download the last preview at full resolution', disabled=True)
+
+    graph_handler = partial(event_handlers.on_griddap_graph_clicked, w, server, dataset_id, output_area, metadata, app_state)
+    update_graph_button.on_click(graph_handler)
+    add_graph_controls(w, graph_handler, [cw for pair in w['constraint_widgets'].values() for cw in pair], output_area, app_state)
     download_button.on_click(partial(event_handlers.on_griddap_download_clicked, w, server, dataset_id, output_area, app_state, saved_dfs_placeholder))
+    w['refine_button'].on_click(partial(event_handlers.on_griddap_refine_clicked, w, output_area, app_state, saved_dfs_placeholder))
+
+    w['size_label'] = widgets.HTML()
+    update_size_estimate = partial(event_handlers.on_griddap_selection_changed, w, metadata, app_state)
+    for start_w, stop_w in w['constraint_widgets'].values():
+        start_w.observe(update_size_estimate, names='value')
+        stop_w.observe(update_size_estimate, names='value')
+    for cb in list(w['data_var_checkboxes'].values()) + [w['preview_cb'], w['preview_points']]:
+        cb.observe(update_size_estimate, names='value')
+    update_size_estimate()
     
     variables_section = widgets.VBox([widgets.HTML("<h3>Define Subset & Select Variables</h3>"), constraints_placeholder], layout=widgets.Layout(margin='10px 250px 10px 0'))
-    graphing_section = widgets.VBox([widgets.HTML("<h3>Create a Graph</h3>"), widgets.HBox([widgets.VBox([w['graph_type'], w['x_axis'], w['y_axis'], w['color_var'], w['palette'], w['reverse_x'], w['reverse_y'], update_graph_button], layout=widgets.Layout(width='100%', margin='15px 15px 50px 50px')), w['graph_display'] ])], layout=widgets.Layout(margin='10px 0 0 0'))
+    graphing_section = widgets.VBox([widgets.HTML("<h3>Create a Graph</h3>"), widgets.HBox([widgets.VBox([w['plot_source'], w['graph_type'], w['x_axis'], w['y_axis'], w['color_var'], w['palette'], w['reverse_x'], w['reverse_y'], widgets.HBox([update_graph_button, w['cancel_graph_button']]), w['live_graph_cb']], layout=widgets.Layout(width='100%', margin='15px 15px 50px 50px')), w['graph_display'] ])], layout=widgets.Layout(margin='10px 0 0 0'))
     
     download_section = widgets.VBox([
         widgets.HTML("<hr><h3>Download Data</h3>"),
-        widgets.HBox([df_name_input, download_button, w['filetype_dd']])
+        widgets.HBox([df_name_input, download_button, w['filetype_dd'], w['size_label']]),
+        widgets.HBox([w['tiled_cb'], w['tile_mb'], w['split_space_cb'], w['zarr_cb'], w['to_file_cb']]),
+        widgets.HBox([w['preview_cb'], w['preview_points'], w['refine_button']])
     ])
 
     return widgets.VBox([info_widget, widgets.HBox([variables_section, graphing_section]), download_section])
 
 
-def build_tabledap_ui(metadata, server, dataset_id, output_area, app_state, saved_dfs_placeholder):
+TABLEDAP_OPERATORS = ['=', '!=', '<=', '>=', '<', '>', '=~']
+VARIABLE_PAGE_SIZE = 50
+
+def build_tabledap_label(var_name, var_info):
+    """The name and units label shown for a tabledap variable."""
+    unit_str = ""
+    if "time" in var_name.lower():
+        unit_str = "(UTC)"
+    else:
+        units = var_info.get('units')
+        long_name = var_info.get('long_name')
+        if units and units != 1:
+            unit_str = f"({units})"
+
+    nu = f"{var_name} {unit_str}".strip()
+    label = widgets.HBox([
+        widgets.Label(value=nu, layout=widgets.Layout(width='200px')),
+    ])
+    return label
+
+def build_tabledap_filter(var_name, metadata, select_cb):
+    """
+    Creates the constraint controls of one tabledap variable. Returns the filter widget
+    and the variable's `constraint_widgets` entry ({'select': select_cb, ...}).
+    """
+    var_info = metadata['all_variables_map'].get(var_name, {})
+    range_str = str(var_info.get('actual_range', ''))
+    range_parts = [p.strip() for p in range_str.split(',')]
+    operator_options = TABLEDAP_OPERATORS
+    filter_widget = None
+
+    if "time" in var_name.lower() or (len(range_parts) == 2 and range_str.lower() != "n/a"):
+        is_time = "time" in var_name.lower()
+
+        op_start_dd = widgets.Dropdown(options=operator_options, value='>=', layout=widgets.Layout(width='55px'))
+        op_stop_dd = widgets.Dropdown(options=operator_options, value='<=', layout=widgets.Layout(width='55px'))
+
+        if is_time:
+            time_start = metadata.get('global_attrs', {}).get('time_coverage_start', '')
+            time_end = metadata.get('global_attrs', {}).get('time_coverage_end', '')
+            start_text = widgets.Text(value=time_start, layout=widgets.Layout(width='120px'))
+            stop_text = widgets.Text(value=time_end, layout=widgets.Layout(width='120px'))
+            slider = widgets.SelectionRangeSlider(options=[time_start, time_end], index=(0, 1), description='', layout=widgets.Layout(width='360px'), continuous_update=False, readout=False)
+        else:
+            try:
+                min_v, max_v = float(range_parts[0]), float(range_parts[1])
+                if min_v == max_v:
+                    filter_widget = widgets.Label(value="No range, no constraint controls available")
+                else:
+                    decimals = 4 if any(axis in var_name.lower() for axis in ['lat', 'lon']) else 2
+                    start_text = widgets.BoundedFloatText(value=round(min_v, decimals), min=min_v, max=max_v, step=10**-decimals, layout=widgets.Layout(width='120px'))
+                    stop_text = widgets.BoundedFloatText(value=round(max_v, decimals), min=min_v, max=max_v, step=10**-decimals, layout=widgets.Layout(width='120px'))
+                    slider = widgets.FloatRangeSlider(min=min_v, max=max_v, value=[min_v, max_v], step=10**-decimals, description="", continuous_update=False, layout=widgets.Layout(width='360px'), readout=False)
+            except (ValueError, IndexError):
+                filter_widget = widgets.Label(value="No range, no constraint controls available")
+
+        # If we successfully created the widgets, set up the logic
+        if filter_widget is None:
+            # --- Link Sliders and Text Boxes ---
+            def update_texts_from_slider(change, st=start_text, sp=stop_text):
+                st.value, sp.value = change['new'][0], change['new'][1]
+
+            def update_slider_from_texts_numeric(change, sl=slider, st=start_text, sp=stop_text):
+                sl.value = [st.value, sp.value]
+
+            if not is_time:
+                slider.observe(update_texts_from_slider, names='value')
+                start_text.observe(update_slider_from_texts_numeric, names='value')
+                stop_text.observe(update_slider_from_texts_numeric, names='value')
+            else:
+                # For SelectionRangeSlider, only link slider to text to avoid errors
+                # if user types a date not in the slider's options.
+                slider.observe(update_texts_from_slider, names='value')
+
+            # --- Logic for handling '=' operator ---
+            def on_op_change(change, osd=op_start_dd, ssd=op_stop_dd, st=start_text, sp=stop_text, sl=slider):
+                is_start_eq = (osd.value == '=')
+                is_stop_eq = (ssd.value == '=')
+
+                # If start is '=', disable stop controls and clear its value
+                ssd.disabled = is_start_eq
+                sp.disabled = is_start_eq
+
+                # If stop is '=', disable start controls and clear its value
+                osd.disabled = is_stop_eq
+                st.disabled = is_stop_eq
+
+                # Disable slider if either is '='
+                sl.disabled = is_start_eq or is_stop_eq
+
+            op_start_dd.observe(on_op_change, names='value')
+            op_stop_dd.observe(on_op_change, names='value')
+
+            filter_controls = widgets.HBox([op_start_dd, start_text, op_stop_dd, stop_text])
+            filter_widget = widgets.VBox([filter_controls, slider])
+            entry = {
+                'select': select_cb, 'start': start_text, 'stop': stop_text, 
+                'slider': slider, 'is_time': is_time, 'op_start': op_start_dd, 'op_stop': op_stop_dd
+            }
+        else:
+             entry = {'select': select_cb}
+
+    else: # This handles string-based inputs
+        filter_widget = widgets.Label(value="No range, no constraint controls available") if not range_str or range_str.lower() == "n/a" else None
+        if filter_widget:
+            entry = {'select': select_cb}
+        else:
+            op_dd = widgets.Dropdown(options=operator_options, value='=', layout=widgets.Layout(width='55px'))
+            val_txt = widgets.Text(layout=widgets.Layout(width='120px'))
+            filter_widget = widgets.HBox([op_dd, val_txt])
+            entry = {'select': select_cb, 'op': op_dd, 'val': val_txt}
+    return filter_widget, entry
+
+def observe_live_graph(w, widget_list):
+    """Attaches the live-graph observer (see add_graph_controls) to widgets created later."""
+    observer = w.get('_live_graph_observer')
+    if observer is not None:
+        for widget in widget_list:
+            widget.observe(observer, names='value')
+
+def build_variable_browser(w, metadata, page_size=VARIABLE_PAGE_SIZE):
+    """
+    Paged, searchable variable list for wide tabledap datasets. Only the rows of the
+    current page exist as widgets, and a variable's constraint controls are created
+    when it is selected or its Filter toggle is opened, so `w['constraint_widgets']`
+    only holds the variables that have been shown.
+    """
+    all_vars_map = metadata['all_variables_map']
+    names = list(all_vars_map.keys())
+    rows = {}
+    state = {'page': 0}
+
+    search_input = widgets.Text(placeholder='Filter variables by name', layout=widgets.Layout(width='220px'))
+    selected_only_cb = widgets.Checkbox(value=False, description='Selected only', indent=False, layout=widgets.Layout(width='120px'))
+    prev_button = widgets.Button(description="<<", layout=widgets.Layout(width='45px'))
+    next_button = widgets.Button(description=">>", layout=widgets.Layout(width='45px'))
+    page_label = widgets.Label()
+    rows_box = widgets.VBox()
+
+    def on_select_changed(toggle, change):
+        # Selecting a variable opens its filter controls.
+        if change['new']:
+            toggle.value = True
+
+    def on_toggle_changed(var_name, filter_slot, change):
+        entry = w['constraint_widgets'][var_name]
+        if change['new'] and not filter_slot.children:
+            filter_widget, entry = build_tabledap_filter(var_name, metadata, entry['select'])
+            w['constraint_widgets'][var_name] = entry
+            filter_slot.children = [filter_widget]
+            observe_live_graph(w, [cw for key, cw in entry.items() if key not in ('select', 'is_time', 'slider')])
+        filter_slot.layout.display = 'flex' if change['new'] else 'none'
+
+    def row_for(var_name):
+        if var_name not in rows:
+            select_cb = widgets.Checkbox(value=False, description='', indent=False, layout=widgets.Layout(width='30px'))
+            toggle = widgets.ToggleButton(value=False, description='Filter', layout=widgets.Layout(width='60px'))
+            filter_slot = widgets.HBox()
+            w['constraint_widgets'][var_name] = {'select': select_cb}
+            select_cb.observe(partial(on_select_changed, toggle), names='value')
+            toggle.observe(partial(on_toggle_changed, var_name, filter_slot), names='value')
+            observe_live_graph(w, [select_cb])
+            rows[var_name] = widgets.HBox([select_cb, build_tabledap_label(var_name, all_vars_map[var_name]), toggle, filter_slot])
+        return rows[var_name]
+
+    def matching():
+        query = search_input.value.strip().lower()
+        matches = []
+        for var_name in names:
+            entry = w['constraint_widgets'].get(var_name)
+            if selected_only_cb.value and not (entry and entry['select'].value):
+                continue
+            long_name = str(all_vars_map[var_name].get('long_name') or '').lower()
+            if query and query not in var_name.lower() and query not in long_name:
+                continue
+            matches.append(var_name)
+        return matches
+
+    def render(change=None):
+        matches = matching()
+        n_pages = max(1, -(-len(matches) // page_size))
+        state['page'] = min(state['page'], n_pages - 1)
+        start = state['page'] * page_size
+        page = matches[start:start + page_size]
+        rows_box.children = [row_for(var_name) for var_name in page]
+        page_label.value = f"{start + 1}-{start + len(page)} of {len(matches)} variables" if page else "No matching variables"
+        prev_button.disabled = state['page'] == 0
+        next_button.disabled = state['page'] >= n_pages - 1
+
+    def on_filter_changed(change):
+        state['page'] = 0
+        render()
+
+    def on_page_clicked(step, b):
+        state['page'] += step
+        render()
+
+    search_input.observe(on_filter_changed, names='value')
+    selected_only_cb.observe(on_filter_changed, names='value')
+    prev_button.on_click(partial(on_page_clicked, -1))
+    next_button.on_click(partial(on_page_clicked, 1))
+    render()
+
+    controls = widgets.HBox([search_input, selected_only_cb, prev_button, page_label, next_button])
+    return widgets.VBox([controls, widgets.HBox([widgets.HTML(value="<b>Variable</b>")]), rows_box])
+
+def build_tabledap_ui(metadata, server, dataset_id, output_area, app_state, saved_dfs_placeholder, page_size=VARIABLE_PAGE_SIZE):
     title = metadata.get('global_attrs', {}).get('title', 'No Title Provided')
     summary = metadata.get('global_attrs', {}).get('summary', 'No Summary Provided.')
     info_html = f"<h2>{title} ({dataset_id})</h2><p>{summary}</p>"
@@ -166,117 +464,19 @@ def build_tabledap_ui(metadata, server, dataset_id, output_area, app_state, save
     w = {}
     all_vars_map = metadata['all_variables_map']
     all_vars_names = list(all_vars_map.keys())
-    variable_rows = []
     w['constraint_widgets'] = {}
-    
-    operator_options = ['=', '!=', '<=', '>=', '<', '>', '=~']
 
-    for var_name in all_vars_names:
-        var_info = all_vars_map.get(var_name, {})
-        range_str = str(var_info.get('actual_range', ''))
-        range_parts = [p.strip() for p in range_str.split(',')]
-        select_cb = widgets.Checkbox(value=False, description='', indent=False, layout=widgets.Layout(width='30px'))
-        unit_str = ""
-        if "time" in var_name.lower():
-            unit_str = "(UTC)"
-        else:
-            units = var_info.get('units')
-            long_name = var_info.get('long_name')
-            if units and units != 1:
-                unit_str = f"({units})"
-
-        nu = f"{var_name} {unit_str}".strip()
-        label = widgets.HBox([
-            widgets.Label(value=nu, layout=widgets.Layout(width='200px')),
-        ])
-        filter_widget = None
-
-        if "time" in var_name.lower() or (len(range_parts) == 2 and range_str.lower() != "n/a"):
-            is_time = "time" in var_name.lower()
-            
-            op_start_dd = widgets.Dropdown(options=operator_options, value='>=', layout=widgets.Layout(width='55px'))
-            op_stop_dd = widgets.Dropdown(options=operator_options, value='<=', layout=widgets.Layout(width='55px'))
-            
-            if is_time:
-                time_start = metadata.get('global_attrs', {}).get('time_coverage_start', '')
-                time_end = metadata.get('global_attrs', {}).get('time_coverage_end', '')
-                start_text = widgets.Text(value=time_start, layout=widgets.Layout(width='120px'))
-                stop_text = widgets.Text(value=time_end, layout=widgets.Layout(width='120px'))
-                slider = widgets.SelectionRangeSlider(options=[time_start, time_end], index=(0, 1), description='', layout=widgets.Layout(width='360px'), continuous_update=False, readout=False)
-            else:
-                try:
-                    min_v, max_v = float(range_parts[0]), float(range_parts[1])
-                    if min_v == max_v:
-                        filter_widget = widgets.Label(value="No range, no constraint controls available")
-                    else:
-                        decimals = 4 if any(axis in var_name.lower() for axis in ['lat', 'lon']) else 2
-                        start_text = widgets.BoundedFloatText(value=round(min_v, decimals), min=min_v, max=max_v, step=10**-decimals, layout=widgets.Layout(width='120px'))
-                        stop_text = widgets.BoundedFloatText(value=round(max_v, decimals), min=min_v, max=max_v, step=10**-decimals, layout=widgets.Layout(width='120px'))
-                        slider = widgets.FloatRangeSlider(min=min_v, max=max_v, value=[min_v, max_v], step=10**-decimals, description="", continuous_update=False, layout=widgets.Layout(width='360px'), readout=False)
-                except (ValueError, IndexError):
-                    filter_widget = widgets.Label(value="No range, no constraint controls available")
-
-            # If we successfully created the widgets, set up the logic
-            if filter_widget is None:
-                # --- Link Sliders and Text Boxes ---
-                def update_texts_from_slider(change, st=start_text, sp=stop_text):
-                    st.value, sp.value = change['new'][0], change['new'][1]
-                
-                def update_slider_from_texts_numeric(change, sl=slider, st=start_text, sp=stop_text):
-                    sl.value = [st.value, sp.value]
-
-                if not is_time:
-                    slider.observe(update_texts_from_slider, names='value')
-                    start_text.observe(update_slider_from_texts_numeric, names='value')
-                    stop_text.observe(update_slider_from_texts_numeric, names='value')
-                else:
-                    # For SelectionRangeSlider, only link slider to text to avoid errors
-                    # if user types a date not in the slider's options.
-                    slider.observe(update_texts_from_slider, names='value')
-
-                # --- Logic for handling '=' operator ---
-                def on_op_change(change, osd=op_start_dd, ssd=op_stop_dd, st=start_text, sp=stop_text, sl=slider):
-                    is_start_eq = (osd.value == '=')
-                    is_stop_eq = (ssd.value == '=')
-
-                    # If start is '=', disable stop controls and clear its value
-                    ssd.disabled = is_start_eq
-                    sp.disabled = is_start_eq
-
-                    # If stop is '=', disable start controls and clear its value
-                    osd.disabled = is_stop_eq
-                    st.disabled = is_stop_eq
-                    
-                    # Disable slider if either is '='
-                    sl.disabled = is_start_eq or is_stop_eq
-
-                op_start_dd.observe(on_op_change, names='value')
-                op_stop_dd.observe(on_op_change, names='value')
-
-                filter_controls = widgets.HBox([op_start_dd, start_text, op_stop_dd, stop_text])
-                filter_widget = widgets.VBox([filter_controls, slider])
-                w['constraint_widgets'][var_name] = {
-                    'select': select_cb, 'start': start_text, 'stop': stop_text, 
-                    'slider': slider, 'is_time': is_time, 'op_start': op_start_dd, 'op_stop': op_stop_dd
-                }
-            else:
-                 w['constraint_widgets'][var_name] = {'select': select_cb}
-
-        else: # This handles string-based inputs
-            filter_widget = widgets.Label(value="No range, no constraint controls available") if not range_str or range_str.lower() == "n/a" else None
-            if filter_widget:
-                w['constraint_widgets'][var_name] = {'select': select_cb}
-            else:
-                op_dd = widgets.Dropdown(options=operator_options, value='=', layout=widgets.Layout(width='55px'))
-                val_txt = widgets.Text(layout=widgets.Layout(width='120px'))
-                filter_widget = widgets.HBox([op_dd, val_txt])
-                w['constraint_widgets'][var_name] = {'select': select_cb, 'op': op_dd, 'val': val_txt}
-        
-        row = widgets.HBox([select_cb, label, filter_widget])
-        variable_rows.append(row)
+    if len(all_vars_names) > page_size:
+        constraints_placeholder = build_variable_browser(w, metadata, page_size)
+    else:
+        variable_rows = []
+        for var_name in all_vars_names:
+            select_cb = widgets.Checkbox(value=False, description='', indent=False, layout=widgets.Layout(width='30px'))
+            filter_widget, w['constraint_widgets'][var_name] = build_tabledap_filter(var_name, metadata, select_cb)
+            variable_rows.append(widgets.HBox([select_cb, build_tabledap_label(var_name, all_vars_map.get(var_name, {})), filter_widget]))
+        header = widgets.HBox([widgets.HTML(value="<b>Variable</b>")])
+        constraints_placeholder = widgets.VBox([header] + variable_rows)
 
-    header = widgets.HBox([widgets.HTML(value="<b>Variable</b>")])
-    constraints_placeholder = widgets.VBox([header] + variable_rows)
     w.update({
         'graph_type': widgets.Dropdown(description="Graph Type:", options=['lines', 'markers', 'linesAndMarkers']), 'x_axis': widgets.Dropdown(description="X-Axis:", options=[None] + all_vars_names),
         'y_axis': widgets.Dropdown(description="Y-Axis:", options=[None] + all_vars_names), 'color_var': widgets.Dropdown(description="Color:", options=[None] + all_vars_names),
@@ -291,17 +491,29 @@ def build_tabledap_ui(metadata, server, dataset_id, output_area, app_state, save
     
     filetype_dd = widgets.Dropdown(options=[('CSV', 'csv'), ('NetCDF', 'nc'), ('JSON', 'json'), ('GeoTIFF', 'geotiff'), ('Parquet', 'parquet'), ('KML', 'kml')], value='csv', description='File Type:', layout=widgets.Layout(width='150px'))
     w['filetype_dd'] = filetype_dd
-
-    update_graph_button.on_click(partial(event_handlers.on_tabledap_graph_clicked, w, server, dataset_id, output_area, metadata))
+    w['partitioned_cb'] = widgets.Checkbox(value=False, description='Partitioned fetch to Parquet file', indent=False, layout=widgets.Layout(width='240px'))
+    w['window_days'] = widgets.BoundedIntText(value=30, min=1, max=3650, description='Window (days):', layout=widgets.Layout(width='180px'), style={'description_width': 'initial'})
+    w['sync_cb'] = widgets.Checkbox(value=False, description='Incremental sync (fetch only new rows)', indent=False, layout=widgets.Layout(width='280px'))
+    w['to_file_cb'] = widgets.Checkbox(value=False, description='Download to file (no loading)', indent=False, layout=widgets.Layout(width='220px'))
+
+    graph_handler = partial(event_handlers.on_tabledap_graph_clicked, w, server, dataset_id, output_area, metadata, app_state)
+    update_graph_button.on_click(graph_handler)
+    filter_widgets = [cw for c in w['constraint_widgets'].values() for key, cw in c.items() if key not in ('is_time', 'slider')]
+    add_graph_controls(w, graph_handler, filter_widgets, output_area, app_state)
     
     download_button.on_click(partial(event_handlers.on_tabledap_download_clicked, w, server, dataset_id, output_area, app_state, saved_dfs_placeholder))
 
+    w['size_label'] = widgets.HTML()
+    estimate_button = widgets.Button(description="Estimate Size")
+    estimate_button.on_click(partial(event_handlers.on_tabledap_estimate_clicked, w, server, dataset_id, output_area, app_state))
+
     variables_section = widgets.VBox([widgets.HTML("<h3>Columns & Filters</h3>"), constraints_placeholder], layout=widgets.Layout(margin='10px 250px 10px 0'))
-    graphing_section = widgets.VBox([widgets.HTML("<h3>Graph</h3>"), widgets.HBox([widgets.VBox([w['graph_type'], w['x_axis'], w['y_axis'], w['color_var'], w['palette'], w['reverse_x'], w['reverse_y'], update_graph_button], layout=widgets.Layout(width='100%', margin='15px 15px 50px 50px')), w['graph_display'] ])], layout=widgets.Layout(margin='10px 0 0 0'))
+    graphing_section = widgets.VBox([widgets.HTML("<h3>Graph</h3>"), widgets.HBox([widgets.VBox([w['plot_source'], w['graph_type'], w['x_axis'], w['y_axis'], w['color_var'], w['palette'], w['reverse_x'], w['reverse_y'], widgets.HBox([update_graph_button, w['cancel_graph_button']]), w['live_graph_cb']], layout=widgets.Layout(width='100%', margin='15px 15px 50px 50px')), w['graph_display'] ])], layout=widgets.Layout(margin='10px 0 0 0'))
     
     download_section = widgets.VBox([
         widgets.HTML("<hr><h3>Download Data</h3>"),
-        widgets.HBox([df_name_input, download_button, filetype_dd])
+        widgets.HBox([df_name_input, download_button, filetype_dd, estimate_button, w['size_label']]),
+        widgets.HBox([w['partitioned_cb'], w['window_days'], w['sync_cb'], w['to_file_cb']])
     ])
 
     return widgets.VBox([info_widget, widgets.HBox([variables_section, graphing_section]), download_section])
@@ -311,18 +523,37 @@ def update_saved_dfs_display(app_state, placeholder, output_area):
     """
     Updates the list of saved DataFrames visible in the UI, now with save and delete buttons.
     """
+    if app_state.get('on_dataframes_changed'):
+        app_state['on_dataframes_changed']()
     if not app_state.get('dataframes'):
         placeholder.children = []
         return
         
-    header = widgets.HTML("<h4>DataFrames in Memory:</h4>")
+    store = app_state['dataframes']
+    sizes = store.sizes() if hasattr(store, 'sizes') else {}
+    header_text = "DataFrames in Memory:"
+    if sizes:
+        in_memory = sum(s['memory'] for s in sizes.values())
+        spilled = sum(s['spilled'] for s in sizes.values())
+        budget = f" (budget {format_bytes(store.memory_budget)})" if store.memory_budget else ""
+        header_text += f" <small>{format_bytes(in_memory)} in memory{budget}, {format_bytes(spilled)} spilled to disk</small>"
+    header = widgets.HTML(f"<h4>{header_text}</h4>")
     
     items = []
-    for df_name in app_state['dataframes'].keys():
+    for df_name in store.keys():
         # A placeholder for this row's save UI
         save_options_placeholder = widgets.VBox()
         
-        df_label = widgets.Label(df_name, layout=widgets.Layout(flex='1 1 auto'))
+        size = sizes.get(df_name)
+        if size is None:
+            label_text = df_name
+        elif size['spilled']:
+            label_text = f"{df_name} (spilled, {format_bytes(size['spilled'])} on disk)"
+        elif size['memory']:
+            label_text = f"{df_name} ({format_bytes(size['memory'])} in memory)"
+        else:
+            label_text = f"{df_name} (on disk)"
+        df_label = widgets.Label(label_text, layout=widgets.Layout(flex='1 1 auto'))
         
         # Create a "Save to file..." button
         save_button = widgets.Button(
@@ -360,3 +591,111 @@ def update_saved_dfs_display(app_state, placeholder, output_area):
         items.append(item_row)
 
     placeholder.children = [widgets.VBox([header] + items, layout=widgets.Layout(border='1px solid #cccccc', padding='10px', width='auto'))]
+
+
+def describe_job(job):
+    """One-line status of a download job: bytes, throughput and ETA while it runs."""
+    if job.state == 'queued':
+        return "Queued"
+    received = format_bytes(job.bytes_received)
+    if job.state == 'failed':
+        return f"Failed: {job.error}"
+    if job.state == 'cancelled':
+        return f"Cancelled after {received}"
+    if job.state == 'done':
+        return f"Done: {received} in {job.elapsed:.1f} s"
+    parts = f"{job.parts_done}/{job.parts_total} parts, " if job.parts_total > 1 else ""
+    total = f" of {format_bytes(job.total_bytes)}" if job.total_bytes and job.parts_total <= 1 else ""
+    eta = f", ETA {job.eta:.0f} s" if job.eta is not None else ""
+    return f"{parts}{received}{total} at {format_bytes(job.rate)}/s{eta}"
+
+def build_job_row(job):
+    """A progress bar, status readout and Cancel button that follow one DownloadJob."""
+    bar = widgets.FloatProgress(value=0, min=0, max=1, layout=widgets.Layout(width='200px'))
+    status = widgets.Label()
+    cancel_button = widgets.Button(description="Cancel", layout=widgets.Layout(width='80px'))
+    cancel_button.on_click(lambda b: job.cancel())
+
+    def refresh(job):
+        fraction = job.fraction
+        bar.value = fraction if fraction is not None else 0
+        bar.bar_style = {'done': 'success', 'failed': 'danger', 'cancelled': 'warning'}.get(job.state, 'info')
+        status.value = describe_job(job)
+        cancel_button.disabled = not job.active
+    job.add_listener(refresh)
+    refresh(job)
+    return widgets.HBox([widgets.Label(job.name, layout=widgets.Layout(width='220px')), bar, cancel_button, status])
+
+def build_download_queue_panel(queue):
+    """A panel listing every job of a DownloadQueue; it updates itself as jobs come and go."""
+    panel = widgets.VBox(layout=widgets.Layout(border='1px solid #cccccc', padding='10px', width='auto'))
+    clear_button = widgets.Button(description="Clear finished", layout=widgets.Layout(width='auto'))
+    clear_button.on_click(lambda b: queue.clear_finished())
+    cancel_all_button = widgets.Button(description="Cancel all", button_style='danger', layout=widgets.Layout(width='auto'))
+    cancel_all_button.on_click(lambda b: queue.cancel_all())
+    rows = {}
+
+    def refresh(queue):
+        for job in queue.jobs:
+            if job not in rows:
+                rows[job] = build_job_row(job)
+        for job in [job for job in rows if job not in queue.jobs]:
+            del rows[job]
+        panel.children = [widgets.HBox([widgets.HTML("<h4>Downloads</h4>"), clear_button, cancel_all_button])] + [rows[job] for job in queue.jobs]
+        panel.layout.display = 'flex' if queue.jobs else 'none'
+    queue.add_listener(refresh)
+    refresh(queue)
+    return panel
+
+def _seconds(value):
+    return "-" if value is None else f"{value * 1000:.0f} ms" if value < 1 else f"{value:.2f} s"
+
+def describe_telemetry(telemetry, last=10):
+    """HTML tables of the per-kind medians and the most recent records of a Telemetry buffer."""
+    cell = "style='padding:2px 8px; text-align:right'"
+    rows = "".join(
+        f"<tr><td>{kind}</td><td {cell}>{s['count']}</td><td {cell}>{s['errors']}</td><td {cell}>{format_bytes(s['bytes'])}</td>"
+        f"<td {cell}>{_seconds(s['total'])}</td><td {cell}>{_seconds(s['ttfb'])}</td><td {cell}>{_seconds(s['transfer'])}</td><td {cell}>{_seconds(s['parse'])}</td></tr>"
+        for kind, s in telemetry.summary().items()
+    )
+    summary = ("<table><tr><th>Kind</th><th>Count</th><th>Errors</th><th>Bytes</th><th>Median total</th><th>TTFB</th>"
+               f"<th>Transfer</th><th>Parse</th></tr>{rows}</table>")
+    recent = "".join(
+        f"<tr><td>{r['kind']}</td><td>{r['name'] or ''}</td><td {cell}>{r['status'] or ''}</td><td {cell}>{format_bytes(r['bytes'])}</td>"
+        f"<td {cell}>{_seconds(r['total'])}</td><td {cell}>{_seconds(r['ttfb'])}</td><td {cell}>{_seconds(r['transfer'])}</td><td {cell}>{_seconds(r['parse'])}</td>"
+        f"<td>{'Failed: ' + r['error'] if r['error'] else ', '.join(f'{k} {_seconds(v)}' for k, v in r['phases'].items() if k != 'parse')}</td></tr>"
+        for r in reversed(telemetry.records()[-last:])
+    )
+    recent = ("<table><tr><th>Kind</th><th>Name</th><th>Status</th><th>Bytes</th><th>Total</th><th>TTFB</th><th>Transfer</th>"
+              f"<th>Parse</th><th>Other</th></tr>{recent}</table>")
+    return f"<b>By kind</b>{summary}<br><b>Latest</b>{recent}"
+
+def build_telemetry_panel(telemetry, export_path):
+    """A collapsible panel of request timings; 'Export' writes the buffer to `export_path` as JSON lines."""
+    toggle = widgets.ToggleButton(value=False, description="Request stats", icon='bar-chart', layout=widgets.Layout(width='auto'))
+    refresh_button = widgets.Button(description="Refresh", layout=widgets.Layout(width='auto'))
+    clear_button = widgets.Button(description="Clear", layout=widgets.Layout(width='auto'))
+    export_button = widgets.Button(description="Export JSON lines", layout=widgets.Layout(width='auto'))
+    status = widgets.Label()
+    table = widgets.HTML()
+    body = widgets.VBox([widgets.HBox([refresh_button, clear_button, export_button, status]), table])
+
+    def refresh(*args):
+        body.layout.display = 'flex' if toggle.value else 'none'
+        if toggle.value:
+            table.value = describe_telemetry(telemetry)
+
+    def export(b):
+        status.value = f"{telemetry.to_jsonl(export_path)} records written to {export_path}"
+
+    def clear(b):
+        telemetry.clear()
+        refresh()
+
+    toggle.observe(refresh, names='value')
+    refresh_button.on_click(refresh)
+    clear_button.on_click(clear)
+    export_button.on_click(export)
+    telemetry.add_listener(refresh)
+    refresh()
+    return widgets.VBox([toggle, body], layout=widgets.Layout(border='1px solid #cccccc', padding='10px', width='auto'))